@@ -1,26 +1,41 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 import uuid
 from datetime import datetime
 import json
+import asyncio
+import time
 
 from agents.llm_agent import get_llm_agent
+from services.history_manager import history_manager
+from services.interaction_log import interaction_logger
+from services.agent_executor import agent_executor
+from services.checkpointing import TurnConflict
+from services.coalescer import coalescer
+from services.admission import admission, AdmissionRejected
+from services.intent import classify_intent
+from services.job_manager import job_manager
+from services.response_cache import get_cached_answer
+from services.session_store import session_store
+from utils.circuit_breaker import circuit_breakers
+from utils.deadline import Cancelled, DeadlineExceeded, get_deadline
+from utils.metrics import chat_turn_seconds
+from utils.tracing import current_breakdown, current_trace, span, tracer
+from utils.startup import lazy_resource
 
 router = APIRouter()
 
 # Initialize agents lazily
-financial_agent_instance = None
 sql_agent_instance = None  
 web_agent_instance = None
 
+@lazy_resource("financial_agent")
 def get_financial_agent():
     """Get or create financial agent instance"""
-    global financial_agent_instance
-    if financial_agent_instance is None:
-        from agents.financial_agent import FinancialAgent
-        financial_agent_instance = FinancialAgent().initialize()
-    return financial_agent_instance
+    from agents.financial_agent import FinancialAgent
+    return FinancialAgent().initialize()
 
 def get_sql_agent():
     """Get or create SQL agent instance"""
@@ -43,6 +58,7 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="Session ID")
     agent_type: Optional[str] = Field(None, description="Force specific agent")
     stream: Optional[bool] = Field(False, description="Stream response")
+    turn_id: Optional[str] = Field(None, description="Client turn ID; retries with the same ID resume the turn")
 
 class ChatResponse(BaseModel):
     response: str = Field(..., description="Agent response")
@@ -51,70 +67,275 @@ class ChatResponse(BaseModel):
     timestamp: str = Field(..., description="Response timestamp")
     metadata: Optional[Dict[str, Any]] = Field(None, description="Response metadata")
 
-# Session storage (in production, use Redis or database)
-sessions = {}
+# Expired or evicted sessions release their conversation summaries too
+session_store.on_evict(history_manager.forget)
+# Several workers share the store: history follows turns recorded by any of them
+if session_store.shared:
+    history_manager.set_turn_loader(session_store.recent_turns)
+
+def route_turn(message: str, agent_type: Optional[str]):
+    """Pick the agent for a turn; returns (agent_name, route, route_source)"""
+    # Route query or use specified agent
+    with span("route", "stage") as current:
+        if agent_type:
+            agent_name = agent_type.lower()
+            route_source = "forced"
+        else:
+            from services.query_router import router as query_router
+            # A close call is settled by the router LLM in run_turn, once the turn is admitted
+            agent_name, _, route_source = query_router.classify(message, llm_fallback=False)
+        if current is not None:
+            current.attrs.update(route=agent_name, route_source=route_source)
+    route = agent_name
+    
+    # SQL and web agents are disabled; everything else goes to the LLM agent
+    if agent_name != "financial":
+        agent_name = "llm"
+    return agent_name, route, route_source
+
+def resolve_route(message: str, routed):
+    """Settle an ambiguous route with the router LLM (runs under the turn's admission slot)"""
+    from services.query_router import router as query_router
+    with span("route_llm", "stage") as current:
+        route, route_source = query_router.resolve(message, routed[1])
+        if current is not None:
+            current.attrs.update(route=route, route_source=route_source)
+    return ("financial" if route == "financial" else "llm"), route, route_source
+
+def answers_without_model(message: str, agent_name: str) -> bool:
+    """Canned small talk, or the remembered answer an agent serves while its model's circuit is open"""
+    if classify_intent(message).quick_response is not None:
+        return True
+    model = get_financial_agent().model if agent_name == "financial" else get_llm_agent().model_name
+    return circuit_breakers.is_open(model) and get_cached_answer(agent_name, message) is not None
+
+def run_turn(message: str, routed, session_id: str, turn_id: str):
+    """Invoke the routed agent for one turn (blocking; runs on the agent executor)"""
+    if routed[2] == "ambiguous":
+        routed = resolve_route(message, routed)
+    agent_name, route, route_source = routed
+    agent = get_financial_agent() if agent_name == "financial" else get_llm_agent()
+    
+    # Invoke agent (a retried turn resumes from its checkpoint)
+    history = history_manager.get_context(session_id, agent_name)
+    deadline = get_deadline()
+    try:
+        with span(agent_name, "agent", history_messages=len(history)):
+            result = agent.invoke(message, session_id=session_id, turn_id=turn_id, history=history)
+    except DeadlineExceeded:
+        if deadline is not None and deadline.cancelled:
+            raise Cancelled()
+        raise
+    # Coalesced callers of a cancelled job's turn run it again instead of sharing the cancellation
+    if deadline is not None and deadline.cancelled:
+        raise Cancelled()
+    return result, agent_name, route, route_source
+
+async def answer_turn(message: str, agent_type: Optional[str], session_id: str, turn_id: str):
+    """Route a turn, wait for the agent's admission slot, then run it"""
+    routed = await agent_executor.run(route_turn, message, agent_type)
+    # Turns answered without a model call skip the queue
+    cheap = await agent_executor.run(answers_without_model, message, routed[0])
+    async with admission.admit(routed[0], bypass=cheap):
+        return await agent_executor.run(run_turn, message, routed, session_id, turn_id)
+
+def answer_turn_sync(message: str, agent_type: Optional[str], session_id: str, turn_id: str):
+    """Blocking variant of answer_turn for background jobs"""
+    routed = route_turn(message, agent_type)
+    cheap = answers_without_model(message, routed[0])
+    with admission.admit_sync(routed[0], bypass=cheap):
+        return run_turn(message, routed, session_id, turn_id)
+
+def coalesce_key(message: str, agent_type: Optional[str], session_id: str):
+    """Identical queries coalesce unless the answer depends on the session's earlier turns"""
+    context = session_id if history_manager.has_history(session_id) else None
+    return coalescer.key(message, agent_type, context)
+
+def record_turn(message: str, session_id: str, turn_id: str, turn, coalesced: bool = False,
+                started: float = None):
+    """Record a finished turn in the session; returns the response and its interaction log entry"""
+    result, agent_name, route, route_source = turn
+    elapsed = time.perf_counter() - started if started is not None else None
+    if elapsed is not None:
+        chat_turn_seconds.observe(elapsed, agent=agent_name, coalesced=str(coalesced).lower())
+    
+    # Update session
+    history_manager.add_turn(session_id, message, result["response"])
+    session_store.add_turn(session_id, message, result["response"], agent_name)
+    
+    metadata = {**(result.get("metadata") or {}), "turn_id": turn_id}
+    if coalesced:
+        metadata["coalesced"] = True
+    trace = current_trace()
+    if trace is not None:
+        trace.root.attrs.update(agent=agent_name, coalesced=coalesced)
+        metadata["trace"] = trace.summary()
+    response = ChatResponse(
+        response=result["response"],
+        session_id=session_id,
+        agent_used=agent_name,
+        timestamp=datetime.now().isoformat(),
+        metadata=metadata
+    )
+    
+    breakdown = current_breakdown()
+    log_entry = {
+        "session_id": session_id,
+        "turn_id": turn_id,
+        "timestamp": response.timestamp,
+        "query": message,
+        "agent": result.get("agent") or agent_name,
+        "route": route,
+        "route_source": route_source,
+        "response_length": len(result.get("response", "")),
+        "coalesced": coalesced,
+        "quick_response": classify_intent(message).quick_response is not None,
+        "traced": trace is not None,
+        "latency_ms": {
+            "total": round(elapsed * 1000, 1) if elapsed is not None else None,
+            **{key[:-3]: value for key, value in breakdown.items() if key.endswith("_ms")}
+        },
+        "tokens": {
+            "prompt": breakdown.get("prompt_tokens", 0),
+            "completion": breakdown.get("completion_tokens", 0)
+        },
+        "llm_calls": breakdown.get("llm_calls", 0)
+    }
+    return response, log_entry
+
+def run_chat_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler for POST /start (runs on the job worker pool)"""
+    message, agent_type = payload["message"], payload.get("agent_type")
+    session_id, turn_id = payload["session_id"], payload["turn_id"]
+    started = time.perf_counter()
+    with tracer.trace(turn_id):
+        turn, coalesced = coalescer.run(
+            coalesce_key(message, agent_type, session_id), answer_turn_sync, message, agent_type, session_id, turn_id
+        )
+        response, log_entry = record_turn(message, session_id, turn_id, turn, coalesced, started)
+    interaction_logger.log(log_entry)
+    return response.model_dump()
+
+job_manager.register("chat", run_chat_job)
 
 @router.post("/", response_model=ChatResponse)
 async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
     """Chat with the multi-agent system"""
+    started = time.perf_counter()
     try:
-        # Route query or use specified agent
-        if request.agent_type:
-            agent_name = request.agent_type.lower()
-        else:
-            from services.chat_service import route_query
-            agent_name = route_query(request.message)
-        
-        # Select agent
-        if agent_name == "financial":
-            agent = get_financial_agent()
-        # elif agent_name == "sql":
-        #     agent = get_sql_agent()
-        # elif agent_name == "web":
-        #     agent = get_web_agent()
-        else:
-            # Default to financial
-            agent = get_llm_agent()     
-            agent_name = "llm"
-        
-        
-        # Create or get session
-        if not request.session_id or request.session_id not in sessions:
-            session_id = str(uuid.uuid4())
-            sessions[session_id] = {
-                "history": [],
-                "created_at": datetime.now().isoformat(),
-                "agent_counts": {"financial": 0, "llm": 0, "simple": 0}  
-            }
-        else:
-            session_id = request.session_id
-        
-        # Invoke agent
-        result = agent.invoke(request.message)
+        # Session and history lookups hit SQLite, so they run off the event loop too
+        session_id = await asyncio.to_thread(session_store.get_or_create, request.session_id)
         
-        # Update session
-        sessions[session_id]["history"].append({
-            "query": request.message,
-            "response": result["response"],
-            "agent": agent_name,
-            "timestamp": datetime.now().isoformat()
-        })
-        sessions[session_id]["agent_counts"][agent_name] += 1
+        # Agent work is blocking, keep it off the event loop; identical
+        # concurrent queries share one run, which waits for an agent slot
+        turn_id = request.turn_id or str(uuid.uuid4())
+        with tracer.trace(turn_id):
+            key = await asyncio.to_thread(coalesce_key, request.message, request.agent_type, session_id)
+            turn, coalesced = await coalescer.run_async(
+                key,
+                lambda: answer_turn(request.message, request.agent_type, session_id, turn_id)
+            )
+            response, log_entry = await agent_executor.run(
+                record_turn, request.message, session_id, turn_id, turn, coalesced, started
+            )
         
-        # Log interaction in background
-        background_tasks.add_task(log_interaction, session_id, request.message, result)
-        
-        return ChatResponse(
-            response=result["response"],
-            session_id=session_id,
-            agent_used=agent_name,
-            timestamp=datetime.now().isoformat(),
-            metadata=result.get("metadata")
-        )
+        # Buffered; written in batches by the logger thread
+        interaction_logger.log(log_entry)
+        return response
         
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)})
+    except TurnConflict as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+@router.post("/stream/")
+async def stream_chat(request: ChatRequest, background_tasks: BackgroundTasks):
+    """
+    Chat with NDJSON streaming: an "admitted" event, "start"/"token" events
+    while the answer is generated, then a "done" event with the ChatResponse.
+    Identical concurrent queries share one run and its token stream.
+    """
+    started = time.perf_counter()
+    session_id = await asyncio.to_thread(session_store.get_or_create, request.session_id)
+    turn_id = request.turn_id or str(uuid.uuid4())
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: Dict[str, Any]):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    async def run():
+        with tracer.trace(turn_id):
+            key = await asyncio.to_thread(coalesce_key, request.message, request.agent_type, session_id)
+            turn, coalesced = await coalescer.run_async(
+                key,
+                lambda: answer_turn(request.message, request.agent_type, session_id, turn_id),
+                on_event=on_event
+            )
+            response, log_entry = await agent_executor.run(
+                record_turn, request.message, session_id, turn_id, turn, coalesced, started
+            )
+        interaction_logger.log(log_entry)
+        return response
+
+    task = asyncio.create_task(run())
+    # Queued after every token event, so "done" is always last
+    task.add_done_callback(lambda _: loop.call_soon_threadsafe(events.put_nowait, None))
+
+    # Hold the response until the run is admitted, so rejections get a real 429/503
+    first = await events.get()
+    if first is None and not task.cancelled() and isinstance(task.exception(), AdmissionRejected):
+        e = task.exception()
+        raise HTTPException(status_code=e.status_code, detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)})
+
+    async def body():
+        event = first
+        while event is not None:
+            yield json.dumps(event) + "\n"
+            event = await events.get()
+        try:
+            response = task.result()
+            yield json.dumps({"type": "done", **response.model_dump()}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "error": f"Chat error: {str(e)}"}) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson", background=background_tasks)
+
+@router.post("/start")
+async def start_chat(request: ChatRequest):
+    """Start a chat turn as a background job; poll /tasks/{task_id} for the result"""
+    session_id = await asyncio.to_thread(session_store.get_or_create, request.session_id)
+    turn_id = request.turn_id or str(uuid.uuid4())
+    task_id = await asyncio.to_thread(job_manager.submit, "chat", {
+        "message": request.message,
+        "agent_type": request.agent_type,
+        "session_id": session_id,
+        "turn_id": turn_id
+    })
+    return {"task_id": task_id, "status": "queued", "session_id": session_id, "turn_id": turn_id}
+
+@router.get("/tasks/{task_id}")
+async def get_task(task_id: str):
+    """Job status, per-node progress events and, once completed, the chat response"""
+    job = await asyncio.to_thread(job_manager.get, task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return job
+
+@router.post("/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str):
+    """Cancel a queued or running job; a running graph stops at its next node or LLM token"""
+    job = await asyncio.to_thread(job_manager.get, task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not await asyncio.to_thread(job_manager.cancel, task_id):
+        raise HTTPException(status_code=409, detail=f"Task already {job['status']}")
+    return {"task_id": task_id, "status": "cancelled"}
+
 @router.post("/direct/{agent_type}")
 async def direct_chat(agent_type: str, request: ChatRequest):
     """Chat directly with a specific agent"""
@@ -125,41 +346,42 @@ async def direct_chat(agent_type: str, request: ChatRequest):
     return await chat(request, BackgroundTasks())
 
 @router.get("/sessions/{session_id}")
-async def get_session(session_id: str):
-    """Get session history"""
-    if session_id not in sessions:
+async def get_session(session_id: str, offset: int = Query(0, ge=0),
+                      limit: Optional[int] = Query(None, ge=1, le=500)):
+    """Get one page of session history (oldest first)"""
+    session = await agent_executor.run(session_store.get, session_id, offset, limit)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@router.get("/sessions/{session_id}/turns/{turn_id}")
+async def get_turn(session_id: str, turn_id: str):
+    """Get checkpoint status of a turn"""
+    status = await agent_executor.run(lambda: get_financial_agent().get_turn_status(session_id, turn_id))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Turn not found")
+    return status
+
+@router.post("/sessions/{session_id}/turns/{turn_id}/resume", response_model=ChatResponse)
+async def resume_turn(session_id: str, turn_id: str):
+    """Resume an interrupted turn from its last completed node"""
+    result = await agent_executor.run(lambda: get_financial_agent().resume(session_id, turn_id))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Turn not found")
     
-    return {
-        "session_id": session_id,
-        "history": sessions[session_id]["history"],
-        "agent_counts": sessions[session_id]["agent_counts"],
-        "created_at": sessions[session_id]["created_at"]
-    }
+    return ChatResponse(
+        response=result["response"],
+        session_id=session_id,
+        agent_used="financial",
+        timestamp=datetime.now().isoformat(),
+        metadata={**(result.get("metadata") or {}), "turn_id": turn_id}
+    )
 
 @router.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     """Delete a session"""
-    if session_id in sessions:
-        del sessions[session_id]
+    if await asyncio.to_thread(session_store.delete, session_id):
+        await asyncio.to_thread(history_manager.forget, session_id)
         return {"status": "deleted", "session_id": session_id}
     else:
         raise HTTPException(status_code=404, detail="Session not found")
-
-def log_interaction(session_id: str, query: str, result: Dict[str, Any]):
-    """Log interaction to file (background task)"""
-    import os
-    os.makedirs("logs", exist_ok=True)
-    
-    log_entry = {
-        "session_id": session_id,
-        "timestamp": datetime.now().isoformat(),
-        "query": query,
-        "agent": result.get("agent"),
-        "response_length": len(result.get("response", ""))
-    }
-    
-    log_file = f"logs/chat_{datetime.now().strftime('%Y%m%d')}.jsonl"
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(json.dumps(log_entry) + "\n")
-
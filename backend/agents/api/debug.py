@@ -0,0 +1,33 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from services.agent_executor import agent_executor
+from utils.debug_artifacts import debug_recorder
+from utils.tracing import tracer
+
+router = APIRouter()
+
+@router.get("/traces")
+async def list_traces(limit: int = Query(20, ge=1, le=500)):
+    """Summaries of the most recent traced requests"""
+    return {
+        "tracer": tracer.stats(),
+        "traces": [trace.summary() for trace in tracer.recent(limit)]
+    }
+
+@router.get("/traces/{request_id}")
+async def get_trace(request_id: str):
+    """Span tree of a traced request (request_id is the chat turn_id)"""
+    trace = tracer.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (not sampled or already evicted)")
+    return trace.to_dict()
+
+@router.get("/artifacts/{request_id}")
+async def get_artifacts(request_id: str):
+    """Debug artifacts (retrieved documents, answers) recorded for a request"""
+    if not debug_recorder.enabled:
+        raise HTTPException(status_code=404, detail="Debug artifacts are disabled (set DEBUG_ARTIFACTS=true)")
+    artifacts = await agent_executor.run(debug_recorder.get, request_id)
+    if artifacts is None:
+        raise HTTPException(status_code=404, detail="No artifacts for this request (not sampled or pruned)")
+    return {"request_id": request_id, "artifacts": artifacts}
@@ -1,13 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import Any, Dict
 from langchain_core.messages import HumanMessage
-from langchain_ollama import ChatOllama
+
+from utils.model_registry import chat_model
 
 class BaseAgent(ABC):
     """Base class for all agents"""
     
-    def __init__(self, model: str = "qwen3", base_url: str = "http://localhost:11434"):
-        self.llm = ChatOllama(model=model, base_url=base_url)
+    def __init__(self, model: str = None, base_url: str = None):
+        self.llm = chat_model(model, base_url)
         self.agent = None
         
     @abstractmethod
@@ -1,17 +1,23 @@
 # File: backend/agents/financial_agent.py
-import asyncio
-import concurrent.futures
 from typing import Any, Dict, List, Optional
 import functools
+import uuid
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_ollama import ChatOllama
 from pydantic import BaseModel
 
+from utils.circuit_breaker import CircuitOpen, circuit_breakers
+from utils.config import settings
+from utils.deadline import DeadlineExceeded, deadline_scope, get_deadline
+from utils.llm_calls import call_llm
+from utils.model_registry import chat_model
+from services.checkpointing import TurnConflict
+from services.intent import classify_intent
+from services.response_cache import get_cached_answer, get_fallback_answer, remember_answer
+
 # Constants
-LLM_MODEL = "qwen3"
-BASE_URL = "http://localhost:11434"
-TIMEOUT_SECONDS = 30
+LLM_MODEL = settings.OLLAMA_MODEL
+TIMEOUT_SECONDS = settings.REQUEST_TIMEOUT_SECONDS
 
 # Pydantic models for structured outputs
 class AgentResponse(BaseModel):
@@ -27,97 +33,55 @@ class SimpleQueryDetector(BaseModel):
     suggested_response: Optional[str] = None
 
 def timeout(seconds=TIMEOUT_SECONDS):
-    """Timeout decorator using asyncio"""
+    """
+    Run the function under a request deadline.
+    
+    The function runs in the caller's thread; graph nodes and LLM calls read
+    the deadline, skip work they cannot afford and cancel in-flight calls on
+    expiry, so nothing keeps running after the timeout is raised. Under an
+    enclosing deadline (a background job's JOB_TIMEOUT_SECONDS) that
+    deadline's remaining time is the limit instead of `seconds`.
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                    future = executor.submit(func, *args, **kwargs)
-                    return future.result(timeout=seconds)
-            except concurrent.futures.TimeoutError:
-                raise TimeoutError(f"Function {func.__name__} timed out after {seconds} seconds")
-            except Exception as e:
-                raise e
+            outer = get_deadline()
+            with deadline_scope(outer.remaining() if outer is not None else seconds):
+                return func(*args, **kwargs)
         return wrapper
     return decorator
 
 class FinancialAgent:
     """Financial document analysis agent with minimal and full RAG modes"""
     
-    def __init__(self, model: str = LLM_MODEL, base_url: str = BASE_URL, use_minimal: bool = True):
-        self.llm = ChatOllama(model=model, base_url=base_url, temperature=0.1)
+    def __init__(self, model: str = LLM_MODEL, base_url: str = None, use_minimal: bool = True):
+        self.llm = chat_model(model, base_url, temperature=0.1)
+        self.model = model
         self.use_minimal = use_minimal
         self.rag_agent = None
-        self.llm_structured = self.llm.with_structured_output(SimpleQueryDetector)
-        
-        # Simple responses cache
-        self.simple_responses = {
-            "hi": "Hello! 👋 I'm your financial AI assistant. How can I help with financial analysis today?",
-            "hello": "Hi there! 😊 I specialize in analyzing financial documents. What would you like to know?",
-            "how are you": "I'm doing great! Ready to dive into some financial analysis. What can I help you with?",
-            "bye": "Goodbye! 👋 Feel free to come back if you have any financial questions.",
-            "thank you": "You're welcome! 😊 Let me know if you need anything else.",
-            "what can you do": "I can help with: 📊 Financial document analysis, 💰 Revenue/profit queries, 📈 Quarterly/annual reports, 🗂️ Document search and retrieval.",
-            "help": "I'm here to analyze financial documents! You can ask me about: revenue, profits, financial reports, or upload documents for analysis."
-        }
     
     def initialize(self):
         """Initialize the full RAG agent if needed"""
         if not self.use_minimal:
-            from services.chat_service import create_self_rag
-            self.rag_agent = create_self_rag()
+            self._get_rag_agent()
         return self
     
+    def _get_rag_agent(self):
+        """The RAG graph, built on first use (minimal mode still serves checkpointed turns)"""
+        if not self.rag_agent:
+            from services.chat_service import create_self_rag
+            from services.checkpointing import get_checkpointer
+            self.rag_agent = create_self_rag(checkpointer=get_checkpointer())
+        return self.rag_agent
+    
     def _is_simple_query(self, query: str) -> tuple[bool, Optional[str]]:
-        """Check if query is simple/conversational"""
-        query_lower = query.lower().strip()
-        
-        # Direct match for simple phrases
-        for key, response in self.simple_responses.items():
-            if key in query_lower and query_lower.split()[0] == key:
-                return True, response
-        
-        # Check with LLM for ambiguous cases
-        try:
-            detector = self.llm_structured.invoke(
-                f"Query: '{query}'\n\n"
-                "Is this a simple greeting/conversational query or a serious financial query? "
-                "Simple queries: greetings, thanks, casual conversation, vague questions. "
-                "Financial queries: specific questions about revenue, profit, documents, analysis."
-            )
-            
-            if detector.is_simple:
-                # Use LLM-suggested response or default
-                return True, detector.suggested_response or "I'm here to help with financial analysis! Could you please be more specific about what financial information you're looking for?"
-        except:
-            pass
-        
-        # Check for vague queries
-        vague_patterns = [
-            "tell me something",
-            "what's in your",
-            "show me your",
-            "your document",
-            "any document",
-            "something about",
-            "anything interesting"
-        ]
-        
-        if any(pattern in query_lower for pattern in vague_patterns):
-            return True, "I'd love to help! Could you please specify what financial information you're looking for? For example: 'What's the revenue for Q4?' or 'Show me profit margins for last year'."
-        
-        # Check length
-        if len(query.split()) <= 2 and not any(word in query_lower for word in 
-                                              ['revenue', 'profit', 'financial', 'document', 'report']):
-            return True, f"I'm here for financial analysis! Did you have a specific financial question about '{query}'?"
-        
+        """Check if query is simple/conversational (keyword automaton, no LLM call)"""
+        intent = classify_intent(query)
+        if intent.quick_response:
+            return True, intent.quick_response
         return False, None
     
-    def _get_minimal_response(self, query: str) -> Dict[str, Any]:
+    def _get_minimal_response(self, query: str, history: List = None) -> Dict[str, Any]:
         """Get response from minimal mode (no RAG)"""
         is_simple, simple_response = self._is_simple_query(query)
         
@@ -146,13 +110,11 @@ class FinancialAgent:
         - You cannot access specific documents until they are uploaded
         - You can explain financial concepts in general terms"""
         
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=query)
-        ]
+        messages = [SystemMessage(content=system_prompt)] + (history or []) + [HumanMessage(content=query)]
         
         try:
-            response = self.llm.invoke(messages)
+            # Streamed to the request's token sink, if it is being streamed
+            response = call_llm(self.llm, messages, stage="financial_minimal", publish=True)
             return {
                 "response": response.content,
                 "agent": "financial",
@@ -163,6 +125,11 @@ class FinancialAgent:
                     "llm_used": True
                 }
             }
+        except DeadlineExceeded:
+            # Expired or cancelled (a job): invoke returns the partial result
+            raise
+        except CircuitOpen as e:
+            return self._get_degraded_response(query, e)
         except Exception as e:
             return {
                 "response": "I'm having trouble processing your request. Please try again or use a simpler query.",
@@ -172,11 +139,9 @@ class FinancialAgent:
             }
     
     @timeout(TIMEOUT_SECONDS)
-    def _get_rag_response(self, query: str) -> Dict[str, Any]:
+    def _get_rag_response(self, query: str, session_id: str = None, turn_id: str = None,
+                          history: List = None) -> Dict[str, Any]:
         """Get response from full RAG mode"""
-        if not self.rag_agent:
-            self.initialize()
-        
         # Check if simple query first
         is_simple, simple_response = self._is_simple_query(query)
         if is_simple and simple_response:
@@ -191,6 +156,11 @@ class FinancialAgent:
                 }
             }
         
+        # While the answer model's circuit is open, a remembered answer needs no retrieval either
+        if circuit_breakers.is_open(self.model) and get_cached_answer("financial", query):
+            retry_after = circuit_breakers.get(self.model).stats()["retry_in_s"]
+            return self._get_degraded_response(query, CircuitOpen(self.model, retry_after))
+        
         # Prepare state for RAG agent
         from services.chat_service import AgentState
         from langgraph.graph import StateGraph
@@ -198,14 +168,19 @@ class FinancialAgent:
         # Initialize with transform count to prevent infinite loops
         state = {
             "messages": [HumanMessage(content=query)],
+            "history": history or [],
             "retrieved_docs": "",
             "rewritten_queries": [],
             "transform_count": 0,
             "max_transforms": 3
         }
         
+        from services.checkpointing import run_turn, turn_config
+        
         try:
-            result = self.rag_agent.invoke(state)
+            # Retried turns (same session/turn id) resume from their last completed node
+            config = turn_config(session_id or "anonymous", turn_id or str(uuid.uuid4()))
+            result, resumed_from = run_turn(self._get_rag_agent(), state, config)
             
             # Extract response from messages
             if result.get("messages") and len(result["messages"]) > 0:
@@ -224,36 +199,46 @@ class FinancialAgent:
                     "mode": "rag",
                     "has_documents": bool(result.get("retrieved_docs")),
                     "queries_generated": len(result.get("rewritten_queries", [])),
-                    "transform_count": result.get("transform_count", 0)
+                    "transform_count": result.get("transform_count", 0),
+                    "resumed_from": resumed_from
                 }
             }
             
+        except (DeadlineExceeded, TurnConflict):
+            # Not a RAG failure: the minimal-mode fallback would answer something else
+            raise
         except Exception as e:
-            # Fallback to minimal mode on RAG error
             print(f"[RAG Error] {e}")
-            return self._get_minimal_response(query)
+            # A second LLM call would only add load to a model that is failing
+            if isinstance(e, CircuitOpen) or circuit_breakers.is_open(self.model):
+                # Documents retrieved before the failure are still worth showing
+                return self._get_degraded_response(query, e, get_deadline().progress)
+            # Fallback to minimal mode on RAG error
+            return self._get_minimal_response(query, history)
     
     def invoke(self, query: str, **kwargs) -> Dict[str, Any]:
-        """Main invoke method with automatic fallback"""
+        """Main invoke method with automatic fallback (rag=True forces the RAG path)"""
         try:
-            if self.use_minimal:
-                return self._get_minimal_response(query)
+            if self.use_minimal and not kwargs.get("rag"):
+                result = self._get_minimal_response(query, kwargs.get("history"))
             else:
-                return self._get_rag_response(query)
+                result = self._get_rag_response(
+                    query, session_id=kwargs.get("session_id"), turn_id=kwargs.get("turn_id"),
+                    history=kwargs.get("history")
+                )
+            metadata = result.get("metadata", {})
+            # Standalone answers are kept to serve while the models are unavailable
+            if (not kwargs.get("history") and not result.get("error") and not metadata.get("degraded")
+                    and not metadata.get("simple_response")):
+                remember_answer("financial", query, result["response"])
+            return result
                 
+        except TurnConflict:
+            raise
         except TimeoutError as e:
-            # Fallback to minimal mode on timeout
-            print(f"[Timeout] Switching to minimal mode: {e}")
-            return {
-                "response": "The analysis is taking too long. Here's a quick answer instead:\n\n" + 
-                           self._get_minimal_response(query)["response"],
-                "agent": "financial",
-                "error": str(e),
-                "metadata": {
-                    "timeout": True,
-                    "fallback_to_minimal": True
-                }
-            }
+            # Return the best intermediate result instead of starting new model work
+            print(f"[Timeout] Returning partial result: {e}")
+            return self._get_partial_response(query, e)
         except Exception as e:
             return {
                 "response": f"An error occurred: {str(e)[:100]}...",
@@ -262,14 +247,129 @@ class FinancialAgent:
                 "metadata": {"error": True}
             }
     
+    def _get_partial_response(self, query: str, error: TimeoutError) -> Dict[str, Any]:
+        """Build a response from checkpointed graph state after a timeout (no LLM call)"""
+        progress = getattr(error, "progress", {})
+        # Minimal mode runs outside the graph: its partial answer is on the error
+        partial_answer = (progress.get("generate_partial") or getattr(error, "partial", "")).strip()
+        documents = progress.get("graded_docs") or progress.get("retrieved_docs", "")
+        
+        if partial_answer:
+            response = partial_answer + "\n\n_(Answer truncated: the time limit was reached.)_"
+            partial_type = "partial_generation"
+        elif documents:
+            response = ("The analysis is taking too long. Here are the most relevant excerpts found so far:\n\n"
+                        + self._format_excerpts(documents))
+            partial_type = "retrieved_excerpts"
+        else:
+            response = ("The analysis is taking too long and nothing relevant was found in time. "
+                        f"Please try a more specific question than '{query}'.")
+            partial_type = "none"
+        
+        return {
+            "response": response,
+            "agent": "financial",
+            "error": str(error),
+            "metadata": {
+                "timeout": True,
+                "partial_result": partial_type,
+                "graded": bool(progress.get("graded_docs")),
+                "timed_out_stage": getattr(error, "stage", None)
+            }
+        }
+    
+    def _get_degraded_response(self, query: str, error: CircuitOpen,
+                               progress: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Answer without the LLM while its circuit is open: a quick response, the
+        last good answer to the same question, or retrieval-only excerpts.
+        """
+        response, fallback = get_fallback_answer("financial", query)
+        if response is None:
+            documents = (progress or {}).get("graded_docs") or (progress or {}).get("retrieved_docs", "")
+            if not documents and not circuit_breakers.is_open(settings.EMBEDDING_MODEL):
+                documents = self._search_excerpts(query)
+            if documents:
+                response = ("The language model is busy right now. Here are the most relevant excerpts "
+                            "from your documents:\n\n" + self._format_excerpts(documents))
+                fallback = "retrieved_excerpts"
+        if response is None:
+            retry_after = getattr(error, "retry_after", settings.CIRCUIT_OPEN_SECONDS)
+            response = ("The language model is overloaded right now. "
+                        f"Please try again in about {max(1, round(retry_after))} seconds.")
+            fallback = "none"
+        
+        return {
+            "response": response,
+            "agent": "financial",
+            "error": str(error),
+            "metadata": {
+                "degraded": True,
+                "fallback": fallback,
+                "circuit_model": getattr(error, "model", self.model),
+            }
+        }
+    
+    def _search_excerpts(self, query: str) -> str:
+        """Vector search only (no filter extraction or keyword generation), formatted like retrieve_docs"""
+        from utils import search_docs
+        try:
+            docs = search_docs(query, {}, [], k=3)
+        except Exception as e:
+            print(f"[Degraded] Retrieval failed: {e}")
+            return ""
+        return "\n".join(
+            "\n".join([f"--- Document {i} ---"] + [f"{key}: {value}" for key, value in doc.metadata.items()]
+                      + [f"\nContent:\n{doc.page_content}"])
+            for i, doc in enumerate(docs, 1)
+        )
+    
+    def _format_excerpts(self, documents: str, max_docs: int = 3, max_chars: int = 400) -> str:
+        """Format retrieved documents as short cited excerpts"""
+        excerpts = []
+        for block in documents.split("--- Document ")[1:]:
+            header, _, content = block.partition("Content:")
+            meta = {}
+            for line in header.splitlines()[1:]:
+                key, sep, value = line.partition(": ")
+                if sep:
+                    meta[key.strip()] = value.strip()
+            
+            source = ", ".join(
+                f"{key}: {meta[key]}" for key in ("company_name", "doc_type", "fiscal_year", "fiscal_quarter", "page")
+                if key in meta
+            )
+            text = " ".join(content.split())
+            if len(text) > max_chars:
+                text = text[:max_chars].rsplit(" ", 1)[0] + "..."
+            excerpts.append(f"**[{len(excerpts) + 1}] {source or 'Unknown source'}**\n> {text}")
+            
+            if len(excerpts) >= max_docs:
+                break
+        
+        return "\n\n".join(excerpts)
+    
     def format_messages(self, query: str) -> List:
         """Format messages for the agent"""
         return [HumanMessage(content=query)]
     
+    def get_turn_status(self, session_id: str, turn_id: str) -> Optional[Dict[str, Any]]:
+        """Checkpoint status of a RAG turn (None if unknown)"""
+        from services.checkpointing import get_turn_status, turn_config
+        return get_turn_status(self._get_rag_agent(), turn_config(session_id, turn_id))
+    
+    def resume(self, session_id: str, turn_id: str) -> Optional[Dict[str, Any]]:
+        """Resume an interrupted turn from its checkpoint (None if unknown)"""
+        status = self.get_turn_status(session_id, turn_id)
+        if status is None:
+            return None
+        # Checkpointed turns are RAG turns, even if the agent now runs in minimal mode
+        return self.invoke(status["query"], session_id=session_id, turn_id=turn_id, rag=True)
+    
     def switch_mode(self, use_minimal: bool) -> None:
         """Switch between minimal and RAG mode"""
         self.use_minimal = use_minimal
-        if not use_minimal and not self.rag_agent:
+        if not use_minimal:
             self.initialize()
 
 
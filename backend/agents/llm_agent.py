@@ -1,53 +1,54 @@
 # /opt/generticAgentAi/backend/agents/llm_agent.py
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, SystemMessage
 import logging
 
+from utils.circuit_breaker import CircuitOpen
+from utils.config import settings
+from utils.deadline import DeadlineExceeded
+from utils.llm_calls import call_llm
+from utils.model_registry import chat_model
+from services.response_cache import get_fallback_answer, remember_answer
+
 logger = logging.getLogger(__name__)
 
-def get_llm_agent(model_name: str = "qwen3"):
+def get_llm_agent(model_name: str = settings.OLLAMA_MODEL):
     """
     Create a direct LLM agent using Ollama
     For general questions not requiring specialized agents
     """
     
     # Initialize Ollama LLM
-    llm = OllamaLLM(
-        model=model_name,
-        base_url="http://localhost:11434",
+    llm = chat_model(
+        model_name,
         temperature=0.7,
         num_predict=1000,
         top_k=40,
         top_p=0.95
     )
     
-    # Create a prompt template
+    # System prompt
     system_prompt = """You are a helpful AI assistant. 
     Provide clear, accurate, and concise answers to the user's questions.
     If you don't know something, say so honestly.
     """
     
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "{input}")
-    ])
-    
-    # Create chain
-    chain = prompt | llm
-    
     class LLMAgent:
-        def __init__(self, chain, model_name):
-            self.chain = chain
+        def __init__(self, llm, model_name):
+            self.llm = llm
             self.model_name = model_name
             
-        def invoke(self, input_text: str):
+        def invoke(self, input_text: str, **kwargs):
             """Invoke the LLM with the input text"""
             try:
                 logger.info(f"LLM Agent ({self.model_name}) processing: {input_text[:100]}...")
                 
-                # Get response from LLM
-                response = self.chain.invoke({"input": input_text})
+                # Get response from LLM (under the request deadline, so a cancelled job stops it;
+                # tokens go to the request's stream)
+                messages = ([SystemMessage(content=system_prompt)] + (kwargs.get("history") or [])
+                            + [HumanMessage(content=input_text)])
+                response = call_llm(self.llm, messages, stage="llm_agent", publish=True).content
+                if not kwargs.get("history"):
+                    remember_answer("llm", input_text, response)
                 
                 return {
                     "response": response,
@@ -58,6 +59,20 @@ def get_llm_agent(model_name: str = "qwen3"):
                     }
                 }
                 
+            except DeadlineExceeded:
+                raise
+            except CircuitOpen as e:
+                # Fail fast while the model is overloaded: answer from cache or ask to retry
+                response, fallback = get_fallback_answer("llm", input_text)
+                if response is None:
+                    response = ("The language model is overloaded right now. "
+                                f"Please try again in about {max(1, round(e.retry_after))} seconds.")
+                    fallback = "none"
+                return {
+                    "response": response,
+                    "metadata": {"degraded": True, "fallback": fallback, "agent_type": "llm",
+                                 "circuit_model": e.model}
+                }
             except Exception as e:
                 logger.error(f"LLM Agent error: {e}")
                 return {
@@ -65,4 +80,4 @@ def get_llm_agent(model_name: str = "qwen3"):
                     "metadata": {"error": True, "agent_type": "llm"}
                 }
     
-    return LLMAgent(chain, model_name)
\ No newline at end of file
+    return LLMAgent(llm, model_name)
\ No newline at end of file
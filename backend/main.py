@@ -1,10 +1,39 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+import argparse
+import asyncio
+import os
+import time
 import uvicorn
 
+from utils.startup import startup_profile, preload
+
+# Profile the application imports (see GET /startup)
+startup_profile.track_imports()
 from agents.api.chat import router as chat_router
 from agents.api.upload import router as upload_router
+from agents.api.debug import router as debug_router
 from services.chat_service import create_main_agent
+from services.checkpointing import maintain_checkpoints
+from utils.config import settings
+from utils.model_profiles import get_profile_stats
+from utils.model_registry import get_model_stats
+from services.agent_executor import agent_executor
+from services.job_manager import job_manager
+from services.session_store import session_store
+from services.coalescer import coalescer
+from services.admission import admission
+from utils.debug_artifacts import debug_recorder
+from services.interaction_log import interaction_logger
+from utils.metrics import http_request_seconds, metrics
+from utils.shared_state import shared_state
+from utils.model_residency import model_residency
+from utils.llm_scheduler import llm_scheduler
+from utils.ollama_pool import ollama_pool
+from utils.circuit_breaker import circuit_breakers
+from utils.llm_cache import llm_cache
+startup_profile.stop_tracking()
 
 app = FastAPI(
     title="Multi-Agent System API",
@@ -21,18 +50,106 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Request latency by route template (time to response headers for streaming endpoints)"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        http_request_seconds.observe(time.perf_counter() - started, method=request.method,
+                                     path=route_template(request), status=str(status))
+
+def route_template(request: Request) -> str:
+    """Matched route path with its router prefix, e.g. /api/v1/chat/tasks/{task_id}"""
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    filled = route.path
+    for name, value in request.path_params.items():
+        filled = filled.replace("{" + name + "}", str(value))
+    path = request.url.path
+    prefix = path[:len(path) - len(filled)] if path.endswith(filled) else ""
+    return prefix + route.path
+
 # Include routers
 app.include_router(chat_router, prefix="/api/v1/chat", tags=["Chat"])
 app.include_router(upload_router, prefix="/api/v1/upload", tags=["Upload"])
+app.include_router(debug_router, prefix="/api/v1/debug", tags=["Debug"])
 
 # Global agent instance
 main_agent = None
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize main agent on startup"""
+    """Initialize main agent on startup; other resources are created on first use unless preloading"""
     global main_agent
-    main_agent = create_main_agent()
+    with startup_profile.phase("compile_main_agent"):
+        main_agent = create_main_agent()
+    with startup_profile.phase("recover_jobs"):
+        recovered = await asyncio.to_thread(job_manager.recover)
+    if recovered:
+        print(f"[JOBS] Requeued {recovered} interrupted jobs")
+    if settings.PRELOAD:
+        with startup_profile.phase("preload"):
+            failed = await asyncio.to_thread(preload)
+        print(f"[STARTUP] Preloaded resources ({len(failed)} failed)")
+    asyncio.create_task(checkpoint_maintenance_loop())
+    if settings.OLLAMA_WARMUP:
+        # In the background: the API serves (non-LLM) requests while models load
+        asyncio.create_task(model_residency_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    agent_executor.shutdown()
+    job_manager.shutdown()
+    debug_recorder.close()
+    interaction_logger.close()
+    model_residency.close()
+    ollama_pool.close()
+
+async def checkpoint_maintenance_loop():
+    """
+    Periodically prune old turns, finished jobs and expired sessions and truncate the checkpoint WAL.
+    With several workers only the holder of the maintenance lease does this.
+    """
+    runs = 0
+    while True:
+        await asyncio.sleep(settings.CHECKPOINT_MAINTENANCE_INTERVAL)
+        try:
+            if not await asyncio.to_thread(shared_state.acquire_lease, "maintenance",
+                                           settings.CHECKPOINT_MAINTENANCE_INTERVAL * 2):
+                continue
+            runs += 1
+            vacuum = runs % settings.CHECKPOINT_VACUUM_EVERY == 0
+            await asyncio.to_thread(maintain_checkpoints, vacuum=vacuum)
+            await asyncio.to_thread(job_manager.cleanup)
+            await asyncio.to_thread(session_store.cleanup)
+            await asyncio.to_thread(shared_state.cleanup)
+        except Exception as e:
+            print(f"[CHECKPOINT] Maintenance failed: {e}")
+
+async def model_residency_loop():
+    """
+    Load every configured Ollama model, then keep pinging them so they stay resident.
+    With several workers only the holder of the residency lease talks to Ollama;
+    a worker taking the lease over starts with a warmup round.
+    """
+    first = True
+    while True:
+        started = time.perf_counter()
+        held = False
+        try:
+            held = await asyncio.to_thread(model_residency.run_cycle, first)
+        except Exception as e:
+            print(f"[MODELS] Residency check failed: {e}")
+        if first and held:
+            startup_profile.phases["model_warmup"] = time.perf_counter() - started
+            first = False
+        await asyncio.sleep(settings.OLLAMA_PING_INTERVAL)
 
 @app.get("/")
 async def root():
@@ -46,15 +163,62 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    sessions = await asyncio.to_thread(session_store.stats)
     return {
         "status": "healthy",
-        "agents_initialized": main_agent is not None
+        "worker_pid": os.getpid(),
+        "agents_initialized": main_agent is not None,
+        "agent_executor": agent_executor.stats(),
+        "sessions": sessions,
+        "coalescer": dict(coalescer.stats),
+        "admission": admission.stats(),
+        "models": model_residency.status(),
+        "circuits": circuit_breakers.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (text exposition format 0.0.4)"""
+    body = await asyncio.to_thread(metrics.expose)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/startup")
+async def startup_report():
+    """Startup profile: import time per module, init time per lazy resource"""
+    return startup_profile.report()
+
+@app.get("/models/profiles")
+async def model_profiles():
+    """Model profile configuration, per-profile latency, per-model HTTP calls, Ollama hosts, scheduler queues,
+    circuits and LLM cache hit rates"""
+    return {
+        "profiles": settings.MODEL_PROFILES,
+        "latency": get_profile_stats(),
+        "ollama": get_model_stats(),
+        "hosts": ollama_pool.stats(),
+        "scheduler": llm_scheduler.stats(),
+        "circuits": circuit_breakers.stats(),
+        "llm_cache": llm_cache.stats()
     }
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-Agent System API")
+    parser.add_argument("--preload", action="store_true",
+                        help="initialize vector store, databases, router and agents before serving")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes (sessions, jobs and caches are shared through SQLite)")
+    args = parser.parse_args()
+    if args.preload:
+        # Read by Settings in the (reloaded) server process
+        os.environ["PRELOAD"] = "true"
+    if args.workers > 1:
+        # In-memory sessions would be private to each worker
+        os.environ["SESSION_STORE"] = "sqlite"
+    
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=args.workers == 1,
+        workers=args.workers
     )
\ No newline at end of file
@@ -51,7 +51,7 @@ class SearchQueries(BaseModel):
 
 class RouterDecision(BaseModel):
     """Route query to appropriate agent."""
-    agent: str = Field(description="Which agent to use: 'financial', 'sql', or 'web'")
+    agent: str = Field(description="Which agent to use: 'financial', 'sql', 'web', or 'general' (small talk and general knowledge)")
 
 
 class QueryType(BaseModel):
@@ -0,0 +1,233 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict
+
+from utils.config import settings
+from utils.llm_calls import emit_stream_event
+from utils.metrics import metrics
+from utils.tracing import record_span
+
+
+class AdmissionRejected(Exception):
+    """Raised when an agent's wait queue is full (429) or the wait ran too long (503)"""
+
+    def __init__(self, agent: str, status_code: int, retry_after: int):
+        reason = "queue full" if status_code == 429 else "queue wait timed out"
+        super().__init__(f"Agent '{agent}' is busy ({reason}), retry in {retry_after}s")
+        self.agent = agent
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, bounded: bool, loop: asyncio.AbstractEventLoop = None):
+        self.bounded = bounded
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+
+    def grant(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+        else:
+            self.event.set()
+
+
+class AgentLimiter:
+    """Concurrency limit plus bounded FIFO wait queue for one agent"""
+
+    def __init__(self, agent: str, limit: int, queue_size: int, max_wait: float):
+        self.agent = agent
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+        self._bounded_waiting = 0
+        self._lock = threading.Lock()
+        self._queue_times = deque(maxlen=1000)
+        self._service_times = deque(maxlen=200)
+        self.counters = {"admitted": 0, "bypassed": 0, "rejected_full": 0, "rejected_timeout": 0}
+
+    def retry_after(self) -> int:
+        """Seconds until a queued request would likely start"""
+        service = sum(self._service_times) / len(self._service_times) if self._service_times else 5.0
+        return max(1, math.ceil(service * (len(self._waiters) + 1) / self.limit))
+
+    def _enter(self, waiter: _Waiter) -> bool:
+        """Take a free slot (True) or join the queue (False); raises 429 when the queue is full"""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                self.counters["admitted"] += 1
+                self._queue_times.append(0.0)
+                return True
+            if waiter.bounded and self._bounded_waiting >= self.queue_size:
+                self.counters["rejected_full"] += 1
+                raise AdmissionRejected(self.agent, 429, self.retry_after())
+            self._waiters.append(waiter)
+            self._bounded_waiting += waiter.bounded
+            return False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue; False if the slot was already handed over"""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._bounded_waiting -= waiter.bounded
+                return True
+            return False
+
+    def bypass(self):
+        with self._lock:
+            self.counters["bypassed"] += 1
+
+    def _granted(self, waited: float):
+        with self._lock:
+            self.counters["admitted"] += 1
+            self._queue_times.append(waited)
+
+    def release(self, service_time: float = None):
+        """Free a slot, handing it straight to the oldest waiter"""
+        with self._lock:
+            if service_time is not None:
+                self._service_times.append(service_time)
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                self._bounded_waiting -= waiter.bounded
+                waiter.grant()
+            else:
+                self.active -= 1
+
+    async def acquire(self) -> float:
+        """Wait for a slot on the event loop; returns queue time in seconds"""
+        waiter = _Waiter(bounded=True, loop=asyncio.get_running_loop())
+        if self._enter(waiter):
+            return 0.0
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                with self._lock:
+                    self.counters["rejected_timeout"] += 1
+                raise AdmissionRejected(self.agent, 503, self.retry_after())
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                self.release()
+            raise
+        waited = time.perf_counter() - started
+        self._granted(waited)
+        return waited
+
+    def acquire_sync(self) -> float:
+        """Blocking, unbounded wait for background work (jobs are never rejected)"""
+        waiter = _Waiter(bounded=False)
+        if self._enter(waiter):
+            return 0.0
+        started = time.perf_counter()
+        waiter.event.wait()
+        waited = time.perf_counter() - started
+        self._granted(waited)
+        return waited
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._queue_times)
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "queued": len(self._waiters),
+                "queue_size": self.queue_size,
+                **self.counters,
+                "queue_ms_p50": _percentile_ms(waits, 0.50),
+                "queue_ms_p95": _percentile_ms(waits, 0.95),
+            }
+
+
+class AdmissionController:
+    """
+    Per-agent admission control in front of the Ollama-bound pipeline.
+
+    Each agent runs at most `limit` turns at once; up to `queue_size` more
+    wait in FIFO order for at most `max_wait` seconds. Beyond that requests
+    are rejected early (429 queue full, 503 wait timed out) with a
+    Retry-After estimate instead of slowing every request down.
+    """
+
+    def __init__(self, limits: Dict[str, int] = None, queue_size: int = None, max_wait: float = None):
+        self.limits = limits or settings.ADMISSION_LIMITS
+        self.queue_size = settings.ADMISSION_QUEUE_SIZE if queue_size is None else queue_size
+        self.max_wait = settings.ADMISSION_MAX_WAIT if max_wait is None else max_wait
+        self._limiters: Dict[str, AgentLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, agent: str) -> AgentLimiter:
+        with self._lock:
+            if agent not in self._limiters:
+                limit = self.limits.get(agent, min(self.limits.values()))
+                self._limiters[agent] = AgentLimiter(agent, limit, self.queue_size, self.max_wait)
+            return self._limiters[agent]
+
+    @asynccontextmanager
+    async def admit(self, agent: str, bypass: bool = False):
+        """Hold one of the agent's slots for the duration of the block"""
+        limiter = self.limiter(agent)
+        if bypass:
+            limiter.bypass()
+            emit_stream_event({"type": "admitted", "agent": agent, "queue_ms": 0.0, "bypass": True})
+            yield
+            return
+        waited = await limiter.acquire()
+        emit_stream_event({"type": "admitted", "agent": agent, "queue_ms": round(waited * 1000, 1)})
+        record_span("admission_wait", "queue", waited, agent=agent)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            limiter.release(time.perf_counter() - started)
+
+    @contextmanager
+    def admit_sync(self, agent: str, bypass: bool = False):
+        """Blocking variant for background jobs: waits for a slot, never rejects"""
+        limiter = self.limiter(agent)
+        if bypass:
+            limiter.bypass()
+            yield
+            return
+        waited = limiter.acquire_sync()
+        record_span("admission_wait", "queue", waited, agent=agent)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            limiter.release(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.agent: limiter.stats() for limiter in limiters}
+
+
+def _percentile_ms(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 1)
+
+
+admission = AdmissionController()
+
+
+@metrics.collector
+def _admission_metrics():
+    for agent, stats in admission.stats().items():
+        labels = {"agent": agent}
+        yield "admission_queue_depth", "gauge", "Requests waiting for an agent slot", labels, stats["queued"]
+        yield "admission_active", "gauge", "Turns holding an agent slot", labels, stats["active"]
+        for outcome in ("admitted", "bypassed", "rejected_full", "rejected_timeout"):
+            yield ("admission_requests_total", "counter", "Admission decisions by agent and outcome",
+                   {"agent": agent, "outcome": outcome}, stats[outcome])
@@ -0,0 +1,98 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from utils.config import settings
+from utils.metrics import metrics
+
+
+class AgentExecutor:
+    """
+    Bounded thread pool for synchronous agent work (LLM calls, retrieval, SQLite).
+
+    Keeps blocking agent.invoke calls off the uvicorn event loop and tracks
+    queue depth and queue wait time so saturation is visible.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or settings.AGENT_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on the pool and await its result"""
+        submitted = time.perf_counter()
+        context = contextvars.copy_context()
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._wait_times.append(started - submitted)
+            failed = True
+            try:
+                result = context.run(func, *args, **kwargs)
+                failed = False
+                return result
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+                    self._failed += failed
+                    self._run_times.append(time.perf_counter() - started)
+
+        with self._lock:
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, task)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._wait_times)
+            runs = sorted(self._run_times)
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_ms_p50": _percentile_ms(waits, 0.50),
+                "wait_ms_p95": _percentile_ms(waits, 0.95),
+                "run_ms_p50": _percentile_ms(runs, 0.50),
+                "run_ms_p95": _percentile_ms(runs, 0.95),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _percentile_ms(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 1)
+
+
+agent_executor = AgentExecutor()
+
+
+@metrics.collector
+def _executor_metrics():
+    stats = agent_executor.stats()
+    yield "agent_executor_queue_depth", "gauge", "Agent tasks waiting for a worker thread", {}, stats["queue_depth"]
+    yield "agent_executor_active", "gauge", "Agent tasks running", {}, stats["active"]
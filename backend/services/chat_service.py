@@ -2,40 +2,71 @@ from typing import TypedDict, Annotated, List
 import operator
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_ollama import ChatOllama
 from pydantic import BaseModel, Field
-import os
 
 from .retrieve_node import route_after_retrieve
 from .response_cache import get_quick_response
+from .intent import classify_intent, should_retrieve_documents
+from .query_router import router
+from .history_manager import estimate_tokens
 from tools.retrieval_tools import retrieve_docs
+from utils.deadline import DeadlineExceeded, can_afford, record_progress
+from utils.llm_calls import call_llm
+from utils.debug_artifacts import debug_recorder
+from utils.model_profiles import get_profile
+from utils.tracing import annotate, traced_node
 from models.schemas import (
     GradeDocuments, GradeHallucinations, 
-    GradeAnswer, SearchQueries, RouterDecision
+    GradeAnswer, SearchQueries
 )
 
-LLM_MODEL = "qwen3"
-BASE_URL = "http://localhost:11434"
-llm = ChatOllama(model=LLM_MODEL, base_url=BASE_URL, reasoning=True)
-
+# Each node calls the model profile configured for it in Settings.MODEL_PROFILES
 class AgentState(TypedDict):
     messages: Annotated[List, operator.add]
+    history: List  # compacted earlier turns, see services.history_manager
     retrieved_docs: str
     rewritten_queries: List[str]
     transform_count: int  
     max_transforms: int  
 
+def fit_documents(documents: str, profile: str, *prompt_parts: str) -> str:
+    """
+    Trim retrieved documents so the whole prompt fits the profile's num_ctx.
+
+    The rest of the prompt (system prompt, history, query) and the profile's
+    num_predict are budgeted first; documents get what is left, cut at a
+    document boundary where possible. Past num_ctx, Ollama silently drops
+    the start of the prompt instead.
+    """
+    model_profile = get_profile(profile)
+    if not model_profile.get("num_ctx"):
+        return documents
+    budget = (model_profile["num_ctx"] - (model_profile.get("num_predict") or 0)
+              - sum(estimate_tokens(part) for part in prompt_parts))
+    if estimate_tokens(documents) <= budget:
+        return documents
+    trimmed = documents[:max(budget, 0) * 4]
+    boundary = trimmed.rfind("\n--- Document ")
+    if boundary > 0:
+        trimmed = trimmed[:boundary]
+    print(f"[CONTEXT] Documents trimmed to the {profile} prompt budget: {len(documents)} -> {len(trimmed)} chars")
+    annotate(trimmed_chars=len(documents) - len(trimmed))
+    return trimmed
+
 # Reuse the self_rag implementation from original code
-def create_self_rag():
-    """Create self-RAG agent for financial documents với fix infinite loop"""
+def create_self_rag(checkpointer=None):
+    """Create self-RAG agent for financial documents với fix infinite loop
+    
+    Pass a checkpointer (see services.checkpointing) to make turns resumable.
+    """
     builder = StateGraph(AgentState)
 
     # Add nodes
-    builder.add_node('retrieve', retrieve_node)
+    builder.add_node('retrieve', traced_node('retrieve', retrieve_node))
     builder.add_node('route_after_retrieve', lambda state: state)
-    builder.add_node('grade_documents', grade_documents_node)
-    builder.add_node('generate', generate_node)
-    builder.add_node('transform_query', transform_query_node)
+    builder.add_node('grade_documents', traced_node('grade_documents', grade_documents_node))
+    builder.add_node('generate', traced_node('generate', generate_node))
+    builder.add_node('transform_query', traced_node('transform_query', transform_query_node))
 
     # Define edges
     builder.add_edge(START, 'retrieve')
@@ -67,7 +98,7 @@ def create_self_rag():
         ['generate', END, 'transform_query']
     )
 
-    return builder.compile()
+    return builder.compile(checkpointer=checkpointer)
 
 
 class MainAgentState(TypedDict):
@@ -108,38 +139,24 @@ def create_main_agent():
     return builder.compile()
 
 def route_node(state: MainAgentState):
-    """Route query to appropriate agent"""
+    """Route query to appropriate agent (embedding centroids, LLM only on small margins)"""
     query = state["messages"][-1].content
     
-    llm_structured = llm.with_structured_output(RouterDecision)
-    decision = llm_structured.invoke(query)
+    agent, margin, source = router.classify(query)
+    print(f"[ROUTE] {agent} via {source} (margin {margin:.3f})")
     
-    return {"next_node": decision.agent}
+    # General questions go to the financial agent, which handles small talk
+    if agent not in ("financial", "sql", "web"):
+        agent = "financial"
+    return {"next_node": f"{agent}_agent"}
 
 def route_query(message: str) -> str:
     """
     Route user query to appropriate agent
     Returns: "financial", "sql", "web", or "general"
     """
-    message_lower = message.lower()
-    
-    # Financial keywords
-    financial_keywords = [
-        "stock", "price", "market", "investment", "portfolio",
-        "finance", "financial", "revenue", "profit", "loss",
-        "dividend", "trading", "buy", "sell", "hold", "analysis"
-    ]
-    
-    # Check for agent-specific keywords
-    if any(keyword in message_lower for keyword in financial_keywords):
-        return "financial"
-    # elif any(keyword in message_lower for keyword in sql_keywords):
-    #     return "sql"
-    # elif any(keyword in message_lower for keyword in web_keywords):
-    #     return "web"
-    else:
-        # Default to general LLM
-        return "general"  
+    agent, _, _ = router.classify(message)
+    return agent
 
 def financial_agent_node(state: MainAgentState):
     """Handle financial document queries"""
@@ -192,11 +209,19 @@ def retrieve_node(state):
         print(f"[RETRIEVE] Transform limit reached ({transform_count}), returning empty")
         return {'retrieved_docs': ''}
     
+    # Keep enough of the request budget for the answer itself
+    if not can_afford('retrieve', 'generate'):
+        print("[RETRIEVE] Not enough time budget left, skipping retrieval")
+        return {'retrieved_docs': ''}
+    
     rewritten_queries = state.get('rewritten_queries', [])
     queries_to_search = rewritten_queries if rewritten_queries else [query]
 
     all_results = []
     for idx, search_query in enumerate(queries_to_search, 1):
+        if all_results and not can_afford('retrieve', 'generate'):
+            print(f"[RETRIEVE] Time budget low, stopping after {len(all_results)} queries")
+            break
         print(f"[RETRIEVE] Query {idx}: {search_query}")
         result = retrieve_docs.invoke({'query': search_query, 'k': 3})
         
@@ -209,11 +234,13 @@ def retrieve_node(state):
     
     if all_results:
         combined_result = "\n\n".join(all_results)
+        record_progress('retrieved_docs', combined_result)
         print(f"[RETRIEVE] Found {len(all_results)} result sets")
     else:
         combined_result = ''
         print("[RETRIEVE] No documents found for any query")
 
+    annotate(queries=len(queries_to_search), context_bytes=len(combined_result.encode('utf-8')))
     return {'retrieved_docs': combined_result}
 
 def grade_documents_node(state):
@@ -230,7 +257,10 @@ def grade_documents_node(state):
         print("[GRADE] No documents to grade")
         return {'retrieved_docs': ''}
     
-    llm_structured = llm.with_structured_output(GradeDocuments)
+    # Grading is an optimisation: without budget for it, go straight to generate
+    if not can_afford('grade_documents', 'generate'):
+        print("[GRADE] Not enough time budget left - keeping documents ungraded")
+        return {'retrieved_docs': retrieved_docs}
 
     system_prompt = """You are a grader assessing relevance of retrieved documents to a user query.
                 It does not need to be a stringent test. The goal is to filter out erroneous retrievals.
@@ -238,12 +268,15 @@ def grade_documents_node(state):
                 Give a binary score 'yes' or 'no' to indicate whether the document is relevant to the query."""
     
     system_msg = SystemMessage(system_prompt)
-    messages = [system_msg, HumanMessage(f"Retrieved Document: {retrieved_docs}\n\nUser query: {query}")]
+    documents = fit_documents(retrieved_docs, "grader", system_prompt, query)
+    messages = [system_msg, HumanMessage(f"Retrieved Document: {documents}\n\nUser query: {query}")]
+    annotate(context_bytes=len(documents.encode('utf-8')))
 
-    response = llm_structured.invoke(messages)
+    response = call_llm("grader", messages, schema=GradeDocuments, stage='grade_documents')
     print(f"[GRADE] Relevance: {response.binary_score}")
 
     if response.binary_score == 'yes':
+        record_progress('graded_docs', retrieved_docs)
         return {'retrieved_docs': retrieved_docs}
     else:
         return {'retrieved_docs': ''}
@@ -293,21 +326,22 @@ def generate_node(state):
         **References:**
         1. Company: x, Year: y, Quarter: z, Page: n"""
     
+    history = state.get('history', [])
     if has_documents:
+        documents = fit_documents(documents, "generator", system_prompt, query,
+                                  *(message.content for message in history))
         query_prompt = f"Retrieved Document: {documents}\n\nUser query: {query}"
+        annotate(context_bytes=len(documents.encode('utf-8')))
     else:
         query_prompt = f"User query: {query}"
 
     system_msg = SystemMessage(system_prompt)
     user_msg = HumanMessage(query_prompt)
-    messages = [system_msg, user_msg]
+    messages = [system_msg] + history + [user_msg]
 
-    response = llm.invoke(messages)
+    response = call_llm("generator", messages, stage='generate', publish=True)
 
-    os.makedirs('debug_logs', exist_ok=True)
-    with open('debug_logs/self_rag_answer.md', 'w', encoding='utf-8') as f:
-        f.write(f"Query: {query}")
-        f.write(response.content)
+    debug_recorder.record("self_rag_answer", f"Query: {query}\n\n{response.content}")
 
     return {'messages': [response]}
 
@@ -330,8 +364,6 @@ def transform_query_node(state):
             "transform_count": transform_count
         }
     
-    llm_structured = llm.with_structured_output(SearchQueries)
-
     system_prompt = """You are a query re-writer that decomposes complex queries into focused search queries optimized for vectorstore retrieval.
 
                 GUIDELINES:
@@ -360,7 +392,7 @@ def transform_query_node(state):
     messages = [system_msg, user_msg]
     
     try:
-        response = llm_structured.invoke(messages)
+        response = call_llm("rewriter", messages, schema=SearchQueries, stage='transform_query')
         new_queries = response.search_queries
         
         # Lọc bỏ queries trùng
@@ -379,6 +411,8 @@ def transform_query_node(state):
             "transform_count": transform_count
         }
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"[TRANSFORM] Error: {e}")
         return {
@@ -403,6 +437,9 @@ def should_generate(state):
         return 'generate'
     
     if not retrieved_docs or retrieved_docs.strip() == '':
+        if not can_afford('transform_query', 'retrieve', 'generate'):
+            print("[ROUTER] No relevant documents and no time budget to retry - generating")
+            return 'generate'
         print(f"[ROUTER] No relevant documents - transforming query (attempt {transform_count + 1})")
         return 'transform_query'
     else:
@@ -455,13 +492,15 @@ def check_answer_quality(state: AgentState):
             generation = str(last_message)
         
         # Nếu là casual conversation, auto-end
-        simple_keywords = ["hi", "hello", "hey", "thanks", "bye", "ok", "yes", "no"]
-        if any(keyword in query.lower() for keyword in simple_keywords):
+        if classify_intent(query).intent == "smalltalk":
             print("[ROUTER] Simple conversation detected, auto-ending")
             return END
         
         # Nếu answer quá ngắn hoặc là apology, có thể cần transform lại
         if len(generation) < 50 and "sorry" in generation.lower():
+            if not can_afford('transform_query', 'retrieve', 'generate'):
+                print("[ROUTER] Short apology answer but no time budget left, ending")
+                return END
             print("[ROUTER] Short apology answer, transforming query")
             return "transform_query"
         
@@ -474,66 +513,3 @@ def check_answer_quality(state: AgentState):
         import traceback
         traceback.print_exc()
         return END
-
-def should_retrieve_documents(query: str) -> bool:
-    """Determine if we should retrieve documents for this query - IMPROVED"""
-    query_lower = query.lower().strip()
-    
-    # Simple greetings and casual questions - don't retrieve
-    simple_phrases = [
-        "hi", "hello", "hey", "hi there", "hello there",
-        "how are you", "how are you doing", "what's up",
-        "good morning", "good afternoon", "good evening",
-        "thanks", "thank you", "bye", "goodbye",
-        "who are you", "what can you do", "help", 
-        "who created you", "what is your name",
-        "ok", "okay", "yes", "no", "maybe"
-    ]
-    
-    # Very vague queries about documents
-    vague_doc_phrases = [
-        "tell me something in your document",
-        "what's in your document",
-        "show me your document",
-        "document content",
-        "what documents do you have",
-        "your documents"
-    ]
-    
-    # Check for simple greetings
-    if query_lower in simple_phrases:
-        return False
-    
-    # Check for vague document queries
-    if any(phrase in query_lower for phrase in vague_doc_phrases):
-        return False  # Không retrieve vì quá vague
-    
-    # Check for very short vague queries
-    if len(query.split()) <= 3:
-        vague_words = ['document', 'something', 'anything', 'tell', 'show', 'what']
-        if any(word in query_lower for word in vague_words):
-            return False
-    
-    # Keywords that indicate document retrieval is needed
-    financial_keywords = ['revenue', 'profit', 'earnings', 'financial', 'sec', 'filing', 
-                         'quarter', 'annual', 'report', 'balance', 'cash flow', 'income',
-                         'statement', 'ebitda', 'margin', 'growth']
-    
-    sql_keywords = ['employee', 'salary', 'department', 'database', 'query', 'table', 
-                   'select', 'employees', 'hr', 'human resources', 'sql', 'query']
-    
-    specific_keywords = financial_keywords + sql_keywords
-    
-    # Nếu có từ khóa cụ thể, retrieve
-    if any(keyword in query_lower for keyword in specific_keywords):
-        return True
-    
-    # Câu hỏi bắt đầu bằng what/how về số liệu cụ thể
-    if query_lower.startswith(('what is', 'how much', 'how many', 'what are')):
-        number_words = ['revenue', 'profit', 'salary', 'employees', 'cost', 'price']
-        if any(word in query_lower for word in number_words):
-            return True
-    
-    # Default: don't retrieve để tránh loop
-    return False
-
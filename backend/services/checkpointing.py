@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config import settings
+from utils.helpers import get_latest_user_query
+
+class TurnConflict(ValueError):
+    """A turn ID was reused for a different message"""
+    status_code = 409
+
+
+_conn: Optional[sqlite3.Connection] = None
+_saver = None
+_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(settings.CHECKPOINT_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(settings.CHECKPOINT_DB, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS checkpoint_turns (
+            thread_id TEXT PRIMARY KEY,
+            session_id TEXT,
+            created_at REAL
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+def get_checkpointer():
+    """Get the process-wide SQLite checkpointer (one shared WAL connection)"""
+    global _conn, _saver
+    if _saver is None:
+        with _lock:
+            if _saver is None:
+                from langgraph.checkpoint.sqlite import SqliteSaver
+                _conn = _connect()
+                _saver = SqliteSaver(_conn)
+                _saver.setup()
+    return _saver
+
+
+def turn_config(session_id: str, turn_id: str) -> Dict[str, Any]:
+    """Graph config for one chat turn; each turn is its own checkpoint thread"""
+    return {"configurable": {"thread_id": f"{session_id}:{turn_id}"}}
+
+
+def run_turn(graph, state: Dict[str, Any], config: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Run a turn, resuming from its last completed node if it was checkpointed.
+
+    Returns the final state and how it was obtained: None for a fresh run,
+    "completed" when a finished turn is replayed, or the node it resumed at.
+    """
+    snapshot = graph.get_state(config)
+
+    # A retry must ask the same question, or it would get the stored turn's answer
+    if snapshot.values:
+        stored = get_latest_user_query(snapshot.values.get("messages", []))
+        query = get_latest_user_query(state.get("messages", []))
+        if stored.strip() != query.strip():
+            raise TurnConflict(f"Turn {config['configurable']['thread_id']} was started with a different message")
+
+    if snapshot.values and not snapshot.next:
+        print(f"[CHECKPOINT] Turn {config['configurable']['thread_id']} already completed")
+        return snapshot.values, "completed"
+
+    if snapshot.next:
+        resumed_at = ",".join(snapshot.next)
+        print(f"[CHECKPOINT] Resuming turn at: {resumed_at}")
+        return graph.invoke(None, config), resumed_at
+
+    _register_turn(config["configurable"]["thread_id"])
+    return graph.invoke(state, config), None
+
+
+def get_turn_status(graph, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Describe a checkpointed turn, or None if it was never started"""
+    snapshot = graph.get_state(config)
+    if not snapshot.values:
+        return None
+    return {
+        "thread_id": config["configurable"]["thread_id"],
+        "query": get_latest_user_query(snapshot.values.get("messages", [])),
+        "completed": not snapshot.next,
+        "next_nodes": list(snapshot.next),
+        "step": (snapshot.metadata or {}).get("step"),
+        "updated_at": snapshot.created_at
+    }
+
+
+def _register_turn(thread_id: str):
+    saver = get_checkpointer()
+    session_id = thread_id.split(":", 1)[0]
+    # The saver's own lock serialises every use of the shared connection
+    with saver.lock:
+        _conn.execute(
+            "INSERT OR IGNORE INTO checkpoint_turns (thread_id, session_id, created_at) VALUES (?, ?, ?)",
+            (thread_id, session_id, time.time())
+        )
+        _conn.commit()
+
+
+def maintain_checkpoints(max_age_hours: float = None, vacuum: bool = False) -> Dict[str, Any]:
+    """Drop expired turns, truncate the WAL and optionally VACUUM the checkpoint DB"""
+    saver = get_checkpointer()
+    max_age_hours = settings.CHECKPOINT_RETENTION_HOURS if max_age_hours is None else max_age_hours
+    cutoff = time.time() - max_age_hours * 3600
+
+    with saver.lock:
+        expired = [row[0] for row in _conn.execute(
+            "SELECT thread_id FROM checkpoint_turns WHERE created_at < ?", (cutoff,)
+        )]
+
+    for thread_id in expired:
+        saver.delete_thread(thread_id)
+
+    with saver.lock:
+        _conn.executemany("DELETE FROM checkpoint_turns WHERE thread_id = ?", [(t,) for t in expired])
+        _conn.commit()
+        busy, wal_pages, moved_pages = _conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        if vacuum:
+            _conn.execute("VACUUM")
+
+    print(f"[CHECKPOINT] Maintenance: removed {len(expired)} turns, WAL pages checkpointed: {moved_pages}")
+    return {
+        "removed_turns": len(expired),
+        "wal_pages": wal_pages,
+        "checkpointed_pages": moved_pages,
+        "vacuumed": vacuum
+    }
@@ -0,0 +1,148 @@
+import asyncio
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.corpus import corpus_version
+from utils.deadline import Cancelled
+from utils.llm_calls import stream_tokens
+from utils.metrics import metrics
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+
+class Flight:
+    """One in-flight computation shared by every identical request"""
+
+    def __init__(self):
+        self.future: Future = Future()
+        self.waiters = 0
+        self._events: List[Dict[str, Any]] = []
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def publish(self, event: Dict[str, Any]):
+        """Fan a stream event out to every subscriber (called by the leader's LLM stream)"""
+        with self._lock:
+            self._events.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber(event)
+
+    def subscribe(self, subscriber: Callable[[Dict[str, Any]], None]):
+        """Replay events published so far, then receive new ones"""
+        with self._lock:
+            for event in self._events:
+                subscriber(event)
+            self._subscribers.append(subscriber)
+
+
+class RequestCoalescer:
+    """
+    Single-flight execution of identical concurrent requests.
+
+    The first request for a key runs the computation; requests with the same
+    key arriving before it finishes wait for that result instead of running
+    their own graph. Streaming callers subscribe to the leader's token events.
+    When the leader's own caller cancels it (a job), waiters run the
+    computation again, one of them leading, instead of failing with it.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Tuple, Flight] = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0, "in_flight": 0}
+
+    def key(self, query: str, agent_type: Optional[str], context: Optional[str] = None) -> Tuple:
+        """
+        Coalescing key: normalized query, requested agent and corpus version.
+
+        `context` separates requests whose answer depends on earlier turns
+        (the session ID when the session has history).
+        """
+        return normalize_query(query), (agent_type or "auto").lower(), corpus_version(), context
+
+    def _join(self, key: Tuple, on_event: Callable = None) -> Tuple[Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.stats["leaders"] += 1
+            else:
+                flight.waiters += 1
+                self.stats["coalesced"] += 1
+            self.stats["in_flight"] = len(self._flights)
+        if on_event is not None:
+            flight.subscribe(on_event)
+        return flight, leader
+
+    def _finish(self, key: Tuple, flight: Flight, result: Any = None, error: BaseException = None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            self.stats["in_flight"] = len(self._flights)
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def run(self, key: Tuple, func: Callable, *args, on_event: Callable = None) -> Tuple[Any, bool]:
+        """Blocking single-flight call; returns (result, coalesced)"""
+        while True:
+            flight, leader = self._join(key, on_event)
+            if leader:
+                break
+            try:
+                return flight.future.result(), True
+            except Cancelled:
+                # Only the leader's caller cancelled; run again for this one
+                continue
+        try:
+            with stream_tokens(flight.publish):
+                result = func(*args)
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+        self._finish(key, flight, result=result)
+        return result, False
+
+    async def run_async(self, key: Tuple, func: Callable, on_event: Callable = None) -> Tuple[Any, bool]:
+        """Single-flight call of an async func (no arguments); returns (result, coalesced)"""
+        while True:
+            flight, leader = self._join(key, on_event)
+            if leader:
+                break
+            try:
+                return await asyncio.wrap_future(flight.future), True
+            except Cancelled:
+                continue
+
+        with stream_tokens(flight.publish):
+            task = asyncio.ensure_future(func())
+
+        def done(task: asyncio.Task):
+            if task.cancelled():
+                self._finish(key, flight, error=asyncio.CancelledError())
+            else:
+                self._finish(key, flight, result=None if task.exception() else task.result(),
+                             error=task.exception())
+
+        task.add_done_callback(done)
+        # Waiters still get the result if the leading client disconnects
+        return await asyncio.shield(task), False
+
+
+coalescer = RequestCoalescer()
+
+
+@metrics.collector
+def _coalescer_metrics():
+    stats = dict(coalescer.stats)
+    for role, key in (("leader", "leaders"), ("coalesced", "coalesced")):
+        yield ("coalescer_requests_total", "counter", "Chat requests that led a graph run or joined one",
+               {"role": role}, stats[key])
+    yield "coalescer_in_flight", "gauge", "Distinct chat runs in flight", {}, stats["in_flight"]
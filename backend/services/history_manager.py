@@ -0,0 +1,232 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from utils.config import settings
+from utils.llm_calls import call_llm
+from utils.llm_scheduler import llm_priority
+from utils.metrics import cache_requests, metrics
+from utils.shared_state import shared_state
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and a financial AI assistant.
+Merge the new turns into the existing summary. Keep companies, periods, metrics and figures the user
+asked about, and any facts the assistant stated. Drop greetings and small talk.
+Return only the updated summary, at most 150 words."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+class HistoryManager:
+    """
+    Per-session conversation history for multi-turn prompts.
+
+    The last `keep_turns` turns are kept verbatim; older turns are folded into
+    a rolling summary by a background worker, so summarising never adds
+    latency to a chat turn. The context built for each (session, agent) is
+    cached until the session changes.
+
+    With a shared session store (several worker processes), a worker that
+    finds turns it did not record itself reloads the verbatim window from
+    the store and the rolling summary from shared state; turns between the
+    two stay pending until a summary covers them.
+    """
+
+    def __init__(self, keep_turns: int = None, token_budgets: Dict[str, int] = None):
+        self.keep_turns = keep_turns or settings.HISTORY_KEEP_TURNS
+        self.token_budgets = token_budgets or settings.HISTORY_TOKEN_BUDGETS
+        self._sessions: Dict[str, Dict] = {}
+        self._context_cache: Dict[Tuple[str, str], Tuple[int, List]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._turn_loader: Optional[Callable[[str, int], Tuple[int, List[Tuple[str, str]]]]] = None
+
+    def set_turn_loader(self, loader: Callable[[str, int], Tuple[int, List[Tuple[str, str]]]]):
+        """Enable multi-worker mode: loader(session_id, n) returns (total turns, last n turns)"""
+        self._turn_loader = loader
+
+    def _session(self, session_id: str) -> Dict:
+        if session_id not in self._sessions:
+            self._sessions[session_id] = {
+                "turns": [],
+                "pending": [],
+                "summary": "",
+                "summarizing": False,
+                "version": 0,
+                "total": 0,
+                "summarized": 0
+            }
+        return self._sessions[session_id]
+
+    def _sync(self, session_id: str):
+        """Catch up with turns and summaries other workers recorded for this session"""
+        total, recent = self._turn_loader(session_id, self.keep_turns)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if total == 0 or (session is not None and session["total"] == total and not session["pending"]):
+                return
+            summarized = session["summarized"] if session is not None else 0
+        shared = shared_state.get(f"history_summary:{session_id}") or {}
+        summarized = max(summarized, shared.get("summarized", 0))
+
+        # Turns that left the verbatim window but are not in the summary yet stay pending
+        missing = total - len(recent) - summarized
+        earlier = self._turn_loader(session_id, len(recent) + missing)[1][:missing] if missing > 0 else []
+
+        with self._lock:
+            session = self._session(session_id)
+            summary = session["summary"]
+            if shared.get("summarized", 0) >= session["summarized"]:
+                session["summary"] = shared.get("summary", "")
+                session["summarized"] = shared.get("summarized", 0)
+            first = total - len(recent) - len(earlier)
+            state = (session["summary"], list(earlier[max(0, session["summarized"] - first):]), list(recent), total)
+            if state != (summary, session["pending"], session["turns"], session["total"]):
+                session["pending"], session["turns"], session["total"] = state[1:]
+                session["version"] += 1
+
+    def add_turn(self, session_id: str, query: str, response: str):
+        """Record a finished turn; turns leaving the window are summarised in background"""
+        with self._lock:
+            session = self._session(session_id)
+            session["turns"].append((query, response))
+            session["version"] += 1
+            session["total"] += 1
+
+            overflow = session["turns"][:-self.keep_turns]
+            if overflow:
+                session["turns"] = session["turns"][-self.keep_turns:]
+                session["pending"].extend(overflow)
+
+            schedule = bool(session["pending"]) and not session["summarizing"]
+            if schedule:
+                session["summarizing"] = True
+
+        if schedule:
+            self._executor.submit(self._fold_pending, session_id)
+
+    def get_context(self, session_id: str, agent: str) -> List:
+        """History messages for the next prompt, capped to the agent's token budget"""
+        if self._turn_loader is not None:
+            self._sync(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+
+            key = (session_id, agent)
+            cached = self._context_cache.get(key)
+            if cached and cached[0] == session["version"]:
+                cache_requests.inc(cache="history_context", result="hit")
+                return cached[1]
+            cache_requests.inc(cache="history_context", result="miss")
+
+            summary = session["summary"]
+            pending = list(session["pending"])
+            turns = list(session["turns"])
+            version = session["version"]
+
+        budget = self.token_budgets.get(agent, min(self.token_budgets.values()))
+
+        # Turns not summarised yet are represented by their questions only
+        if pending:
+            asked = "; ".join(query for query, _ in pending)
+            summary = f"{summary}\nEarlier the user also asked: {asked}".strip()
+
+        messages = []
+        used = 0
+        if summary:
+            summary = summary[:budget * 4 // 3]
+            used = estimate_tokens(summary)
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+
+        # Newest turns first, until the budget is spent
+        recent = []
+        for query, response in reversed(turns):
+            cost = estimate_tokens(query) + estimate_tokens(response)
+            if used + cost > budget:
+                break
+            used += cost
+            recent[:0] = [HumanMessage(content=query), AIMessage(content=response)]
+        messages.extend(recent)
+
+        with self._lock:
+            self._context_cache[(session_id, agent)] = (version, messages)
+        return messages
+
+    def has_history(self, session_id: str) -> bool:
+        if self._turn_loader is not None:
+            return self._turn_loader(session_id, 0)[0] > 0
+        with self._lock:
+            return session_id in self._sessions
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            for key in [key for key in self._context_cache if key[0] == session_id]:
+                del self._context_cache[key]
+        if self._turn_loader is not None:
+            shared_state.delete(f"history_summary:{session_id}")
+
+    def _fold_pending(self, session_id: str):
+        """Fold pending turns into the rolling summary (runs on the worker thread)"""
+        while True:
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return
+                if not session["pending"]:
+                    session["summarizing"] = False
+                    return
+                batch = list(session["pending"])
+                summary = session["summary"]
+                summarized = session["summarized"]
+
+            new_summary = self._summarize(summary, batch)
+
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return
+                if session["summarized"] != summarized:
+                    # Another worker's newer summary was synced meanwhile; fold what is still pending
+                    continue
+                session["summary"] = new_summary
+                session["pending"] = session["pending"][len(batch):]
+                session["summarized"] += len(batch)
+                session["version"] += 1
+                summarized = session["summarized"]
+
+            if self._turn_loader is not None:
+                shared_state.set(f"history_summary:{session_id}",
+                                 {"summary": new_summary, "summarized": summarized},
+                                 ttl=settings.SESSION_TTL_SECONDS)
+
+    def _summarize(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        transcript = "\n".join(f"User: {query}\nAssistant: {response[:1500]}" for query, response in turns)
+        try:
+            # Nobody waits on summaries: interactive calls go first
+            with llm_priority("background"):
+                message = call_llm("summarizer", [
+                    SystemMessage(content=SUMMARY_PROMPT),
+                    HumanMessage(content=f"Existing summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}")
+                ], stage="summarize_history")
+            return message.content.strip()
+        except Exception as e:
+            print(f"[HISTORY] Summarisation failed, keeping questions only: {e}")
+            asked = "; ".join(query for query, _ in turns)
+            return f"{summary}\nThe user asked: {asked}".strip()
+
+
+history_manager = HistoryManager()
+
+
+@metrics.collector
+def _history_metrics():
+    with history_manager._lock:
+        backlog = sum(len(session["pending"]) for session in history_manager._sessions.values())
+    yield "history_summary_backlog_turns", "gauge", "Turns waiting to be folded into session summaries", {}, backlog
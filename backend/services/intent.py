@@ -0,0 +1,184 @@
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from utils.metrics import metrics
+
+# Small talk with a canned answer (no LLM, no retrieval)
+QUICK_RESPONSES = {
+    "hi": "Hello! 👋 I'm your AI assistant. How can I help you today?",
+    "hello": "Hi there! 😊 I'm ready to assist you with financial analysis, database queries, or web searches. What would you like to know?",
+    "hey": "Hey! 👋 What can I do for you today?",
+    "how are you": "I'm doing great, thanks for asking! Ready to help you with any questions you might have.",
+    "what can you do": "I can help you with:\n\n• **Financial Analysis**: SEC filings, revenue reports, earnings data\n• **SQL Queries**: Employee database, salary information, HR data\n• **Web Search**: Latest news, current information, trends\n\nJust ask me anything!",
+    "who are you": "I'm an AI assistant specializing in financial analysis, SQL database queries, and web searches. I can help you find and analyze information from various sources.",
+    "help": "I'm here to analyze financial documents! You can ask me about: revenue, profits, financial reports, or upload documents for analysis.",
+    "thank you": "You're welcome! 😊 Let me know if you need anything else.",
+    "thanks": "No problem! Happy to help. 👍",
+    "bye": "Goodbye! 👋 Have a great day!",
+    "goodbye": "See you later! 😊 Take care!",
+}
+
+# Whole-query small talk without a dedicated answer
+SIMPLE_PHRASES = [
+    "hi there", "hello there", "how are you doing", "what's up",
+    "good morning", "good afternoon", "good evening",
+    "who created you", "what is your name",
+    "ok", "okay", "yes", "no", "maybe",
+]
+
+VAGUE_PHRASES = [
+    "tell me something", "what's in your", "show me your", "your document", "your documents",
+    "any document", "something about", "anything interesting", "document content",
+    "what documents do you have",
+]
+VAGUE_WORDS = ["document", "something", "anything", "tell", "show", "what"]
+
+# Domain keywords also match their plurals ("filing" -> "filings")
+DOMAIN_KEYWORDS = {
+    "financial": [
+        "revenue", "profit", "earnings", "financial", "finance", "sec", "filing", "10-k", "10-q",
+        "quarter", "annual", "report", "balance", "cash flow", "income", "statement", "ebitda",
+        "margin", "growth", "dividend", "stock", "investment", "portfolio",
+    ],
+    "sql": [
+        "employee", "salary", "salaries", "department", "database", "table", "select",
+        "hr", "human resources", "sql", "payroll", "hired",
+    ],
+    "web": ["news", "latest", "today", "current", "trending", "breaking"],
+}
+RETRIEVAL_DOMAINS = ("financial", "sql")
+
+VAGUE_RESPONSE = ("I'd love to help! Could you please specify what financial information you're looking for? "
+                  "For example: 'What's the revenue for Q4?' or 'Show me profit margins for last year'.")
+UNCLEAR_RESPONSE = "Hi there! 👋 How can I assist you today?"
+QUESTION_WORDS = ("what", "how", "why", "when", "where", "who", "which")
+
+
+class Intent(NamedTuple):
+    intent: str  # smalltalk, vague, unclear, financial, sql, web or general
+    quick_response: Optional[str]  # canned answer; None means the query needs an agent
+    needs_retrieval: bool
+    matches: Tuple[str, ...] = ()
+
+
+class PhraseAutomaton:
+    """Aho-Corasick automaton matching every phrase list in one scan of the query"""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[Tuple[str, str, bool]]] = [[]]
+
+    def add(self, phrase: str, category: str, plural_ok: bool = False):
+        node = 0
+        for char in phrase:
+            if char not in self.goto[node]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[node][char] = len(self.goto) - 1
+            node = self.goto[node][char]
+        self.out[node].append((phrase, category, plural_ok))
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+        return self
+
+    def find(self, text: str) -> List[Tuple[str, str]]:
+        """(phrase, category) pairs found at word boundaries"""
+        found = []
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for phrase, category, plural_ok in self.out[node]:
+                start = end - len(phrase)
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                tail = end
+                while tail < len(text) and text[tail].isalnum():
+                    tail += 1
+                if text[end:tail] and not (plural_ok and text[end:tail] in ("s", "es")):
+                    continue
+                found.append((phrase, category))
+        return found
+
+
+def _build_automaton() -> PhraseAutomaton:
+    automaton = PhraseAutomaton()
+    for phrase in QUICK_RESPONSES:
+        automaton.add(phrase, "quick")
+    for phrase in VAGUE_PHRASES:
+        automaton.add(phrase, "vague")
+    for word in VAGUE_WORDS:
+        automaton.add(word, "vague_word")
+    for domain, keywords in DOMAIN_KEYWORDS.items():
+        for keyword in keywords:
+            automaton.add(keyword, domain, plural_ok=True)
+    return automaton.build()
+
+
+_automaton = _build_automaton()
+_simple_phrases = set(SIMPLE_PHRASES) | set(QUICK_RESPONSES)
+
+
+def _normalize(query: str) -> str:
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+
+@lru_cache(maxsize=4096)
+def classify_intent(query: str) -> Intent:
+    """Classify a query in one pass: intent, canned response and whether to retrieve"""
+    text = _normalize(query)
+    words = text.split()
+    matches = _automaton.find(text)
+    categories = {}
+    for phrase, category in matches:
+        categories.setdefault(category, []).append(phrase)
+    phrases = tuple(phrase for phrase, _ in matches)
+    domains = [domain for domain in DOMAIN_KEYWORDS if domain in categories]
+
+    if text in _simple_phrases:
+        return Intent("smalltalk", QUICK_RESPONSES.get(text, UNCLEAR_RESPONSE), False, phrases)
+
+    if not domains:
+        if "quick" in categories:
+            # Longest greeting wins ("thank you" over "hi")
+            phrase = max(categories["quick"], key=len)
+            return Intent("smalltalk", QUICK_RESPONSES[phrase], False, phrases)
+        if "vague" in categories or (len(words) <= 3 and "vague_word" in categories):
+            return Intent("vague", VAGUE_RESPONSE, False, phrases)
+        if len(words) <= 2 and not text.startswith(QUESTION_WORDS):
+            return Intent("unclear", UNCLEAR_RESPONSE, False, phrases)
+        return Intent("general", None, False, phrases)
+
+    intent = max(domains, key=lambda domain: len(categories[domain]))
+    needs_retrieval = any(domain in categories for domain in RETRIEVAL_DOMAINS)
+    return Intent(intent, None, needs_retrieval, phrases)
+
+
+def should_retrieve_documents(query: str) -> bool:
+    """Determine if we should retrieve documents for this query"""
+    return classify_intent(query).needs_retrieval
+
+
+@metrics.collector
+def _intent_cache_metrics():
+    info = classify_intent.cache_info()
+    for result, value in (("hit", info.hits), ("miss", info.misses)):
+        yield ("lru_cache_requests_total", "counter", "In-process memoized lookups by cache and result",
+               {"cache": "intent", "result": result}, value)
+    yield ("lru_cache_entries", "gauge", "Entries held by in-process memo caches",
+           {"cache": "intent"}, info.currsize)
@@ -0,0 +1,252 @@
+"""
+Chat interaction log.
+
+Records are buffered in memory and written in batches by a background
+thread to LOG_DIR/chat_YYYYMMDD.<pid>.jsonl, one file per worker process,
+so workers never rotate or archive each other's files. A day's file is
+rotated once it passes LOG_MAX_BYTES (chat_YYYYMMDD.<pid>.N.jsonl) and
+rotated files and finished days are gzipped, so a request never waits on
+disk I/O. Analytics read every worker's files.
+
+    python -m services.interaction_log                  # analytics over all logs
+    python -m services.interaction_log --since 20250101 --top 50
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+from utils.config import settings
+from utils.metrics import metrics
+
+
+def iter_log_records(pattern: str = None) -> Iterator[Dict[str, Any]]:
+    """Records of every chat log matching pattern, plain or gzipped"""
+    pattern = pattern or os.path.join(settings.LOG_DIR, "chat_*.jsonl*")
+    for path in sorted(glob.glob(pattern)):
+        yield from _read_file(path)
+
+
+def _read_file(path: str) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+class InteractionLogger:
+    def __init__(self, directory: str = None, flush_interval: float = None, batch_size: int = None,
+                 buffer_max: int = None, max_bytes: int = None, compress: bool = None):
+        self.directory = directory or settings.LOG_DIR
+        self.flush_interval = settings.LOG_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.batch_size = batch_size or settings.LOG_BATCH_SIZE
+        self.buffer_max = buffer_max or settings.LOG_BUFFER_MAX
+        self.max_bytes = max_bytes or settings.LOG_MAX_BYTES
+        self.compress = settings.LOG_COMPRESS if compress is None else compress
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._day = None
+        self.counters = {"logged": 0, "written": 0, "dropped": 0, "batches": 0, "rotations": 0}
+
+    def log(self, record: Dict[str, Any]):
+        """Queue a record; never blocks on disk"""
+        self._ensure_worker()
+        with self._lock:
+            if len(self._buffer) >= self.buffer_max:
+                self.counters["dropped"] += 1
+                return
+            self._buffer.append(record)
+            self.counters["logged"] += 1
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._work, name="interaction-log", daemon=True)
+                    self._thread.start()
+
+    def _work(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Write buffered records (called by the writer thread, and on close)"""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        try:
+            f = self._open()
+            f.write("".join(json.dumps(record) + "\n" for record in batch))
+            f.flush()
+            with self._lock:
+                self.counters["written"] += len(batch)
+                self.counters["batches"] += 1
+            if f.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            with self._lock:
+                self.counters["dropped"] += len(batch)
+            print(f"[LOG] Writing {len(batch)} interaction records failed: {e}")
+
+    def _path(self, day: str, part: int = None) -> str:
+        suffix = f".{part}" if part is not None else ""
+        return os.path.join(self.directory, f"chat_{day}.{os.getpid()}{suffix}.jsonl")
+
+    def _open(self):
+        day = datetime.now().strftime("%Y%m%d")
+        if self._file is not None and day != self._day:
+            # The previous day is complete
+            self._file.close()
+            self._file = None
+            self._archive(self._path(self._day))
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(self._path(day), "a", encoding="utf-8")
+            self._day = day
+        return self._file
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        path = self._path(self._day)
+        part = 1
+        while glob.glob(self._path(self._day, part) + "*"):
+            part += 1
+        rotated = self._path(self._day, part)
+        os.replace(path, rotated)
+        self.counters["rotations"] += 1
+        self._archive(rotated)
+
+    def _archive(self, path: str):
+        if not self.compress or not os.path.exists(path):
+            return
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+
+    def close(self, timeout: float = 5.0):
+        """Flush everything and stop the writer thread"""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join(timeout)
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"buffered": len(self._buffer), **self.counters}
+
+
+interaction_logger = InteractionLogger()
+
+
+@metrics.collector
+def _interaction_log_metrics():
+    stats = interaction_logger.stats()
+    yield "interaction_log_buffered", "gauge", "Interaction records waiting to be written", {}, stats["buffered"]
+    for outcome in ("written", "dropped"):
+        yield ("interaction_log_records_total", "counter", "Interaction records by outcome",
+               {"outcome": outcome}, stats[outcome])
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))], 1)
+
+
+def _aggregate_file(path: str) -> Dict[str, Any]:
+    """Per-file partial aggregates (runs in a worker process)"""
+    from services.coalescer import normalize_query
+
+    queries = Counter()
+    agents = defaultdict(lambda: {"turns": 0, "latency": [], "coalesced": 0, "quick": 0,
+                                  "prompt_tokens": 0, "completion_tokens": 0})
+    for record in _read_file(path):
+        query = normalize_query(record.get("query") or "")
+        if query:
+            queries[query] += 1
+        stats = agents[record.get("agent") or "unknown"]
+        stats["turns"] += 1
+        latency = record.get("latency_ms") or {}
+        if "total" in latency:
+            stats["latency"].append(latency["total"])
+        stats["coalesced"] += bool(record.get("coalesced"))
+        stats["quick"] += bool(record.get("quick_response"))
+        tokens = record.get("tokens") or {}
+        stats["prompt_tokens"] += tokens.get("prompt", 0)
+        stats["completion_tokens"] += tokens.get("completion", 0)
+    return {"queries": queries, "agents": dict(agents)}
+
+
+def analyze(pattern: str = None, since: str = None, top: int = 20, jobs: int = None) -> Dict[str, Any]:
+    """Top queries and per-agent latency percentiles over the chat logs"""
+    pattern = pattern or os.path.join(settings.LOG_DIR, "chat_*.jsonl*")
+    paths = sorted(glob.glob(pattern))
+    if since:
+        paths = [p for p in paths if os.path.basename(p)[5:13] >= since]
+
+    started = time.perf_counter()
+    queries = Counter()
+    agents: Dict[str, Dict[str, Any]] = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for partial in pool.map(_aggregate_file, paths):
+            queries.update(partial["queries"])
+            for agent, stats in partial["agents"].items():
+                total = agents.setdefault(agent, {"turns": 0, "latency": [], "coalesced": 0, "quick": 0,
+                                                  "prompt_tokens": 0, "completion_tokens": 0})
+                for key, value in stats.items():
+                    total[key] += value
+
+    report = {}
+    for agent, stats in sorted(agents.items()):
+        latency = sorted(stats.pop("latency"))
+        report[agent] = {
+            **stats,
+            "with_latency": len(latency),
+            "p50_ms": _percentile(latency, 0.50),
+            "p95_ms": _percentile(latency, 0.95),
+        }
+    return {
+        "files": len(paths),
+        "turns": sum(stats["turns"] for stats in report.values()),
+        "top_queries": queries.most_common(top),
+        "agents": report,
+        "elapsed_s": round(time.perf_counter() - started, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat log analytics")
+    parser.add_argument("--logs", default=None, help="log glob (default: LOG_DIR/chat_*.jsonl*)")
+    parser.add_argument("--since", default=None, help="first day to include, YYYYMMDD")
+    parser.add_argument("--top", type=int, default=20, help="number of top queries")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes")
+    args = parser.parse_args()
+    print(json.dumps(analyze(args.logs, args.since, args.top, args.jobs), indent=2, ensure_ascii=False))
@@ -0,0 +1,258 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from utils.config import settings
+from utils.deadline import deadline_scope
+from utils.metrics import metrics
+
+# Progress handler of the job running in the current context; LangChain adds
+# it to every run started there, including each LangGraph node
+_job_progress: ContextVar[Optional[BaseCallbackHandler]] = ContextVar("job_progress", default=None)
+register_configure_hook(_job_progress, inheritable=True)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobProgressHandler(BaseCallbackHandler):
+    """Turns LangGraph node start/end callbacks into job progress events"""
+
+    def __init__(self, manager: "JobManager", task_id: str):
+        self.manager = manager
+        self.task_id = task_id
+        self._nodes: Dict[Any, str] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Nested runnables named after their node are part of the same step
+        if node and kwargs.get("name") == node and self._nodes.get(parent_run_id) != node:
+            self._nodes[run_id] = node
+            self.manager.add_event(self.task_id, "node_start", node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        node = self._nodes.pop(run_id, None)
+        if node:
+            self.manager.add_event(self.task_id, "node_end", node)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        node = self._nodes.pop(run_id, None)
+        if node:
+            self.manager.add_event(self.task_id, "node_error", node)
+
+
+class JobManager:
+    """
+    Background chat jobs: an in-process worker pool plus a SQLite job table.
+
+    Jobs carry per-node progress events and can be cancelled; cancelling
+    expires the job's deadline, so LLM streams are closed and the graph
+    stops at its next node.
+
+    Several worker processes can share the table: a job is claimed by one
+    of them (its pid is the owner), a cancel issued on another worker is
+    noticed at the job's next progress event, and on startup only jobs
+    whose owner process is gone are requeued.
+    """
+
+    def __init__(self, db_path: str = None, max_workers: int = None):
+        self.db_path = db_path or settings.JOBS_DB
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or settings.JOB_WORKERS,
+                                            thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._deadlines = {}
+        self._handlers: Dict[str, Callable] = {}
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    task_id TEXT PRIMARY KEY,
+                    kind TEXT,
+                    status TEXT,
+                    payload TEXT,
+                    progress TEXT DEFAULT '[]',
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    updated_at REAL,
+                    owner INTEGER
+                )
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """Register the function that runs jobs of a kind; it gets the payload, returns a result"""
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        task_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO jobs (task_id, kind, status, payload, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (task_id, kind, json.dumps(payload), now, now)
+            )
+            self._conn.commit()
+        self._executor.submit(self._run, task_id)
+        return task_id
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db().execute("SELECT * FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "task_id": row["task_id"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"] or "[]"),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+
+    def cancel(self, task_id: str) -> bool:
+        """Cancel a queued or running job; False if it already finished"""
+        with self._lock:
+            cursor = self._db().execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE task_id = ? AND status IN (?, ?)",
+                (time.time(), task_id, *ACTIVE_STATUSES)
+            )
+            self._conn.commit()
+            deadline = self._deadlines.get(task_id)
+        if deadline is not None:
+            deadline.cancel()
+        return cursor.rowcount > 0
+
+    def add_event(self, task_id: str, event: str, node: str):
+        with self._lock:
+            row = self._db().execute("SELECT status, progress FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                return
+            if row["status"] == "cancelled":
+                # Cancelled through another worker
+                deadline = self._deadlines.get(task_id)
+                if deadline is not None:
+                    deadline.cancel()
+                return
+            progress: List = json.loads(row["progress"] or "[]")
+            progress.append({"event": event, "node": node, "at": time.time()})
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE task_id = ?",
+                (json.dumps(progress), time.time(), task_id)
+            )
+            self._conn.commit()
+
+    def _set_status(self, task_id: str, status: str, result=None, error: str = None, only_if: str = None):
+        with self._lock:
+            query = "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, owner = ? WHERE task_id = ?"
+            params = [status, json.dumps(result) if result is not None else None, error, time.time(),
+                      os.getpid(), task_id]
+            if only_if:
+                query += " AND status = ?"
+                params.append(only_if)
+            cursor = self._db().execute(query, params)
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def _run(self, task_id: str):
+        with self._lock:
+            row = self._db().execute("SELECT kind, payload FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None or not self._set_status(task_id, "running", only_if="queued"):
+            return  # cancelled while queued
+
+        token = _job_progress.set(JobProgressHandler(self, task_id))
+        try:
+            with deadline_scope(settings.JOB_TIMEOUT_SECONDS) as deadline:
+                with self._lock:
+                    self._deadlines[task_id] = deadline
+                result = self._handlers[row["kind"]](json.loads(row["payload"]))
+            self._set_status(task_id, "completed", result=result, only_if="running")
+        except Exception as e:
+            self._set_status(task_id, "failed", error=str(e), only_if="running")
+        finally:
+            _job_progress.reset(token)
+            with self._lock:
+                self._deadlines.pop(task_id, None)
+
+    def recover(self) -> int:
+        """
+        Requeue jobs interrupted by a restart (chat turns resume from their
+        checkpoints). Jobs still running in another live worker are left alone;
+        queued ones are claimed by whichever worker gets to them first.
+        """
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT task_id, status, owner FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES
+            ).fetchall()
+            orphaned = [row["task_id"] for row in rows
+                        if row["status"] == "running" and not _pid_alive(row["owner"])]
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE task_id = ? AND status = 'running'",
+                [(time.time(), task_id) for task_id in orphaned]
+            )
+            self._conn.commit()
+        task_ids = [row["task_id"] for row in rows if row["status"] == "queued"] + orphaned
+        for task_id in task_ids:
+            self._executor.submit(self._run, task_id)
+        return len(task_ids)
+
+    def cleanup(self, max_age_hours: float = None) -> int:
+        """Delete finished jobs older than the retention period"""
+        max_age_hours = settings.JOB_RETENTION_HOURS if max_age_hours is None else max_age_hours
+        with self._lock:
+            cursor = self._db().execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated_at < ?",
+                (*ACTIVE_STATUSES, time.time() - max_age_hours * 3600)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._db().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager()
+
+
+@metrics.collector
+def _job_metrics():
+    for status, count in job_manager.counts().items():
+        yield "jobs", "gauge", "Background jobs by status", {"status": status}, count
@@ -0,0 +1,272 @@
+"""
+Embedding-based nearest-centroid query router.
+
+Labelled example queries per agent are embedded once and averaged into one
+normalised centroid per agent. A query is classified with one (cached)
+embedding lookup and a dot product against the centroids; the LLM router is
+only consulted when the margin between the two best agents is small.
+
+    python -m services.query_router --report     # leave-one-out accuracy / latency
+    python -m services.query_router --retrain    # add labelled turns from logs/chat_*.jsonl*
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.config import settings
+from utils.metrics import metrics
+from utils.startup import lazy_resource
+
+EXAMPLES_FILE = os.path.join(os.path.dirname(__file__), "router_examples.json")
+LABELS = ["financial", "sql", "web", "general"]
+# Log entries whose agent label can be trusted as ground truth
+TRUSTED_ROUTE_SOURCES = {"llm", "forced"}
+
+
+def _load_examples(path: str = EXAMPLES_FILE) -> Dict[str, List[str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _hash_examples(examples: Dict[str, List[str]]) -> str:
+    return hashlib.sha1(json.dumps(examples, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _embeddings():
+    from utils import embeddings
+    return embeddings
+
+
+@lru_cache(maxsize=4096)
+def _embed_query(text: str) -> Tuple[float, ...]:
+    return tuple(_embeddings().embed_query(text))
+
+
+@metrics.collector
+def _router_embedding_cache_metrics():
+    info = _embed_query.cache_info()
+    for result, value in (("hit", info.hits), ("miss", info.misses)):
+        yield ("lru_cache_requests_total", "counter", "In-process memoized lookups by cache and result",
+               {"cache": "router_embedding", "result": result}, value)
+    yield ("lru_cache_entries", "gauge", "Entries held by in-process memo caches",
+           {"cache": "router_embedding"}, info.currsize)
+
+
+class CentroidRouter:
+    """Nearest-centroid classifier over agent example embeddings"""
+
+    def __init__(self, cache_path: str = None, min_margin: float = None):
+        self.cache_path = cache_path or settings.ROUTER_CACHE
+        self.min_margin = settings.ROUTER_MIN_MARGIN if min_margin is None else min_margin
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.stats = {"classified": 0, "llm_fallbacks": 0}
+        self._lock = threading.Lock()
+        # Counters are bumped from agent executor threads; kept off the (slow) load lock
+        self._stats_lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self.centroids is None:
+            with self._lock:
+                if self.centroids is None:
+                    self._load_or_build()
+
+    def _load_or_build(self):
+        base_hash = _hash_examples(_load_examples())
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            if cache.get("model") == settings.EMBEDDING_MODEL and cache.get("base_hash") == base_hash:
+                self.labels = cache["labels"]
+                self.centroids = np.array(cache["centroids"], dtype=np.float32)
+                return
+        self.train(_load_examples())
+
+    def train(self, examples: Dict[str, List[str]]):
+        """Embed labelled examples, compute centroids and persist them"""
+        started = time.perf_counter()
+        labels = [label for label in LABELS if examples.get(label)]
+        centroids = []
+        for label in labels:
+            vectors = _normalize(np.array(_embeddings().embed_documents(examples[label]), dtype=np.float32))
+            centroids.append(vectors.mean(axis=0))
+
+        self.labels = labels
+        self.centroids = _normalize(np.array(centroids))
+
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": settings.EMBEDDING_MODEL,
+                "base_hash": _hash_examples(_load_examples()),
+                "examples": {label: len(examples[label]) for label in labels},
+                "labels": labels,
+                "centroids": self.centroids.tolist()
+            }, f)
+        print(f"[ROUTER] Trained centroids for {labels} in {time.perf_counter() - started:.2f}s")
+
+    def scores(self, query: str) -> Dict[str, float]:
+        self._ensure_loaded()
+        vector = _normalize(np.array(_embed_query(query.strip().lower()), dtype=np.float32))
+        return dict(zip(self.labels, (self.centroids @ vector).tolist()))
+
+    def classify(self, query: str, llm_fallback: bool = True) -> Tuple[str, float, str]:
+        """
+        Return (agent, margin, source) where source is 'centroid', 'llm' or 'keywords'.
+        Without `llm_fallback`, a close call returns the best centroid with source
+        'ambiguous', for the caller to settle with `resolve` later.
+        """
+        with self._stats_lock:
+            self.stats["classified"] += 1
+        try:
+            ranked = sorted(self.scores(query).items(), key=lambda item: item[1], reverse=True)
+        except Exception as e:
+            print(f"[ROUTER] Embedding failed, using keywords: {e}")
+            return keyword_route(query), 0.0, "keywords"
+
+        (best, best_score), (_, second_score) = ranked[0], ranked[1]
+        margin = best_score - second_score
+        if margin >= self.min_margin:
+            return best, margin, "centroid"
+        if not llm_fallback:
+            return best, margin, "ambiguous"
+        agent, source = self.resolve(query, best)
+        return agent, margin, source
+
+    def resolve(self, query: str, best: str) -> Tuple[str, str]:
+        """Ask the router LLM to settle a close call; returns (agent, source)"""
+        with self._stats_lock:
+            self.stats["llm_fallbacks"] += 1
+        try:
+            from models.schemas import RouterDecision
+            from utils.llm_calls import call_llm
+            decision = call_llm("router", query, schema=RouterDecision, stage="route")
+            agent = decision.agent.strip().lower()
+            if agent in self.labels:
+                return agent, "llm"
+        except Exception as e:
+            print(f"[ROUTER] LLM fallback failed: {e}")
+        return best, "centroid"
+
+
+def keyword_route(message: str) -> str:
+    """Keyword router used when embeddings are unavailable"""
+    message_lower = message.lower()
+    financial_keywords = [
+        "stock", "price", "market", "investment", "portfolio",
+        "finance", "financial", "revenue", "profit", "loss",
+        "dividend", "trading", "buy", "sell", "hold", "analysis"
+    ]
+    if any(keyword in message_lower for keyword in financial_keywords):
+        return "financial"
+    return "general"
+
+
+def examples_from_logs(pattern: str = "logs/chat_*.jsonl*") -> Dict[str, List[str]]:
+    """Collect trusted (LLM-routed or user-forced) labelled queries from chat logs"""
+    from services.interaction_log import iter_log_records
+
+    examples = {label: [] for label in LABELS}
+    for entry in iter_log_records(pattern):
+        label = entry.get("route")
+        if entry.get("route_source") in TRUSTED_ROUTE_SOURCES and label in examples:
+            query = (entry.get("query") or "").strip()
+            if query and query not in examples[label]:
+                examples[label].append(query)
+    return examples
+
+
+def retrain_from_logs(pattern: str = "logs/chat_*.jsonl*") -> Dict[str, int]:
+    examples = _load_examples()
+    from_logs = examples_from_logs(pattern)
+    for label, queries in from_logs.items():
+        examples.setdefault(label, [])
+        examples[label].extend(q for q in queries if q not in examples[label])
+    router.train(examples)
+    return {label: len(queries) for label, queries in from_logs.items()}
+
+
+def evaluate(examples: Dict[str, List[str]] = None) -> Dict:
+    """Leave-one-out accuracy of the centroid router plus classification latency"""
+    examples = examples or _load_examples()
+    labels = [label for label in LABELS if examples.get(label)]
+    vectors = {label: _normalize(np.array(_embeddings().embed_documents(examples[label]), dtype=np.float32))
+               for label in labels}
+    sums = {label: vectors[label].sum(axis=0) for label in labels}
+
+    correct, total, low_margin = 0, 0, 0
+    per_label = {}
+    started = time.perf_counter()
+    for label in labels:
+        hits = 0
+        for i, vector in enumerate(vectors[label]):
+            centroids = []
+            for other in labels:
+                total_vec, count = sums[other], len(vectors[other])
+                if other == label:
+                    total_vec, count = total_vec - vector, count - 1
+                centroids.append(total_vec / max(count, 1))
+            scores = _normalize(np.array(centroids)) @ vector
+            order = np.argsort(scores)[::-1]
+            if scores[order[0]] - scores[order[1]] < router.min_margin:
+                low_margin += 1
+            if labels[order[0]] == label:
+                hits += 1
+        per_label[label] = round(hits / len(vectors[label]), 3)
+        correct += hits
+        total += len(vectors[label])
+    dot_ms = (time.perf_counter() - started) * 1000 / max(total, 1)
+
+    query = examples[labels[0]][0]
+    _embed_query.cache_clear()
+    t0 = time.perf_counter()
+    router.classify(query)
+    cold_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    router.classify(query)
+    warm_ms = (time.perf_counter() - t0) * 1000
+
+    return {
+        "examples": total,
+        "accuracy": round(correct / total, 3),
+        "per_label_accuracy": per_label,
+        "llm_fallback_rate": round(low_margin / total, 3),
+        "classify_ms_uncached_embedding": round(cold_ms, 2),
+        "classify_ms_cached_embedding": round(warm_ms, 3),
+        "leave_one_out_ms_per_query": round(dot_ms, 3)
+    }
+
+
+router = CentroidRouter()
+
+
+@lazy_resource("router_centroids")
+def load_router() -> CentroidRouter:
+    """Load (or train) the router centroids; needs the embedding model if the cache is stale"""
+    router._ensure_loaded()
+    return router
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding router maintenance")
+    parser.add_argument("--report", action="store_true", help="print accuracy/latency report")
+    parser.add_argument("--retrain", action="store_true", help="retrain with labelled turns from chat logs")
+    parser.add_argument("--logs", default="logs/chat_*.jsonl*", help="chat log glob for --retrain")
+    args = parser.parse_args()
+
+    if args.retrain:
+        print(json.dumps({"added_from_logs": retrain_from_logs(args.logs)}, indent=2))
+    if args.report or not args.retrain:
+        print(json.dumps(evaluate(), indent=2))
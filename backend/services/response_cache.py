@@ -1,37 +1,39 @@
-from typing import Optional
+from typing import Optional, Tuple
+
+from utils.config import settings
+from utils.corpus import corpus_version
+from utils.shared_state import shared_state
+
+from .coalescer import normalize_query
+from .intent import classify_intent
 
 
 def get_quick_response(query: str) -> Optional[str]:
     """Get quick response text for common queries"""
-    query_lower = query.lower().strip()
-    
-    QUICK_RESPONSES = {
-        "hi": "Hello! 👋 I'm your AI assistant. How can I help you today?",
-        "hello": "Hi there! 😊 I'm ready to assist you with financial analysis, database queries, or web searches. What would you like to know?",
-        "hey": "Hey! 👋 What can I do for you today?",
-        "how are you": "I'm doing great, thanks for asking! Ready to help you with any questions you might have.",
-        "what can you do": "I can help you with:\n\n• **Financial Analysis**: SEC filings, revenue reports, earnings data\n• **SQL Queries**: Employee database, salary information, HR data\n• **Web Search**: Latest news, current information, trends\n\nJust ask me anything!",
-        "who are you": "I'm an AI assistant specializing in financial analysis, SQL database queries, and web searches. I can help you find and analyze information from various sources.",
-        "thank you": "You're welcome! 😊 Let me know if you need anything else.",
-        "thanks": "No problem! Happy to help. 👍",
-        "bye": "Goodbye! 👋 Have a great day!",
-        "goodbye": "See you later! 😊 Take care!"
-    }
-    
-    # Exact matches
-    if query_lower in QUICK_RESPONSES:
-        return QUICK_RESPONSES[query_lower]
-    
-    # Partial matches
-    for key, response in QUICK_RESPONSES.items():
-        if key in query_lower:
-            return response
-    
-    # Very short queries (1-2 words) that aren't specific
-    if len(query_lower.split()) <= 2:
-        # Check if it's not asking for specific information
-        question_words = ['what', 'how', 'why', 'when', 'where', 'who', 'which']
-        if not any(query_lower.startswith(word) for word in question_words):
-            return "Hi there! 👋 How can I assist you today?"
-    
-    return None
\ No newline at end of file
+    return classify_intent(query).quick_response
+
+
+def _answer_key(agent: str, query: str) -> str:
+    # Document answers go stale when the corpus changes
+    version = corpus_version() if agent == "financial" else 0
+    return f"answer:{agent}:{version}:{normalize_query(query)}"
+
+
+def remember_answer(agent: str, query: str, response: str):
+    """Keep the last good answer to a standalone question, for when the models are unavailable"""
+    shared_state.set(_answer_key(agent, query), response, ttl=settings.ANSWER_CACHE_TTL)
+
+
+def get_cached_answer(agent: str, query: str) -> Optional[str]:
+    return shared_state.get(_answer_key(agent, query))
+
+
+def get_fallback_answer(agent: str, query: str) -> Tuple[Optional[str], Optional[str]]:
+    """Cheapest answer that needs no model call: (text, "quick_response" | "cached_answer") or (None, None)"""
+    quick = get_quick_response(query)
+    if quick:
+        return quick, "quick_response"
+    cached = get_cached_answer(agent, query)
+    if cached:
+        return cached, "cached_answer"
+    return None, None
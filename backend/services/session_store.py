@@ -0,0 +1,413 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.config import settings
+
+AGENT_COUNTS = {"financial": 0, "llm": 0, "simple": 0}
+# Rough per-turn bookkeeping overhead (dict, timestamps, agent name)
+TURN_OVERHEAD_BYTES = 200
+
+
+def _turn_size(turn: Dict[str, Any]) -> int:
+    return len(turn["query"].encode("utf-8")) + len(turn["response"].encode("utf-8")) + TURN_OVERHEAD_BYTES
+
+
+class SessionStore(ABC):
+    """
+    Chat session storage: metadata, agent counts and paged turn history.
+
+    Stores call the registered eviction callbacks with the session ID when a
+    session expires or is evicted, so per-session state elsewhere (history
+    summaries) is released too.
+    """
+
+    # True when every worker process sees the same sessions
+    shared = False
+
+    def __init__(self, ttl_seconds: float = None):
+        self.ttl_seconds = settings.SESSION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._on_evict: List[Callable[[str], None]] = []
+
+    def on_evict(self, callback: Callable[[str], None]):
+        self._on_evict.append(callback)
+
+    def _evicted(self, session_ids: List[str]):
+        for session_id in session_ids:
+            for callback in self._on_evict:
+                try:
+                    callback(session_id)
+                except Exception as e:
+                    print(f"[SESSIONS] Eviction callback failed for {session_id}: {e}")
+
+    def get_or_create(self, session_id: Optional[str]) -> str:
+        """Return session_id if it exists, else create a new session"""
+        if session_id and self.exists(session_id):
+            return session_id
+        return self.create()
+
+    @abstractmethod
+    def create(self, session_id: str = None) -> str:
+        """Create a session and return its ID"""
+        pass
+
+    @abstractmethod
+    def exists(self, session_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def add_turn(self, session_id: str, query: str, response: str, agent: str):
+        pass
+
+    @abstractmethod
+    def get(self, session_id: str, offset: int = 0, limit: int = None) -> Optional[Dict[str, Any]]:
+        """Session info with one page of history (oldest first), or None"""
+        pass
+
+    def recent_turns(self, session_id: str, limit: int) -> Tuple[int, List[Tuple[str, str]]]:
+        """Total turn count and the last `limit` (query, response) pairs"""
+        session = self.get(session_id, 0, 1)
+        if session is None:
+            return 0, []
+        total = session["total_turns"]
+        page = self.get(session_id, max(0, total - limit), limit) if total else session
+        return total, [(turn["query"], turn["response"]) for turn in page["history"]]
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def cleanup(self) -> int:
+        """Drop expired sessions; returns how many were removed"""
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU store bounded by session count and history bytes, with idle TTL"""
+
+    def __init__(self, max_sessions: int = None, max_bytes: int = None, ttl_seconds: float = None):
+        super().__init__(ttl_seconds)
+        self.max_sessions = max_sessions or settings.SESSION_MAX_COUNT
+        self.max_bytes = max_bytes or settings.SESSION_MAX_BYTES
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def _expired(self, session: Dict[str, Any], now: float) -> bool:
+        return now - session["last_access"] > self.ttl_seconds
+
+    def _touch(self, session_id: str, expired: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a live session and mark it most recently used (caller holds the lock).
+
+        A session found expired is removed and its ID appended to `expired`;
+        the caller fires the eviction callbacks once the lock is released.
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.time()
+        if self._expired(session, now):
+            self._remove(session_id)
+            expired.append(session_id)
+            return None
+        session["last_access"] = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _remove(self, session_id: str) -> Dict[str, Any]:
+        session = self._sessions.pop(session_id)
+        self._bytes -= session["bytes"]
+        return session
+
+    def _evict_over_budget(self) -> List[str]:
+        """Evict least recently used sessions until both limits hold (caller holds the lock)"""
+        evicted = []
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            session_id = next(iter(self._sessions))
+            self._remove(session_id)
+            evicted.append(session_id)
+        self._evictions += len(evicted)
+        return evicted
+
+    def create(self, session_id: str = None) -> str:
+        session_id = session_id or str(uuid.uuid4())
+        with self._lock:
+            if session_id in self._sessions:
+                self._remove(session_id)
+            self._sessions[session_id] = {
+                "history": [],
+                "created_at": datetime.now().isoformat(),
+                "agent_counts": dict(AGENT_COUNTS),
+                "last_access": time.time(),
+                "bytes": 0
+            }
+            evicted = self._evict_over_budget()
+        self._evicted(evicted)
+        return session_id
+
+    def exists(self, session_id: str) -> bool:
+        expired = []
+        with self._lock:
+            session = self._touch(session_id, expired)
+        self._evicted(expired)
+        return session is not None
+
+    def add_turn(self, session_id: str, query: str, response: str, agent: str):
+        turn = {
+            "query": query,
+            "response": response,
+            "agent": agent,
+            "timestamp": datetime.now().isoformat()
+        }
+        if not self.exists(session_id):
+            self.create(session_id)
+        expired = []
+        with self._lock:
+            session = self._touch(session_id, expired)
+            if session is None:
+                evicted = []
+            else:
+                size = _turn_size(turn)
+                session["history"].append(turn)
+                session["agent_counts"][agent] = session["agent_counts"].get(agent, 0) + 1
+                session["bytes"] += size
+                self._bytes += size
+                # A single session larger than the whole budget keeps only its newest turns
+                while len(session["history"]) > 1 and session["bytes"] > self.max_bytes:
+                    dropped = _turn_size(session["history"].pop(0))
+                    session["bytes"] -= dropped
+                    self._bytes -= dropped
+                evicted = self._evict_over_budget()
+        self._evicted(expired + evicted)
+
+    def get(self, session_id: str, offset: int = 0, limit: int = None) -> Optional[Dict[str, Any]]:
+        limit = limit or settings.SESSION_PAGE_SIZE
+        expired = []
+        with self._lock:
+            session = self._touch(session_id, expired)
+            if session is not None:
+                page = {
+                    "session_id": session_id,
+                    "history": [dict(turn) for turn in session["history"][offset:offset + limit]],
+                    "total_turns": len(session["history"]),
+                    "offset": offset,
+                    "limit": limit,
+                    "agent_counts": dict(session["agent_counts"]),
+                    "created_at": session["created_at"]
+                }
+        self._evicted(expired)
+        return page if session is not None else None
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+        return True
+
+    def cleanup(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if self._expired(session, now)]
+            for session_id in expired:
+                self._remove(session_id)
+        self._evicted(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "evictions": self._evictions
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite-backed store; history is paged from disk so memory stays flat.
+    Worker processes sharing the database file see the same sessions.
+    """
+
+    shared = True
+
+    def __init__(self, db_path: str = None, ttl_seconds: float = None):
+        super().__init__(ttl_seconds)
+        self.db_path = db_path or settings.SESSION_DB
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    created_at TEXT,
+                    last_access REAL,
+                    agent_counts TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_turns (
+                    session_id TEXT,
+                    seq INTEGER,
+                    query TEXT,
+                    response TEXT,
+                    agent TEXT,
+                    timestamp TEXT,
+                    PRIMARY KEY (session_id, seq)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def create(self, session_id: str = None) -> str:
+        session_id = session_id or str(uuid.uuid4())
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, created_at, last_access, agent_counts) VALUES (?, ?, ?, ?)",
+                (session_id, datetime.now().isoformat(), time.time(), json.dumps(AGENT_COUNTS))
+            )
+            conn.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+            conn.commit()
+        return session_id
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            conn = self._db()
+            cursor = conn.execute(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ? AND last_access >= ?",
+                (time.time(), session_id, time.time() - self.ttl_seconds)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def add_turn(self, session_id: str, query: str, response: str, agent: str):
+        if not self.exists(session_id):
+            self.create(session_id)
+        with self._lock:
+            conn = self._db()
+            # Take the write lock before reading, so concurrent workers don't lose counts
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT agent_counts FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                counts = json.loads(row["agent_counts"]) if row else dict(AGENT_COUNTS)
+                counts[agent] = counts.get(agent, 0) + 1
+                conn.execute(
+                    "INSERT INTO session_turns (session_id, seq, query, response, agent, timestamp) "
+                    "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ?, ? FROM session_turns WHERE session_id = ?",
+                    (session_id, query, response, agent, datetime.now().isoformat(), session_id)
+                )
+                conn.execute(
+                    "UPDATE sessions SET agent_counts = ?, last_access = ? WHERE session_id = ?",
+                    (json.dumps(counts), time.time(), session_id)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def get(self, session_id: str, offset: int = 0, limit: int = None) -> Optional[Dict[str, Any]]:
+        limit = limit or settings.SESSION_PAGE_SIZE
+        if not self.exists(session_id):
+            return None
+        with self._lock:
+            conn = self._db()
+            row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            total = conn.execute(
+                "SELECT COUNT(*) FROM session_turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            turns = conn.execute(
+                "SELECT query, response, agent, timestamp FROM session_turns WHERE session_id = ? "
+                "ORDER BY seq LIMIT ? OFFSET ?",
+                (session_id, limit, offset)
+            ).fetchall()
+        return {
+            "session_id": session_id,
+            "history": [dict(turn) for turn in turns],
+            "total_turns": total,
+            "offset": offset,
+            "limit": limit,
+            "agent_counts": json.loads(row["agent_counts"]),
+            "created_at": row["created_at"]
+        }
+
+    def recent_turns(self, session_id: str, limit: int) -> Tuple[int, List[Tuple[str, str]]]:
+        with self._lock:
+            conn = self._db()
+            total = conn.execute(
+                "SELECT COUNT(*) FROM session_turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            rows = conn.execute(
+                "SELECT query, response FROM session_turns WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return total, [(row["query"], row["response"]) for row in reversed(rows)]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            conn = self._db()
+            cursor = conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+            conn.commit()
+        return cursor.rowcount > 0
+
+    def cleanup(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            conn = self._db()
+            expired = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (cutoff,)
+            )]
+            conn.executemany("DELETE FROM session_turns WHERE session_id = ?", [(sid,) for sid in expired])
+            conn.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,))
+            conn.commit()
+        self._evicted(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._db()
+            sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            turns = conn.execute("SELECT COUNT(*) FROM session_turns").fetchone()[0]
+        return {"backend": "sqlite", "sessions": sessions, "turns": turns}
+
+
+def create_session_store(backend: str = None) -> SessionStore:
+    backend = (backend or settings.SESSION_STORE).lower()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown session store backend: {backend}")
+
+
+session_store = create_session_store()
@@ -3,11 +3,11 @@ import operator
 from langchain.agents import create_agent
 from langchain_core.messages import SystemMessage
 from tools.sql_tools import ALL_SQL_TOOLS
-from langchain_ollama import ChatOllama
+from utils.config import settings
+from utils.model_registry import chat_model
 
-LLM_MODEL = "qwen3"
-BASE_URL = "http://localhost:11434"
-llm = ChatOllama(model=LLM_MODEL, base_url=BASE_URL)
+LLM_MODEL = settings.OLLAMA_MODEL
+llm = chat_model(LLM_MODEL)
 
 class AgentState(TypedDict):
     messages: Annotated[List, operator.add]
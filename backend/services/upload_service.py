@@ -5,7 +5,7 @@ from pathlib import Path
 from datetime import datetime
 
 from tools.document_processor import DocumentUploader as BaseUploader
-from langchain_ollama import ChatOllama
+from utils.model_registry import chat_model
 
 class DocumentUploader(BaseUploader):
     """Extended document uploader with metadata management"""
@@ -14,7 +14,7 @@ class DocumentUploader(BaseUploader):
         super().__init__()
         self.metadata_dir = Path("document_metadata")
         self.metadata_dir.mkdir(exist_ok=True)
-        self.llm = ChatOllama(model="qwen3", base_url="http://localhost:11434")
+        self.llm = chat_model()
     
     def save_metadata(self, doc_id: str, filename: str, result: Dict[str, Any]):
         """Save document metadata to file"""
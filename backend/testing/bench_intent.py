@@ -0,0 +1,118 @@
+# File: bench_intent.py
+# Benchmark the single-pass intent classifier against the phrase checks it replaced.
+# Run from backend/: python testing/bench_intent.py
+import sys
+import time
+
+sys.path.append('.')
+
+from services.intent import classify_intent
+
+QUERIES = [
+    "hi", "hello", "how are you?", "thanks", "bye", "what can you do?",
+    "tell me something your document", "what's in your documents",
+    "What was Amazon revenue 2023?", "show me apples net income for 2022",
+    "what amazon revenue in q4 2023", "How many employees work in engineering?",
+    "average salary by department", "Latest AI news", "financuak",
+    "what is project i build doing", "explain the difference between a stock and a bond",
+    "Compare Google and Amazon operating income and free cash flow in the 2024 annual report",
+]
+
+# Legacy phrase checks, kept verbatim for comparison
+QUICK_RESPONSES = {
+    "hi": "...", "hello": "...", "hey": "...", "how are you": "...", "what can you do": "...",
+    "who are you": "...", "thank you": "...", "thanks": "...", "bye": "...", "goodbye": "..."
+}
+
+def legacy_get_quick_response(query):
+    query_lower = query.lower().strip()
+    if query_lower in QUICK_RESPONSES:
+        return QUICK_RESPONSES[query_lower]
+    for key, response in QUICK_RESPONSES.items():
+        if key in query_lower:
+            return response
+    if len(query_lower.split()) <= 2:
+        question_words = ['what', 'how', 'why', 'when', 'where', 'who', 'which']
+        if not any(query_lower.startswith(word) for word in question_words):
+            return "Hi there!"
+    return None
+
+def legacy_should_retrieve_documents(query):
+    query_lower = query.lower().strip()
+    simple_phrases = [
+        "hi", "hello", "hey", "hi there", "hello there",
+        "how are you", "how are you doing", "what's up",
+        "good morning", "good afternoon", "good evening",
+        "thanks", "thank you", "bye", "goodbye",
+        "who are you", "what can you do", "help",
+        "who created you", "what is your name",
+        "ok", "okay", "yes", "no", "maybe"
+    ]
+    vague_doc_phrases = [
+        "tell me something in your document", "what's in your document",
+        "show me your document", "document content",
+        "what documents do you have", "your documents"
+    ]
+    if query_lower in simple_phrases:
+        return False
+    if any(phrase in query_lower for phrase in vague_doc_phrases):
+        return False
+    if len(query.split()) <= 3:
+        vague_words = ['document', 'something', 'anything', 'tell', 'show', 'what']
+        if any(word in query_lower for word in vague_words):
+            return False
+    financial_keywords = ['revenue', 'profit', 'earnings', 'financial', 'sec', 'filing',
+                         'quarter', 'annual', 'report', 'balance', 'cash flow', 'income',
+                         'statement', 'ebitda', 'margin', 'growth']
+    sql_keywords = ['employee', 'salary', 'department', 'database', 'query', 'table',
+                   'select', 'employees', 'hr', 'human resources', 'sql', 'query']
+    if any(keyword in query_lower for keyword in financial_keywords + sql_keywords):
+        return True
+    if query_lower.startswith(('what is', 'how much', 'how many', 'what are')):
+        number_words = ['revenue', 'profit', 'salary', 'employees', 'cost', 'price']
+        if any(word in query_lower for word in number_words):
+            return True
+    return False
+
+def legacy_is_simple_query(query):
+    # Keyword part only; the legacy version also made an LLM call here
+    query_lower = query.lower().strip()
+    simple = ["hi", "hello", "how are you", "bye", "thank you", "what can you do", "help"]
+    for key in simple:
+        if key in query_lower and query_lower.split()[0] == key:
+            return True
+    vague_patterns = ["tell me something", "what's in your", "show me your", "your document",
+                      "any document", "something about", "anything interesting"]
+    if any(pattern in query_lower for pattern in vague_patterns):
+        return True
+    return len(query.split()) <= 2 and not any(
+        word in query_lower for word in ['revenue', 'profit', 'financial', 'document', 'report'])
+
+def legacy_all(query):
+    # The legacy pipeline evaluates every check (retrieve_node, route_after_retrieve,
+    # grade_documents_node, generate_node and FinancialAgent each repeat one)
+    legacy_is_simple_query(query)
+    legacy_should_retrieve_documents(query)
+    legacy_should_retrieve_documents(query)
+    legacy_should_retrieve_documents(query)
+    legacy_get_quick_response(query)
+
+def bench(func, rounds=2000):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for query in QUERIES:
+            func(query)
+    return (time.perf_counter() - start) / (rounds * len(QUERIES)) * 1e6
+
+if __name__ == "__main__":
+    print("📊 Intent classification benchmark (µs per query)")
+    print(f"   legacy checks (keywords only):  {bench(legacy_all):.2f}")
+    print(f"   classify_intent (uncached):     {bench(classify_intent.__wrapped__):.2f}")
+    print(f"   classify_intent (cached):       {bench(classify_intent):.2f}")
+    print("   legacy _is_simple_query also made one LLM call per non-trivial query (~0.5-5 s)")
+    print()
+    print(f"{'query':<60} {'intent':<10} {'retrieve':<9} legacy_retrieve")
+    for query in QUERIES:
+        intent = classify_intent(query)
+        print(f"{query[:58]:<60} {intent.intent:<10} {str(intent.needs_retrieval):<9} "
+              f"{legacy_should_retrieve_documents(query)}")
@@ -0,0 +1,253 @@
+# File: bench_prompt_prefix.py
+# Benchmark prompt prefill with the old prompt layouts (query inside or ahead of the static
+# instructions) against the current ones (static prefix first, variable content last).
+# A stand-in Ollama models the runner's prompt cache: OLLAMA_NUM_PARALLEL slots per model,
+# each request reuses the longest token prefix cached in any slot and only the remaining
+# tokens are prefilled, at PREFILL_TOKENS_PER_S (slept for real).
+# Run from backend/: python testing/bench_prompt_prefix.py
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append('.')
+
+NUM_SLOTS = 4
+PREFILL_TOKENS_PER_S = 2000.0
+
+QUERIES = [
+    "What was Amazon revenue in Q2 2025?", "Apple net income 2023 annual report",
+    "Tesla operating margin Q3 2024", "Microsoft free cash flow 2024",
+    "Nvidia data center revenue growth Q1 2025", "Google total assets in the 2023 10-K",
+    "Meta capital expenditures 2024", "Amazon AWS operating income Q4 2024",
+    "Apple gross margin Q2 2024", "Tesla cash and cash equivalents 2023",
+    "Microsoft cloud revenue Q3 2025", "Nvidia stockholders equity 2024",
+]
+
+SCHEMA = """CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, department TEXT, salary REAL, hired DATE)
+CREATE TABLE departments (id INTEGER PRIMARY KEY, name TEXT, budget REAL, manager_id INTEGER)"""
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Ollama chat endpoint with a per-model, per-slot prompt (KV) cache"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        rendered = "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in body.get("messages", []))
+        tokens = re.findall(r"\w+|[^\w\s]", rendered + "<|im_start|>assistant\n")
+        with self.server.lock:
+            slots = self.server.slots[body.get("model")]
+            best = max(range(NUM_SLOTS), key=lambda i: (_common_prefix(slots[i][1], tokens), -slots[i][0]))
+            cached = _common_prefix(slots[best][1], tokens)
+            # Like the Ollama runner: extend the best slot only if all of it is reused,
+            # otherwise copy the shared prefix into the least recently used slot
+            slot = best if cached == len(slots[best][1]) else min(range(NUM_SLOTS), key=lambda i: slots[i][0])
+            prefill = (len(tokens) - cached) / PREFILL_TOKENS_PER_S
+            time.sleep(prefill)
+            slots[slot] = (time.monotonic(), tokens)
+            self.server.records.append({"prompt": len(tokens), "cached": cached, "prefill": prefill})
+        payload = json.dumps({
+            "model": body.get("model"), "message": {"role": "assistant", "content": _answer(body.get("format"))},
+            "done": True, "prompt_eval_count": len(tokens) - cached,
+            "prompt_eval_duration": int(prefill * 1e9), "eval_count": 10,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _common_prefix(a, b) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def _answer(schema) -> str:
+    properties = (schema or {}).get("properties", {})
+    if "keywords" in properties:
+        return json.dumps({"keywords": ["revenue", "net revenue", "net sales", "operating income", "net income"]})
+    if "company_name" in properties:
+        return json.dumps({"company_name": "amazon", "fiscal_year": 2024})
+    return "SELECT name FROM employees LIMIT 10"
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+server.daemon_threads = True
+server.lock = threading.Lock()
+server.records = []
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# Settings are read at import time; the exact-prompt cache would hide the prefill cost
+os.environ.update({
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}",
+    "LLM_CACHE_ENABLED": "false",
+    "SHARED_STATE_DB": os.path.join(tempfile.mkdtemp(), "shared_state.db"),
+})
+
+from models.schemas import ChunkMetadata, RankingKeywords
+from tools.sql_tools import generate_sql_query
+from utils import extract_filters, generate_ranking_keywords
+from utils.llm_calls import call_llm
+
+
+# Previous prompt layouts, kept verbatim for comparison
+def legacy_extract_filters(user_query):
+    prompt = f"""Extract metadata filters from the query. Return None for fields not mentioned.
+
+                USER QUERY: {user_query}
+
+                COMPANY MAPPINGS:
+                - Amazon/AMZN -> amazon
+                - Google/Alphabet/GOOGL/GOOG -> google
+                - Apple/AAPL -> apple
+                - Microsoft/MSFT -> microsoft
+                - Tesla/TSLA -> tesla
+                - Nvidia/NVDA -> nvidia
+                - Meta/Facebook/FB -> meta
+
+                DOC TYPE:
+                - Annual report -> 10-k
+                - Quarterly report -> 10-q
+                - Current report -> 8-k
+
+                EXAMPLES:
+                "Amazon Q3 2024 revenue" -> {{"company_name": "amazon", "doc_type": "10-q", "fiscal_year": 2024, "fiscal_quarter": "q3"}}
+                "Apple 2023 annual report" -> {{"company_name": "apple", "doc_type": "10-k", "fiscal_year": 2023}}
+                "Tesla profitability" -> {{"company_name": "tesla"}}
+
+                Extract metadata:"""
+    return call_llm("extractor", prompt, schema=ChunkMetadata, stage="extract_filters")
+
+
+def legacy_generate_ranking_keywords(user_query):
+    prompt = f"""Generate EXACTLY 5 financial keywords from SEC filings terminology.
+
+                USER QUERY: {user_query}
+
+                USE EXACT TERMS FROM 10-K/10-Q FILINGS:
+
+                STATEMENT HEADINGS:
+                "consolidated statements of operations", "consolidated balance sheets", "consolidated statements of cash flows", "consolidated statements of stockholders equity"
+
+                INCOME STATEMENT:
+                "revenue", "net revenue", "cost of revenue", "gross profit", "operating income", "net income", "earnings per share"
+
+                BALANCE SHEET:
+                "total assets", "cash and cash equivalents", "total liabilities", "stockholders equity", "working capital", "long-term debt"
+
+                CASH FLOWS:
+                "cash flows from operating activities", "net cash provided by operating activities", "cash flows from investing activities", "free cash flow", "capital expenditures"
+
+                RULES:
+                - Return EXACTLY 5 keywords
+                - Use exact phrases from SEC filings
+                - Match query topic (revenue -> revenue terms, cash -> cash flow terms)
+                - Use "cash flows" (plural), "stockholders equity"
+
+                EXAMPLES:
+                "revenue analysis" -> ["revenue", "net revenue", "total revenue", "consolidated statements of operations", "net sales"]
+                "cash flow performance" -> ["consolidated statements of cash flows", "cash flows from operating activities", "net cash provided by operating activities", "free cash flow", "operating activities"]
+                "balance sheet strength" -> ["consolidated balance sheets", "total assets", "stockholders equity", "cash and cash equivalents", "long-term debt"]
+
+                Generate EXACTLY 5 keywords:"""
+    return call_llm("extractor", prompt, schema=RankingKeywords, stage="ranking_keywords")
+
+
+def legacy_generate_sql_query(question, schema_to_use):
+    prompt = f"""Based on this database schema:
+                {schema_to_use}
+
+                Generate a SQL query to answer this question: {question}
+
+                Rules:
+                - Use only SELECT statements
+                - Include only existing columns and tables
+                - Add appropriate WHERE, GROUP BY, ORDER BY clauses as needed
+                - Limit results to 10 rows unless specified otherwise
+                - Use proper SQL syntax for SQLite
+
+                Return only the SQL query, nothing else."""
+    return call_llm("sql", prompt, stage="generate_sql_query")
+
+
+LAYOUTS = {
+    "before": {
+        "extract_filters": legacy_extract_filters,
+        "ranking_keywords": legacy_generate_ranking_keywords,
+        "generate_sql_query": lambda q: legacy_generate_sql_query(q, SCHEMA),
+    },
+    "after": {
+        "extract_filters": extract_filters,
+        "ranking_keywords": generate_ranking_keywords,
+        "generate_sql_query": lambda q: generate_sql_query.invoke({"question": q, "schema_info": SCHEMA}),
+    },
+}
+
+
+def run(layout):
+    """One turn's calls per query, in order; returns per call site totals"""
+    with server.lock:
+        server.slots = defaultdict(lambda: [(0.0, [])] * NUM_SLOTS)
+        server.records = []
+    totals = defaultdict(lambda: defaultdict(float))
+    for query in QUERIES:
+        for stage, func in LAYOUTS[layout].items():
+            start = len(server.records)
+            started = time.perf_counter()
+            func(query)
+            wall = time.perf_counter() - started
+            for record in server.records[start:]:
+                for key, value in record.items():
+                    totals[stage][key] += value
+            totals[stage]["wall"] += wall
+            totals[stage]["calls"] += 1
+    return totals
+
+
+def report(layout, totals):
+    print(f"\n{layout.upper()}")
+    print(f"{'call site':<20} {'prompt tok':>10} {'prefilled':>10} {'reused':>7} {'prefill s':>10} "
+          f"{'prompt tok/s':>13} {'ms/call':>8}")
+    summary = defaultdict(float)
+    for stage, t in totals.items():
+        print(f"{stage:<20} {t['prompt']:>10.0f} {t['prompt'] - t['cached']:>10.0f} "
+              f"{t['cached'] / t['prompt']:>7.0%} {t['prefill']:>10.2f} "
+              f"{t['prompt'] / max(t['prefill'], 1e-9):>13.0f} {t['wall'] / t['calls'] * 1000:>8.1f}")
+        for key in ("prompt", "cached", "prefill", "wall"):
+            summary[key] += t[key]
+    return summary
+
+
+if __name__ == "__main__":
+    # Silence the node and tool logging
+    results = {}
+    for layout in LAYOUTS:
+        sys.stdout = open(os.devnull, "w")
+        try:
+            totals = run(layout)
+        finally:
+            sys.stdout = sys.__stdout__
+        results[layout] = report(layout, totals)
+
+    before, after = results["before"], results["after"]
+    print(f"\nprefilled tokens {before['prompt'] - before['cached']:.0f} -> {after['prompt'] - after['cached']:.0f}, "
+          f"prefill {before['prefill']:.2f}s -> {after['prefill']:.2f}s "
+          f"({before['prefill'] / max(after['prefill'], 1e-9):.1f}x), "
+          f"wall {before['wall']:.2f}s -> {after['wall']:.2f}s")
@@ -0,0 +1,174 @@
+# File: check_circuit_breaker.py
+# Checks the per-model circuit breakers against a local stand-in Ollama server: the
+# circuit opens on errors and on slow first bytes, open circuits fail fast without
+# reaching the server, half-open probes close or reopen it, and the agents answer
+# from quick responses, cached answers or a retry message instead of calling the LLM.
+# Run from backend/: python testing/check_circuit_breaker.py
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.append('.')
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Minimal Ollama answering chat, generate and embed"""
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._json(200, {"version": "stand-in"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.calls += 1
+        self.server.paths.append(self.path)
+        if self.server.mode == "error":
+            self._json(500, {"error": "model runner crashed"})
+            return
+        time.sleep(self.server.delay)
+        if self.path == "/api/embed":
+            self._json(200, {"model": body.get("model"), "embeddings": [[0.1, 0.2, 0.3]]})
+        elif self.path == "/api/generate":
+            self._json(200, {"model": body.get("model"), "response": "A general answer.", "done": True})
+        else:
+            self._json(200, {"model": body.get("model"), "message": {"role": "assistant", "content": "An answer."},
+                             "done": True, "prompt_eval_count": 5, "eval_count": 3})
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+server.daemon_threads = True
+server.mode = "ok"
+server.delay = 0.0
+server.calls = 0
+server.paths = []
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = f"http://127.0.0.1:{server.server_address[1]}"
+scratch = tempfile.mkdtemp()
+
+# Settings are read at import time
+os.environ.update({
+    "OLLAMA_BASE_URL": url,
+    "CIRCUIT_WINDOW": "10",
+    "CIRCUIT_MIN_CALLS": "5",
+    "CIRCUIT_ERROR_RATE": "0.5",
+    "CIRCUIT_P95_SECONDS": "0.3",
+    "CIRCUIT_OPEN_SECONDS": "1",
+    "SHARED_STATE_DB": os.path.join(scratch, "shared_state.db"),
+})
+
+from agents.financial_agent import FinancialAgent
+from agents.llm_agent import get_llm_agent
+from utils.circuit_breaker import CircuitOpen, circuit_breakers
+from utils.config import settings
+from utils.model_registry import get_transport
+
+MODEL = settings.OLLAMA_MODEL
+client = httpx.Client(base_url=url, transport=get_transport(url), timeout=10)
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}  {detail}")
+    if not ok:
+        failures.append(name)
+
+
+def chat():
+    return client.post("/api/chat", json={"model": MODEL, "messages": [], "stream": False})
+
+
+def state():
+    return circuit_breakers.get(MODEL).stats()["state"]
+
+
+def run_calls(count, concurrency=5):
+    with ThreadPoolExecutor(concurrency) as pool:
+        return [future.result() for future in [pool.submit(chat) for _ in range(count)]]
+
+
+if __name__ == "__main__":
+    # 1. Errors open the circuit; open circuits fail fast without reaching the server
+    server.mode = "error"
+    run_calls(5)
+    check("open on errors", state() == "open", circuit_breakers.get(MODEL).stats()["reason"])
+    calls = server.calls
+    started = time.perf_counter()
+    try:
+        chat()
+        rejected = False
+    except CircuitOpen:
+        rejected = True
+    fast = time.perf_counter() - started
+    check("fail fast", rejected and server.calls == calls and fast < 0.05, f"{fast * 1000:.1f} ms")
+
+    # 2. After the open period one probe goes through; success closes the circuit
+    server.mode = "ok"
+    time.sleep(1.1)
+    response = chat()
+    check("half-open probe closes", response.status_code == 200 and state() == "closed")
+
+    # 3. Slow first bytes (p95 above the limit) open it too; a slow probe reopens it
+    server.delay = 0.5
+    run_calls(5)
+    check("open on latency", state() == "open", circuit_breakers.get(MODEL).stats()["reason"])
+    time.sleep(1.1)
+    chat()
+    check("slow probe reopens", state() == "open", circuit_breakers.get(MODEL).stats()["reason"])
+
+    # 4. Only the configured number of probes run while half-open
+    time.sleep(1.1)
+    outcomes = []
+
+    def probe():
+        try:
+            outcomes.append(chat().status_code)
+        except CircuitOpen:
+            outcomes.append("rejected")
+
+    with ThreadPoolExecutor(4) as pool:
+        for _ in range(4):
+            pool.submit(probe)
+    check("probe limit", outcomes.count("rejected") == 3, f"outcomes {outcomes}")
+
+    # 5. Agents answer without the LLM while the circuit is open
+    server.delay = 0.0
+    time.sleep(1.1)
+    chat()
+    llm_agent = get_llm_agent()
+    first = llm_agent.invoke("What is compound interest?")
+    circuit_breakers.get(MODEL)._open("check")
+    cached = llm_agent.invoke("what is compound interest")
+    check("cached answer", cached["metadata"].get("fallback") == "cached_answer"
+          and cached["response"] == first["response"], cached["metadata"].get("fallback"))
+    unknown = llm_agent.invoke("What is a bond ladder?")
+    check("retry message", unknown["metadata"].get("fallback") == "none", unknown["response"])
+
+    # (with the embedding circuit open as well, so the vector store is not searched)
+    circuit_breakers.get(settings.EMBEDDING_MODEL)._open("check")
+    agent = FinancialAgent()
+    server.paths.clear()
+    greeting = agent.invoke("hello")
+    fallback = agent.invoke("Explain the revenue trend")
+    check("financial fallback", not server.paths and greeting["metadata"].get("simple_response")
+          and fallback["metadata"].get("degraded"),
+          f"greeting: {greeting['metadata']}, question: {fallback['metadata'].get('fallback')}")
+
+    print(json.dumps(circuit_breakers.stats(), indent=2))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,210 @@
+# File: check_job_cancel.py
+# Checks that cancelling a background job stops the work it is running, not just its row:
+# the job's deadline reaches the tighter deadline scopes nested in it (FinancialAgent's
+# @timeout), so a graph stops at its next node or LLM chunk, and the LLM agent's stream
+# is dropped as well. A request coalesced with a cancelled chat job still gets its answer.
+# Uses a local stand-in Ollama streaming one chunk every CHUNK_SECONDS.
+# Run from backend/: python testing/check_job_cancel.py
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TypedDict
+
+sys.path.append('.')
+
+CHUNK_SECONDS = 0.05
+CHUNKS = 200
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Ollama /api/chat streaming a long answer slowly; records when the client hangs up"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        stream = {"sent": 0, "dropped": False}
+        self.server.streams.append(stream)
+        try:
+            for _ in range(CHUNKS):
+                self.wfile.write((json.dumps({"model": body.get("model"), "done": False,
+                                              "message": {"role": "assistant", "content": "word "}}) + "\n").encode())
+                self.wfile.flush()
+                stream["sent"] += 1
+                time.sleep(CHUNK_SECONDS)
+            self.wfile.write((json.dumps({"model": body.get("model"), "done": True, "eval_count": CHUNKS,
+                                          "message": {"role": "assistant", "content": ""}}) + "\n").encode())
+        except (BrokenPipeError, ConnectionResetError):
+            stream["dropped"] = True
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+server.daemon_threads = True
+server.streams = []
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+scratch = tempfile.mkdtemp()
+# Settings are read at import time
+os.environ.update({
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}",
+    "JOBS_DB": os.path.join(scratch, "jobs.db"),
+    "SHARED_STATE_DB": os.path.join(scratch, "shared_state.db"),
+    "CHECKPOINT_DB": os.path.join(scratch, "checkpoints.db"),
+    "LOG_DIR": os.path.join(scratch, "logs"),
+})
+
+from langgraph.graph import END, START, StateGraph
+
+from agents.api import chat
+from agents.financial_agent import timeout
+from agents.llm_agent import get_llm_agent
+from services.coalescer import coalescer
+from services.job_manager import job_manager
+from utils.deadline import Deadline, deadline_scope, get_deadline
+from utils.llm_calls import call_llm
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}  {detail}")
+    if not ok:
+        failures.append(name)
+
+
+class State(TypedDict):
+    answer: str
+    checked: bool
+
+
+def generate(state: State):
+    return {"answer": call_llm("generator", "Write a long report", stage="generate").content}
+
+
+def check_answer(state: State):
+    # Nodes check the deadline before starting (as traced_node does)
+    get_deadline().check("check_answer")
+    return {"checked": True}
+
+
+builder = StateGraph(State)
+builder.add_node("generate", generate)
+builder.add_node("check_answer", check_answer)
+builder.add_edge(START, "generate")
+builder.add_edge("generate", "check_answer")
+builder.add_edge("check_answer", END)
+graph = builder.compile()
+finished = {}
+
+
+@timeout(30)
+def run_graph():
+    """Like FinancialAgent._get_rag_response: the graph runs in a nested, tighter deadline scope"""
+    return graph.invoke({"answer": "", "checked": False})
+
+
+def graph_job(payload):
+    try:
+        return run_graph()
+    finally:
+        finished["graph"] = time.monotonic()
+
+
+def llm_job(payload):
+    try:
+        return get_llm_agent().invoke("Tell me a long story")
+    finally:
+        finished["llm"] = time.monotonic()
+
+
+job_manager.register("graph", graph_job)
+job_manager.register("llm", llm_job)
+
+
+def wait_for_stream(count):
+    while len(server.streams) < count or server.streams[count - 1]["sent"] < 3:
+        time.sleep(0.01)
+
+
+def wait_for(key, limit=5.0):
+    ends = time.monotonic() + limit
+    while key not in finished and time.monotonic() < ends:
+        time.sleep(0.01)
+    return finished.get(key)
+
+
+if __name__ == "__main__":
+    # 1. A nested scope sees its parent's cancellation
+    with deadline_scope(300) as outer:
+        with deadline_scope(30) as inner:
+            outer.cancel()
+            check("nested deadline", inner is not outer and inner.expired and inner.cancelled
+                  and inner.remaining() == 0.0)
+    check("standalone deadline", not Deadline(30).expired)
+
+    # 2. Cancelling a graph job drops the LLM stream and never starts the next node
+    task_id = job_manager.submit("graph", {})
+    wait_for_stream(1)
+    cancelled_at = time.monotonic()
+    job_manager.cancel(task_id)
+    ended = wait_for("graph")
+    time.sleep(0.2)
+    stream = server.streams[0]
+    check("graph stops", ended is not None and ended - cancelled_at < 0.5,
+          f"stopped after {(ended - cancelled_at) * 1000:.0f} ms" if ended else "still running")
+    check("stream dropped", stream["dropped"] and stream["sent"] < CHUNKS, f"chunks sent {stream['sent']}")
+    job = job_manager.get(task_id)
+    check("job cancelled", job["status"] == "cancelled", job["status"])
+
+    # 3. The LLM agent runs under the job deadline too
+    task_id = job_manager.submit("llm", {})
+    wait_for_stream(2)
+    cancelled_at = time.monotonic()
+    job_manager.cancel(task_id)
+    ended = wait_for("llm")
+    time.sleep(0.2)
+    stream = server.streams[1]
+    check("llm agent stops", ended is not None and ended - cancelled_at < 0.5 and stream["dropped"],
+          f"chunks sent {stream['sent']}")
+    check("llm job cancelled", job_manager.get(task_id)["status"] == "cancelled")
+
+    # 4. A request coalesced with a chat job is answered even when the job is cancelled
+    message = "Tell me a long story about markets"
+    session_id = chat.session_store.get_or_create(None)
+    task_id = job_manager.submit("chat", {"message": message, "agent_type": "llm",
+                                          "session_id": session_id, "turn_id": "job-turn"})
+    wait_for_stream(3)
+    follower = {}
+
+    def follow():
+        try:
+            follower["result"] = coalescer.run(chat.coalesce_key(message, "llm", session_id), chat.answer_turn_sync,
+                                               message, "llm", session_id, "follower-turn")
+        except Exception as e:
+            follower["error"] = e
+
+    joined = coalescer.stats["coalesced"]
+    thread = threading.Thread(target=follow)
+    thread.start()
+    while coalescer.stats["coalesced"] == joined:
+        time.sleep(0.01)
+    job_manager.cancel(task_id)
+    thread.join(CHUNKS * CHUNK_SECONDS + 5)
+    result = follower.get("result")
+    check("coalesced caller answered", result is not None and result[0][0]["response"].startswith("word"),
+          repr(follower.get("error")) if result is None else f"re-run as leader: {not result[1]}")
+    check("chat job cancelled", job_manager.get(task_id)["status"] == "cancelled")
+
+    sys.exit(1 if failures else 0)
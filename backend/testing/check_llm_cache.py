@@ -0,0 +1,114 @@
+# File: check_llm_cache.py
+# Checks the exact-prompt LLM cache against a local stand-in Ollama server: repeated
+# deterministic calls are served from memory, then from the shared SQLite tier after a
+# restart, changed prompts and non-deterministic profiles still reach the model, and
+# entries expire with their TTL. Prints the latency of a miss and of each hit tier.
+# Run from backend/: python testing/check_llm_cache.py
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append('.')
+
+SERVICE_TIME = 0.2
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Minimal Ollama chat endpoint answering filters/keywords JSON after SERVICE_TIME"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.calls += 1
+        time.sleep(SERVICE_TIME)
+        content = (json.dumps({"keywords": ["revenue", "net revenue", "net sales", "gross profit", "operating income"]})
+                   if "keywords" in json.dumps(body.get("format") or {}) else
+                   json.dumps({"company_name": "amazon", "fiscal_year": 2024}))
+        payload = json.dumps({"model": body.get("model"), "message": {"role": "assistant", "content": content},
+                              "done": True, "prompt_eval_count": 200, "eval_count": 20}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+server.daemon_threads = True
+server.calls = 0
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# Settings are read at import time
+os.environ.update({
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}",
+    "SHARED_STATE_DB": os.path.join(tempfile.mkdtemp(), "shared_state.db"),
+    "LLM_CACHE_TTLS": json.dumps({"extract_filters": 60, "ranking_keywords": 1, "generate": 60}),
+})
+
+from models.schemas import ChunkMetadata, RankingKeywords
+from utils.llm_cache import llm_cache
+from utils.llm_calls import call_llm
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}  {detail}")
+    if not ok:
+        failures.append(name)
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def filters(query):
+    return call_llm("extractor", f"Extract metadata from: {query}", schema=ChunkMetadata, stage="extract_filters")
+
+
+if __name__ == "__main__":
+    # 1. Repeated prompt: one model call, then memory hits
+    first, miss_ms = timed(filters, "Amazon 2024 revenue")
+    hits = [timed(filters, "Amazon 2024 revenue") for _ in range(20)]
+    check("memory hits", server.calls == 1 and all(result == first for result, _ in hits),
+          f"model calls {server.calls}")
+
+    # 2. A different prompt is a miss
+    filters("Apple 2023 annual report")
+    check("prompt change misses", server.calls == 2, f"model calls {server.calls}")
+
+    # 3. A fresh process (empty memory) is served from the shared SQLite tier
+    llm_cache.clear()
+    disk, disk_ms = timed(filters, "Amazon 2024 revenue")
+    memory_ms = statistics.median(ms for _, ms in hits)
+    check("disk hit", server.calls == 2 and disk == first, f"model calls {server.calls}")
+
+    # 4. Profiles that are not temperature 0 are never cached, even when their stage is listed
+    call_llm("generator", "Summarize the report", stage="generate")
+    call_llm("generator", "Summarize the report", stage="generate")
+    check("non-deterministic skipped", server.calls == 4, f"model calls {server.calls}")
+
+    # 5. Entries expire with the call site's TTL
+    call_llm("extractor", "keywords for revenue", schema=RankingKeywords, stage="ranking_keywords")
+    call_llm("extractor", "keywords for revenue", schema=RankingKeywords, stage="ranking_keywords")
+    cached_calls = server.calls
+    time.sleep(1.1)
+    call_llm("extractor", "keywords for revenue", schema=RankingKeywords, stage="ranking_keywords")
+    check("ttl expiry", cached_calls == 5 and server.calls == 6, f"model calls {cached_calls} -> {server.calls}")
+
+    print(f"\nmiss {miss_ms:.1f} ms, memory hit {memory_ms:.2f} ms, disk hit {disk_ms:.2f} ms")
+    print(json.dumps(llm_cache.stats(), indent=2))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,136 @@
+# File: check_llm_deadline.py
+# Checks that Ollama calls made under a deadline get their HTTP timeouts from its remaining
+# time instead of the fixed LLM_HTTP_TIMEOUT: a slow prefill ends when the deadline does
+# (as DeadlineExceeded, without counting against the host or the model's circuit breaker),
+# a job deadline longer than LLM_HTTP_TIMEOUT lets a long prefill finish, and a stream
+# stalled mid-answer ends at the deadline with its partial text.
+# Uses a local stand-in Ollama whose prefill and stalls are set per check.
+# Run from backend/: python testing/check_llm_deadline.py
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.append('.')
+
+HTTP_TIMEOUT = 1.0
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Ollama /api/chat: waits `prefill` seconds, streams `chunks` words, then stalls for `stall` seconds"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.server.prefill)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for _ in range(self.server.chunks):
+                self.wfile.write((json.dumps({"model": body.get("model"), "done": False,
+                                              "message": {"role": "assistant", "content": "word "}}) + "\n").encode())
+                self.wfile.flush()
+            time.sleep(self.server.stall)
+            self.wfile.write((json.dumps({"model": body.get("model"), "done": True, "eval_count": 1,
+                                          "message": {"role": "assistant", "content": ""}}) + "\n").encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+server.daemon_threads = True
+server.prefill, server.chunks, server.stall = 0.0, 1, 0.0
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# Settings are read at import time
+os.environ.update({
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}",
+    "LLM_HTTP_TIMEOUT": str(HTTP_TIMEOUT),
+    "LLM_CACHE_ENABLED": "false",
+    "OLLAMA_EJECT_FAILURES": "1",
+    "SHARED_STATE_DB": os.path.join(tempfile.mkdtemp(), "shared_state.db"),
+})
+
+from utils.circuit_breaker import circuit_breakers
+from utils.config import settings
+from utils.deadline import DeadlineExceeded, deadline_scope
+from utils.llm_calls import call_llm
+from utils.model_profiles import get_profile
+from utils.ollama_pool import ollama_pool
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}  {detail}")
+    if not ok:
+        failures.append(name)
+
+
+def timed_call(seconds=None):
+    """Generator call, under a deadline of `seconds` if given; returns (result or exception, seconds)"""
+    started = time.monotonic()
+    try:
+        if seconds is None:
+            result = call_llm("generator", "Summarize the report", stage="generate")
+        else:
+            with deadline_scope(seconds):
+                result = call_llm("generator", "Summarize the report", stage="generate")
+    except Exception as e:
+        result = e
+    return result, time.monotonic() - started
+
+
+def host_stats():
+    return ollama_pool.stats()["hosts"][settings.OLLAMA_BASE_URL.rstrip("/")]
+
+
+if __name__ == "__main__":
+    model = get_profile("generator")["model"]
+
+    # 1. Without a deadline the fixed LLM_HTTP_TIMEOUT applies
+    server.prefill = HTTP_TIMEOUT + 0.5
+    result, seconds = timed_call()
+    check("fixed timeout without deadline", isinstance(result, httpx.ReadTimeout),
+          f"{type(result).__name__} after {seconds:.2f}s")
+    errors = host_stats()["errors"]
+    # A timeout without a deadline is the host's; make it healthy again for the next checks
+    ollama_pool.host(settings.OLLAMA_BASE_URL).ejected_until = 0.0
+
+    # 2. A slow prefill ends with the deadline, well before LLM_HTTP_TIMEOUT
+    server.prefill = 3.0
+    breaker_calls = circuit_breakers.get(model).stats()["window_calls"]
+    result, seconds = timed_call(0.4)
+    check("prefill cut at deadline", isinstance(result, DeadlineExceeded) and seconds < 0.4 + 0.3,
+          f"{type(result).__name__} after {seconds:.2f}s")
+    check("host not blamed", host_stats()["errors"] == errors and host_stats()["healthy"],
+          f"errors {errors} -> {host_stats()['errors']}")
+    check("breaker not blamed", circuit_breakers.get(model).stats()["window_calls"] == breaker_calls)
+
+    # 3. A job deadline longer than LLM_HTTP_TIMEOUT lets a long prefill finish
+    server.prefill = HTTP_TIMEOUT + 0.5
+    result, seconds = timed_call(10)
+    check("long prefill under job deadline", getattr(result, "content", None) == "word ",
+          f"{type(result).__name__} after {seconds:.2f}s")
+
+    # 4. A stream that stalls mid-answer ends at the deadline with its partial text
+    server.prefill, server.chunks, server.stall = 0.0, 3, 3.0
+    result, seconds = timed_call(0.5)
+    check("stalled stream cut at deadline", isinstance(result, DeadlineExceeded) and seconds < 0.5 + 0.3
+          and result.partial == "word word word ", f"{type(result).__name__} after {seconds:.2f}s")
+
+    # Let the stand-in finish its stalled responses
+    time.sleep(0.1)
+    sys.exit(1 if failures else 0)
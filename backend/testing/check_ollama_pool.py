@@ -0,0 +1,186 @@
+# File: check_ollama_pool.py
+# Checks the Ollama host pool against local stand-in Ollama servers: least-outstanding
+# routing, throughput scaling with hosts, retry of idempotent calls, ejection of failed
+# and slow hosts (compared per model), and return after a passing health check.
+# Run from backend/: python testing/check_ollama_pool.py
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.append('.')
+
+SERVICE_TIME = 0.1
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Minimal Ollama: one request at a time (like OLLAMA_NUM_PARALLEL=1)"""
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.server.mode == "down":
+            self.close_connection = True
+            return
+        self._json(200, {"version": "stand-in"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.calls += 1
+        if self.server.mode == "down":
+            # Drop the connection without a response
+            self.close_connection = True
+            return
+        if self.server.mode == "error":
+            self._json(500, {"error": "model runner crashed"})
+            return
+        with self.server.slot:
+            time.sleep(self.server.delay)
+        if self.path == "/api/embed":
+            self._json(200, {"model": body.get("model"), "embeddings": [[0.1, 0.2, 0.3]], "load_duration": 0})
+        else:
+            self._json(200, {"model": body.get("model"), "message": {"role": "assistant", "content": "ok"},
+                             "done": True, "prompt_eval_count": 5, "eval_count": 1})
+
+
+def start_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    server.daemon_threads = True
+    server.mode = "ok"
+    server.delay = SERVICE_TIME
+    server.calls = 0
+    server.slot = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+servers = [start_stand_in() for _ in range(3)]
+urls = [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+
+# Settings are read at import time
+os.environ.update({
+    "OLLAMA_BASE_URL": urls[0],
+    "OLLAMA_HOSTS": json.dumps({"*": urls, "single": urls[:1]}),
+    "LLM_PARALLEL": "1",
+    "OLLAMA_HEALTH_INTERVAL": "0.5",
+    "OLLAMA_EJECT_FAILURES": "2",
+    "OLLAMA_EJECT_SECONDS": "3",
+    "OLLAMA_SLOW_FACTOR": "3",
+    "OLLAMA_SLOW_MIN_SECONDS": "0.2",
+})
+
+from utils.model_registry import embedding_model, get_transport
+from utils.ollama_pool import idempotent, ollama_pool
+
+client = httpx.Client(base_url=urls[0], transport=get_transport(urls[0]), timeout=10)
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}  {detail}")
+    if not ok:
+        failures.append(name)
+
+
+def embed(model="pooled"):
+    response = client.post("/api/embed", json={"model": model, "input": "hello"})
+    response.raise_for_status()
+
+
+def chat(model="pooled"):
+    response = client.post("/api/chat", json={"model": model, "messages": [], "stream": False})
+    response.raise_for_status()
+
+
+def run_calls(func, count, concurrency=12, **kwargs):
+    errors = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(func, **kwargs) for _ in range(count)]:
+            try:
+                future.result()
+            except httpx.HTTPError:
+                errors += 1
+    return time.perf_counter() - started, errors
+
+
+def reset_calls():
+    for server in servers:
+        server.calls = 0
+
+
+if __name__ == "__main__":
+    # 1. Throughput scales with hosts, and least-outstanding routing spreads the calls
+    single, _ = run_calls(embed, 30, model="single")
+    reset_calls()
+    pooled, errors = run_calls(embed, 30)
+    calls = [server.calls for server in servers]
+    check("scaling", single / pooled > 2.4, f"1 host {30 / single:.1f} req/s, 3 hosts {30 / pooled:.1f} req/s")
+    check("least outstanding", errors == 0 and min(calls) >= 8, f"calls per host {calls}")
+
+    # 2. Embeddings (idempotent) survive a dead host; the host is ejected
+    servers[1].mode = "down"
+    _, errors = run_calls(embed, 30)
+    stats = ollama_pool.stats()["hosts"][urls[1]]
+    check("retry idempotent", errors == 0, f"errors {errors}, retries {stats['retries']}")
+    check("eject failed host", not stats["healthy"], f"reason {stats['eject_reason']}")
+    reset_calls()
+    run_calls(embed, 12)
+    check("ejected host skipped", servers[1].calls == 0, f"calls {servers[1].calls}")
+
+    # 3. Health check brings the host back once it answers again (before the ejection ends)
+    servers[1].mode = "ok"
+    time.sleep(1.5)
+    check("health check return", ollama_pool.stats()["hosts"][urls[1]]["healthy"])
+
+    # 4. Chat calls are only retried when marked idempotent (e.g. graders)
+    servers[2].mode = "error"
+    _, errors = run_calls(chat, 12, concurrency=3)
+    check("no retry for generation", 0 < errors <= 3, f"errors {errors} (host ejected after 2)")
+    servers[2].mode = "ok"
+    servers[0].mode = "error"
+
+    def graded_chat():
+        with idempotent():
+            chat()
+
+    _, errors = run_calls(graded_chat, 12, concurrency=3)
+    check("retry idempotent chat", errors == 0, f"errors {errors}")
+    servers[0].mode = "ok"
+
+    # 5. A host much slower than the others is ejected (once the others are back)
+    time.sleep(3.5)
+    servers[1].delay = SERVICE_TIME * 10
+    run_calls(embed, 40)
+    stats = ollama_pool.stats()["hosts"][urls[1]]
+    check("eject slow host", not stats["healthy"] and stats["eject_reason"] == "slow",
+          f"reason {stats['eject_reason']}")
+
+    # 6. Time to first byte is only compared between hosts of the same model: a slow
+    # model on its only host does not make that host look slow next to other models
+    servers[0].delay = SERVICE_TIME * 10
+    run_calls(embed, 4, concurrency=1, model="single")
+    servers[0].delay = SERVICE_TIME
+    stats = ollama_pool.stats()["hosts"][urls[0]]
+    check("per-model ttfb", stats["healthy"], f"ttfb_ms {stats['ttfb_ms']}")
+
+    # 7. The langchain clients go through the pool
+    vector = embedding_model("pooled").embed_query("hello")
+    check("client integration", len(vector) == 3)
+
+    print(json.dumps(ollama_pool.stats()["hosts"], indent=2))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,104 @@
+# File: check_token_stream.py
+# Checks that POST /api/v1/chat/stream/ streams answer tokens for the agents the API uses by
+# default (FinancialAgent in minimal mode and the LLM agent), not just the final "done" event,
+# and that a coalesced follower of the same query gets the same tokens.
+# Uses a local stand-in Ollama streaming one word every CHUNK_SECONDS.
+# Run from backend/: python testing/check_token_stream.py
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append('.')
+
+CHUNK_SECONDS = 0.02
+WORDS = ["Revenue ", "grew ", "by ", "ten ", "percent."]
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Ollama /api/chat streaming WORDS one chunk at a time"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for word in WORDS:
+            self.wfile.write((json.dumps({"model": body.get("model"), "done": False,
+                                          "message": {"role": "assistant", "content": word}}) + "\n").encode())
+            self.wfile.flush()
+            time.sleep(CHUNK_SECONDS)
+        self.wfile.write((json.dumps({"model": body.get("model"), "done": True, "eval_count": len(WORDS),
+                                      "message": {"role": "assistant", "content": ""}}) + "\n").encode())
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+scratch = tempfile.mkdtemp()
+# Settings are read at import time
+os.environ.update({
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}",
+    "JOBS_DB": os.path.join(scratch, "jobs.db"),
+    "SHARED_STATE_DB": os.path.join(scratch, "shared_state.db"),
+    "CHECKPOINT_DB": os.path.join(scratch, "checkpoints.db"),
+    "LOG_DIR": os.path.join(scratch, "logs"),
+})
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from agents.api.chat import router
+
+app = FastAPI()
+app.include_router(router, prefix="/api/v1/chat")
+client = TestClient(app)
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}  {detail}")
+    if not ok:
+        failures.append(name)
+
+
+def stream(message, agent_type):
+    """Events of one streamed turn"""
+    response = client.post("/api/v1/chat/stream/", json={"message": message, "agent_type": agent_type})
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def tokens(events):
+    return "".join(event["content"] for event in events if event["type"] == "token")
+
+
+if __name__ == "__main__":
+    answer = "".join(WORDS)
+    # 1. Each default agent streams its answer token by token
+    for agent_type in ("financial", "llm"):
+        events = stream(f"Explain operating margin ({agent_type})", agent_type)
+        kinds = [event["type"] for event in events]
+        check(f"{agent_type} tokens", kinds.count("token") == len(WORDS) and tokens(events) == answer,
+              f"events {kinds}")
+        check(f"{agent_type} done last", kinds[-1] == "done" and events[-1]["response"] == answer)
+
+    # 2. Concurrent identical queries share one run; the follower gets the tokens too
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lambda _: stream("How did revenue change?", "llm"), range(2)))
+    coalesced = [bool(events[-1].get("metadata", {}).get("coalesced")) for events in results]
+    check("coalesced follower tokens", all(tokens(events) == answer for events in results),
+          f"coalesced {coalesced}")
+
+    sys.exit(1 if failures else 0)
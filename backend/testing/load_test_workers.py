@@ -0,0 +1,115 @@
+# File: load_test_workers.py
+# Load test of the non-LLM endpoints with 1 and N uvicorn workers sharing SQLite state.
+# Run from backend/: python testing/load_test_workers.py --workers 4 --seconds 10
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+sys.path.append('.')
+
+from services.session_store import SQLiteSessionStore
+
+SESSION_ID = "load-test-session"
+
+
+def seed(db_dir):
+    """One session with some history in the shared session DB"""
+    store = SQLiteSessionStore(os.path.join(db_dir, "sessions.db"))
+    store.create(SESSION_ID)
+    for i in range(20):
+        store.add_turn(SESSION_ID, f"question {i}", "answer " * 50, "financial")
+
+
+def start_server(workers, port, db_dir):
+    env = dict(
+        os.environ,
+        SESSION_STORE="sqlite",
+        SESSION_DB=os.path.join(db_dir, "sessions.db"),
+        JOBS_DB=os.path.join(db_dir, "jobs.db"),
+        CHECKPOINT_DB=os.path.join(db_dir, "checkpoints.db"),
+        SHARED_STATE_DB=os.path.join(db_dir, "shared_state.db"),
+        PRELOAD="false",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    # Ready once every worker has answered a health check
+    pids = set()
+    deadline = time.time() + 180
+    while time.time() < deadline:
+        try:
+            response = httpx.get(f"http://127.0.0.1:{port}/health", timeout=5)
+            pids.add(response.json()["worker_pid"])
+            if len(pids) >= workers:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"server with {workers} workers did not start")
+
+
+def hammer(port, clients, seconds):
+    paths = ["/health", f"/api/v1/chat/sessions/{SESSION_ID}?limit=10", "/metrics"]
+    counts = {"ok": 0, "errors": 0}
+    lock = threading.Lock()
+    stop_at = time.time() + seconds
+
+    def client(index):
+        ok = errors = 0
+        # A fresh connection per request spreads load across the workers
+        while time.time() < stop_at:
+            path = paths[(index + ok + errors) % len(paths)]
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}{path}", timeout=10)
+                if response.status_code == 200:
+                    ok += 1
+                else:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+        with lock:
+            counts["ok"] += ok
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"rps": counts["ok"] / seconds, **counts}
+
+
+def run(workers, port, clients, seconds):
+    with tempfile.TemporaryDirectory() as db_dir:
+        seed(db_dir)
+        process = start_server(workers, port, db_dir)
+        try:
+            return hammer(port, clients, seconds)
+        finally:
+            process.terminate()
+            process.wait(30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Non-LLM endpoint throughput, 1 vs N workers")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()}, clients: {args.clients}, {args.seconds:.0f}s per run")
+    single = run(1, args.port, args.clients, args.seconds)
+    print(f"1 worker:  {single['rps']:8.1f} req/s  ({single['errors']} errors)")
+    multi = run(args.workers, args.port, args.clients, args.seconds)
+    print(f"{args.workers} workers: {multi['rps']:8.1f} req/s  ({multi['errors']} errors)")
+    scaling = multi["rps"] / single["rps"] if single["rps"] else 0.0
+    print(f"Scaling: {scaling:.2f}x (ideal {min(args.workers, os.cpu_count() or 1)}x)")
@@ -7,16 +7,24 @@ from langchain_community.document_loaders import (
 )
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from utils import embeddings, vector_store
+from utils import embeddings, get_vector_store
+from utils.config import settings
+from utils.corpus import bump_corpus_version
+from utils.llm_scheduler import llm_priority
+from utils.model_registry import chat_model
 
 class DocumentUploader:
     """Handle document uploads and processing."""
     
     def __init__(self):
-        self.chroma_dir = "chroma_financial_db"
-        self.collection_name = "financial_docs"
+        self.chroma_dir = settings.CHROMA_DIR
+        self.collection_name = settings.COLLECTION_NAME
         self.embeddings = embeddings
-        self.vector_store = vector_store
+    
+    @property
+    def vector_store(self):
+        """Shared Chroma store, opened on first use"""
+        return get_vector_store()
     
     def process_document(self, file_path: str, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
         """Process and index uploaded document."""
@@ -53,7 +61,10 @@ class DocumentUploader:
         )
         
         splits = text_splitter.split_documents(documents)
-        self.vector_store.add_documents(splits)
+        # Embedding a whole document must not hold up chat requests
+        with llm_priority("ingest"):
+            self.vector_store.add_documents(splits)
+        bump_corpus_version()
         
         return {
             "file_name": Path(file_path).name,
@@ -98,9 +109,7 @@ class DocumentUploader:
             Provide a clear and concise answer. If the content doesn't contain relevant information, say so."""
             
             # Use LLM to answer
-            from langchain_ollama import ChatOllama
-            llm = ChatOllama(model="qwen3", base_url="http://localhost:11434")
-            response = llm.invoke(prompt)
+            response = chat_model().invoke(prompt)
             
             return {
                 "answer": response.content,
@@ -146,9 +155,7 @@ class DocumentUploader:
     
     def _generate_answer(self, query: str, context: str) -> str:
         """Generate answer using LLM."""
-        from langchain_ollama import ChatOllama
-        
-        llm = ChatOllama(model="qwen3", base_url="http://localhost:11434")
+        llm = chat_model()
         prompt = f"""Based on the following context, answer this query: {query}
         
         Context:
@@ -1,6 +1,7 @@
-import os
 from langchain_core.tools import tool
 from utils import extract_filters, generate_ranking_keywords, search_docs, rank_documents_by_keywords
+from utils.debug_artifacts import debug_recorder
+from utils.tracing import span
 
 @tool
 def retrieve_docs(query:str, k=5):
@@ -18,14 +19,20 @@ def retrieve_docs(query:str, k=5):
     print(f"\n[TOOL] retrieve_docs called")
     print(f"[QUERY] {query}")
 
-    filters = extract_filters(query)
-    ranking_keywords = generate_ranking_keywords(query)
+    with span("extract_filters", "retrieval"):
+        filters = extract_filters(query)
+    with span("ranking_keywords", "retrieval"):
+        ranking_keywords = generate_ranking_keywords(query)
     
     # fetch more docs than needed for better re-ranking
-    results = search_docs(query, filters, ranking_keywords, k=10*k)
+    with span("vector_search", "retrieval", k=10*k) as current:
+        results = search_docs(query, filters, ranking_keywords, k=10*k)
+        if current is not None:
+            current.attrs["results"] = len(results)
 
     # rank retrieved docs
-    docs = rank_documents_by_keywords(results, ranking_keywords, k=k)
+    with span("rerank", "retrieval"):
+        docs = rank_documents_by_keywords(results, ranking_keywords, k=k)
 
     print(f"[RETRIEVED] {len(docs)} documents")
 
@@ -51,8 +58,6 @@ def retrieve_docs(query:str, k=5):
 
     retrieved_text = "\n".join(retrieved_text)
 
-    os.makedirs("debug_logs", exist_ok=True)
-    with open("debug_logs/retrieved_reranked_docs.md", "w", encoding='utf-8') as f:
-        f.write(retrieved_text)
+    debug_recorder.record("retrieved_reranked_docs", f"Query: {query}\n\n{retrieved_text}")
 
     return retrieved_text
\ No newline at end of file
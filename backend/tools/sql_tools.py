@@ -6,7 +6,6 @@ import operator
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
-from langchain_ollama import ChatOllama
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
@@ -16,18 +15,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-LLM_MODEL = "gpt-oss"
-BASE_URL = "http://localhost:11434"
-
-llm = ChatOllama(model=LLM_MODEL, base_url=BASE_URL, reasoning=True)
+from utils.llm_calls import call_llm
+from utils.startup import lazy_resource
 
+@lazy_resource("employees_db")
 def get_db_connection():
     db = SQLDatabase.from_uri('sqlite:///db/employees_db-full-1.0.6.db')
     return db
 
-db = get_db_connection()
-tables = db.get_usable_table_names()
-SCHEMA = db.get_table_info()
+@lazy_resource("employees_schema")
+def get_schema():
+    """Table info with sample rows, read once on first use"""
+    return get_db_connection().get_table_info()
 
 @tool
 def get_database_schema(table_name: str = None):
@@ -45,7 +44,7 @@ def get_database_schema(table_name: str = None):
         else:
             return f"Error: Table '{table_name}' not found. Available tables: '{', '.join(tables)}'"
     else:
-        return SCHEMA
+        return get_schema()
 
 
 @tool
@@ -53,12 +52,13 @@ def generate_sql_query(question: str, schema_info: str=None):
     """Generate a SQL SELECT query from a natural language question using database schema.
         Always use this after getting schema information."""
     
-    schema_to_use = schema_info if schema_info else SCHEMA
+    schema_to_use = schema_info if schema_info else get_schema()
 
+    # Schema and rules are the same for every question: keep them ahead of it (KV cache prefix reuse)
     prompt = f"""Based on this database schema:
                 {schema_to_use}
 
-                Generate a SQL query to answer this question: {question}
+                Generate a SQL query to answer the question below.
 
                 Rules:
                 - Use only SELECT statements
@@ -67,9 +67,11 @@ def generate_sql_query(question: str, schema_info: str=None):
                 - Limit results to 10 rows unless specified otherwise
                 - Use proper SQL syntax for SQLite
 
-                Return only the SQL query, nothing else."""
+                Return only the SQL query, nothing else.
+
+                Question: {question}"""
     
-    response = llm.invoke(prompt)
+    response = call_llm("sql", prompt, stage="generate_sql_query")
     sql_query = response.content.strip()
     print(f"[TOOL] Generated SQL Query: {sql_query[:30]}...")
     return sql_query
@@ -128,23 +130,22 @@ def fix_sql_error(original_query: str, error_message: str, question):
     """Fix a failed SQL query by analyzing the error and generating a corrected version.
         Use this when validation or execution fails."""
     
-    fix_prompt = f"""The following SQL query failed:
-                    Query: {original_query}
-                    Error: {error_message}
-                    Original Question: {question}
+    fix_prompt = f"""Database Schema:
+                    {get_schema()}
 
-                    Database Schema:
-                    {SCHEMA}
-
-                    Analyze the error and provide a corrected SQL query that:
+                    The SQL query below failed. Analyze the error and provide a corrected SQL query that:
                     1. Fixes the specific error mentioned
                     2. Still answers the original question
                     3. Uses only valid table and column names from the schema
                     4. Follows SQLite syntax rules
 
-                    Return only the corrected SQL query, nothing else."""
+                    Return only the corrected SQL query, nothing else.
+
+                    Query: {original_query}
+                    Error: {error_message}
+                    Original Question: {question}"""
     
-    response = llm.invoke(fix_prompt)
+    response = call_llm("sql", fix_prompt, stage="fix_sql_error")
     query = response.content.strip()
 
     print(f"[TOOL] Generated fixed SQL Query.")
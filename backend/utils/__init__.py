@@ -1,35 +1,37 @@
-from langchain_ollama import ChatOllama, OllamaEmbeddings
-from langchain_chroma import Chroma
 import re
+import time
 from rank_bm25 import BM25Plus
 
+from utils.config import settings
+from utils.llm_calls import call_llm
+from utils.metrics import vector_search_seconds
+from utils.model_registry import embedding_model
+from utils.startup import lazy_resource
+
 # ChromaDB Configuration
-CHROMA_DIR = "chroma_financial_db"
-COLLECTION_NAME = "financial_docs"
-EMBEDDING_MODEL = "nomic-embed-text"
-BASE_URL = "http://localhost:11434"
-LLM_MODEL = "qwen3"
-
-# Initialize embeddings and vector store
-embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=BASE_URL)
-vector_store = Chroma(
-    collection_name=COLLECTION_NAME,
-    embedding_function=embeddings,
-    persist_directory=CHROMA_DIR
-)
-
-llm = ChatOllama(model=LLM_MODEL, base_url=BASE_URL)
+CHROMA_DIR = settings.CHROMA_DIR
+COLLECTION_NAME = settings.COLLECTION_NAME
+EMBEDDING_MODEL = settings.EMBEDDING_MODEL
+
+# Embedding client (no connection until first use); the vector store opens on first use
+embeddings = embedding_model(EMBEDDING_MODEL)
+
+@lazy_resource("vector_store")
+def get_vector_store():
+    from langchain_chroma import Chroma
+    return Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=embeddings,
+        persist_directory=CHROMA_DIR
+    )
 
 def extract_filters(user_query: str):
     """Extract metadata filters from user query."""
     from models.schemas import ChunkMetadata
     
-    llm_structured = llm.with_structured_output(ChunkMetadata)
-    
+    # Static instructions first and the query last, so Ollama reuses the prefix's KV cache across calls
     prompt = f"""Extract metadata filters from the query. Return None for fields not mentioned.
 
-                USER QUERY: {user_query}
-
                 COMPANY MAPPINGS:
                 - Amazon/AMZN -> amazon
                 - Google/Alphabet/GOOGL/GOOG -> google
@@ -49,9 +51,11 @@ def extract_filters(user_query: str):
                 "Apple 2023 annual report" -> {{"company_name": "apple", "doc_type": "10-k", "fiscal_year": 2023}}
                 "Tesla profitability" -> {{"company_name": "tesla"}}
 
+                USER QUERY: {user_query}
+
                 Extract metadata:"""
     
-    metadata = llm_structured.invoke(prompt)
+    metadata = call_llm("extractor", prompt, schema=ChunkMetadata, stage="extract_filters")
     filters = metadata.model_dump(exclude_none=True)
     return filters
 
@@ -59,10 +63,9 @@ def generate_ranking_keywords(user_query: str):
     """Generate ranking keywords for document retrieval."""
     from models.schemas import RankingKeywords
     
+    # Static instructions first and the query last (KV cache prefix reuse)
     prompt = f"""Generate EXACTLY 5 financial keywords from SEC filings terminology.
 
-                USER QUERY: {user_query}
-
                 USE EXACT TERMS FROM 10-K/10-Q FILINGS:
 
                 STATEMENT HEADINGS:
@@ -88,10 +91,11 @@ def generate_ranking_keywords(user_query: str):
                 "cash flow performance" -> ["consolidated statements of cash flows", "cash flows from operating activities", "net cash provided by operating activities", "free cash flow", "operating activities"]
                 "balance sheet strength" -> ["consolidated balance sheets", "total assets", "stockholders equity", "cash and cash equivalents", "long-term debt"]
 
+                USER QUERY: {user_query}
+
                 Generate EXACTLY 5 keywords:"""
     
-    llm_structured = llm.with_structured_output(RankingKeywords)
-    result = llm_structured.invoke(prompt)
+    result = call_llm("extractor", prompt, schema=RankingKeywords, stage="ranking_keywords")
     return result.keywords
 
 def build_search_kwargs(filters, ranking_keywords, k=3):
@@ -119,12 +123,15 @@ def search_docs(query, filters={}, ranking_keywords=[], k=3):
     """Search documents with metadata and content filters."""
     search_kwargs = build_search_kwargs(filters, ranking_keywords, k)
 
-    retriever = vector_store.as_retriever(
+    retriever = get_vector_store().as_retriever(
         search_type="mmr",
         search_kwargs=search_kwargs
     )
 
-    return retriever.invoke(query)
+    started = time.perf_counter()
+    docs = retriever.invoke(query)
+    vector_search_seconds.observe(time.perf_counter() - started)
+    return docs
 
 def extract_headings_with_content(text):
     """Extract markdown headings with one paragraph of content after them."""
@@ -0,0 +1,172 @@
+"""
+Circuit breakers for Ollama models.
+
+Every Ollama call of a model reports its outcome and latency (scheduler
+queue wait plus time to first byte) to the model's breaker. When, over the
+last CIRCUIT_WINDOW seconds and at least CIRCUIT_MIN_CALLS calls, the error
+rate reaches CIRCUIT_ERROR_RATE or the p95 latency exceeds
+CIRCUIT_P95_SECONDS, the breaker opens: calls of that model fail at once
+with CircuitOpen, so callers switch to cheaper answers instead of waiting
+out their deadline on an overloaded server. After CIRCUIT_OPEN_SECONDS it
+lets CIRCUIT_HALF_OPEN_PROBES calls through (half-open); a fast success
+closes it, a failure opens it again.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+from utils.config import settings
+from utils.metrics import metrics
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a model whose breaker is open"""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Model '{model}' is unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, model: str, window: float = None, min_calls: int = None, error_rate: float = None,
+                 p95_seconds: float = None, open_seconds: float = None, probes: int = None):
+        self.model = model
+        self.window = window or settings.CIRCUIT_WINDOW
+        self.min_calls = min_calls or settings.CIRCUIT_MIN_CALLS
+        self.error_rate = error_rate or settings.CIRCUIT_ERROR_RATE
+        self.p95_seconds = p95_seconds or settings.CIRCUIT_P95_SECONDS
+        self.open_seconds = open_seconds or settings.CIRCUIT_OPEN_SECONDS
+        self.probes = probes or settings.CIRCUIT_HALF_OPEN_PROBES
+        self.state = CLOSED
+        self.reason = None
+        self._samples: deque = deque()
+        self._opened_until = 0.0
+        self._probing = 0
+        self._lock = threading.Lock()
+        self.counters = {"trips": 0, "rejected": 0, "probes": 0}
+
+    def allow(self) -> bool:
+        """Raise CircuitOpen unless the call may proceed; True if the call is a half-open probe"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_until - time.monotonic()
+                if remaining > 0:
+                    self.counters["rejected"] += 1
+                    raise CircuitOpen(self.model, remaining)
+                self.state = HALF_OPEN
+                self._probing = 0
+            if self.state == HALF_OPEN:
+                if self._probing >= self.probes:
+                    self.counters["rejected"] += 1
+                    raise CircuitOpen(self.model, 1)
+                self._probing += 1
+                self.counters["probes"] += 1
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float, probe: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if probe:
+                self._probing -= 1
+                if self.state != HALF_OPEN:
+                    return
+                if ok and latency <= self.p95_seconds:
+                    self.state = CLOSED
+                    self.reason = None
+                    self._samples.clear()
+                    print(f"[CIRCUIT] {self.model} closed (probe succeeded in {latency:.1f}s)")
+                else:
+                    self._open("probe failed" if not ok else f"probe took {latency:.1f}s")
+                return
+            if self.state != CLOSED:
+                return
+            self._samples.append((now, ok, latency))
+            while self._samples and self._samples[0][0] < now - self.window:
+                self._samples.popleft()
+            if len(self._samples) < self.min_calls:
+                return
+            errors = sum(1 for _, sample_ok, _ in self._samples if not sample_ok)
+            if errors / len(self._samples) >= self.error_rate:
+                self._open(f"error rate {errors}/{len(self._samples)}")
+                return
+            latencies = sorted(sample[2] for sample in self._samples if sample[1])
+            if latencies:
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                if p95 > self.p95_seconds:
+                    self._open(f"p95 latency {p95:.1f}s")
+
+    def release(self, probe: bool = False):
+        """End a call that says nothing about the model (cut short by the caller's deadline)"""
+        if probe:
+            with self._lock:
+                self._probing -= 1
+
+    def _open(self, reason: str):
+        self.state = OPEN
+        self.reason = reason
+        self._opened_until = time.monotonic() + self.open_seconds
+        self._samples.clear()
+        self.counters["trips"] += 1
+        print(f"[CIRCUIT] {self.model} opened for {self.open_seconds:.0f}s ({reason})")
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls would be rejected"""
+        with self._lock:
+            return self.state == OPEN and self._opened_until > time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "reason": self.reason,
+                "retry_in_s": round(max(0.0, self._opened_until - time.monotonic()), 1) if self.state == OPEN else 0,
+                "window_calls": len(self._samples),
+                **self.counters,
+            }
+
+
+class CircuitBreakers:
+    """One breaker per model, created on first use"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(model, CircuitBreaker(model))
+        return breaker
+
+    def is_open(self, model: str) -> bool:
+        breaker = self._breakers.get(model)
+        return breaker is not None and breaker.is_open
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.model: breaker.stats() for breaker in breakers}
+
+
+circuit_breakers = CircuitBreakers()
+
+
+@metrics.collector
+def _circuit_metrics():
+    for model, info in circuit_breakers.stats().items():
+        labels = {"model": model}
+        yield ("circuit_breaker_state", "gauge", "Model circuit state (0 closed, 1 half-open, 2 open)",
+               labels, _STATE_VALUES[info["state"]])
+        yield "circuit_breaker_trips_total", "counter", "Times the model circuit opened", labels, info["trips"]
+        yield ("circuit_breaker_rejected_total", "counter", "Calls failed fast by an open circuit",
+               labels, info["rejected"])
+        yield ("circuit_breaker_probes_total", "counter", "Half-open probe calls let through",
+               labels, info["probes"])
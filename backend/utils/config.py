@@ -1,15 +1,107 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _model_profiles(base_model: str, small_model: str, sql_model: str,
+                    keep_alive: str, sql_keep_alive: str) -> dict:
+    """Default per-node model profiles, overridable with the MODEL_PROFILES JSON env var"""
+    profiles = {
+        # One-word / tiny-JSON outputs: small model, no reasoning trace
+        "router": {"model": small_model, "reasoning": False, "num_predict": 32, "temperature": 0.0, "num_ctx": 2048,
+                   "keep_alive": keep_alive},
+        "grader": {"model": small_model, "reasoning": False, "num_predict": 32, "temperature": 0.0, "num_ctx": 8192,
+                   "keep_alive": keep_alive},
+        "extractor": {"model": small_model, "reasoning": False, "num_predict": 128, "temperature": 0.0, "num_ctx": 4096,
+                      "keep_alive": keep_alive},
+        "summarizer": {"model": small_model, "reasoning": False, "num_predict": 256, "temperature": 0.0, "num_ctx": 4096,
+                       "keep_alive": keep_alive},
+        "rewriter": {"model": small_model, "reasoning": False, "num_predict": 256, "temperature": 0.0, "num_ctx": 4096,
+                     "keep_alive": keep_alive},
+        # Long-form answers. With reasoning on, num_predict also counts the thinking
+        # trace, so it leaves room for a long trace before the answer starts
+        "generator": {"model": base_model, "reasoning": True, "num_predict": 4096, "temperature": None, "num_ctx": 8192,
+                      "keep_alive": keep_alive},
+        # One SQL statement; gpt-oss thinks briefly even with reasoning off
+        "sql": {"model": sql_model, "reasoning": False, "num_predict": 1024, "temperature": 0.0, "num_ctx": 8192,
+                "keep_alive": sql_keep_alive},
+    }
+    for name, overrides in json.loads(os.getenv("MODEL_PROFILES", "{}")).items():
+        if name not in profiles:
+            raise ValueError(f"MODEL_PROFILES: unknown profile '{name}' (known: {', '.join(profiles)})")
+        profiles[name].update(overrides)
+    return profiles
+
 class Settings:
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3")
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+    OLLAMA_SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL", OLLAMA_MODEL)
+    SQL_MODEL = os.getenv("SQL_MODEL", "gpt-oss")
+    # Keep-alive HTTP pool shared by all Ollama clients
+    OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+    OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+    # Ollama hosts per model, "*" for the others (default: OLLAMA_BASE_URL alone), e.g.
+    # {"*": ["http://gpu1:11434", "http://gpu2:11434"], "gpt-oss": ["http://gpu3:11434"]}
+    OLLAMA_HOSTS = json.loads(os.getenv("OLLAMA_HOSTS", "{}"))
+    OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+    # Ejection: consecutive failures, or time to first byte this many times the best other host's (same model)
+    OLLAMA_EJECT_FAILURES = int(os.getenv("OLLAMA_EJECT_FAILURES", "2"))
+    OLLAMA_EJECT_SECONDS = float(os.getenv("OLLAMA_EJECT_SECONDS", "30"))
+    OLLAMA_SLOW_FACTOR = float(os.getenv("OLLAMA_SLOW_FACTOR", "3"))
+    OLLAMA_SLOW_MIN_SECONDS = float(os.getenv("OLLAMA_SLOW_MIN_SECONDS", "2"))
+    # Profiles whose calls may be resent to another host (embeddings always may)
+    OLLAMA_RETRY_PROFILES = os.getenv("OLLAMA_RETRY_PROFILES", "router,grader,extractor").split(",")
+    
+    # How long Ollama keeps a model loaded after a request ("30m", seconds, or -1 for ever)
+    OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    SQL_KEEP_ALIVE = os.getenv("SQL_KEEP_ALIVE", "10m")
+    # Seconds (the embeddings client only takes an integer)
+    EMBEDDING_KEEP_ALIVE = int(os.getenv("EMBEDDING_KEEP_ALIVE", "1800"))
+    # Load every configured model at startup, then ping them to keep them resident
+    OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "true").lower() == "true"
+    OLLAMA_WARMUP_TIMEOUT = float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "120"))
+    OLLAMA_PING_INTERVAL = float(os.getenv("OLLAMA_PING_INTERVAL", "240"))
+    
+    # LLM scheduler: concurrent calls per model and Ollama host (match the server's OLLAMA_NUM_PARALLEL).
+    # Limits are per worker process: with N workers, divide them by N
+    LLM_PARALLEL = int(os.getenv("LLM_PARALLEL", "4"))
+    LLM_PARALLEL_PER_MODEL = json.loads(os.getenv("LLM_PARALLEL_PER_MODEL", "{}"))
+    # Models that fit in memory together (0: no limit); more models are served in turns (per worker)
+    LLM_MAX_LOADED_MODELS = int(os.getenv("LLM_MAX_LOADED_MODELS", "0"))
+    # Longest a call waits while calls for an already running model are preferred
+    LLM_AFFINITY_WINDOW = float(os.getenv("LLM_AFFINITY_WINDOW", "2.0"))
+    LLM_QUEUE_MAX_WAIT = float(os.getenv("LLM_QUEUE_MAX_WAIT", "120"))
+    # A call whose model load took longer than this counts as a swap-in
+    LLM_SWAP_LOAD_SECONDS = float(os.getenv("LLM_SWAP_LOAD_SECONDS", "0.5"))
+    
+    # Circuit breaker per model: opens when, over the last CIRCUIT_WINDOW seconds (and at least
+    # CIRCUIT_MIN_CALLS calls), the error rate or the p95 latency to first byte is too high
+    CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", "60"))
+    CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+    CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+    CIRCUIT_P95_SECONDS = float(os.getenv("CIRCUIT_P95_SECONDS", "20"))
+    # Fail fast this long, then let CIRCUIT_HALF_OPEN_PROBES calls through to test the model
+    CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+    CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+    # Last good answers kept to serve while the models are unavailable
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+    
+    # Exact-prompt cache of temperature-0 LLM calls: TTL (seconds) per call site (call_llm stage)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_TTLS = json.loads(os.getenv("LLM_CACHE_TTLS", json.dumps({
+        "extract_filters": 86400, "ranking_keywords": 86400, "route": 86400,
+        "grade_documents": 3600, "transform_query": 3600, "generate_sql_query": 3600,
+    })))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+    
+    # Per-node model settings (model, reasoning, num_predict, temperature, num_ctx, keep_alive)
+    MODEL_PROFILES = _model_profiles(OLLAMA_MODEL, OLLAMA_SMALL_MODEL, SQL_MODEL, OLLAMA_KEEP_ALIVE, SQL_KEEP_ALIVE)
     
     # ChromaDB
-    CHROMA_DIR = os.getenv("CHROMA_DIR", "chroma_db")
+    CHROMA_DIR = os.getenv("CHROMA_DIR", "chroma_financial_db")
     COLLECTION_NAME = os.getenv("COLLECTION_NAME", "financial_docs")
     
     # Database
@@ -20,6 +112,95 @@ class Settings:
     PORT = int(os.getenv("PORT", "8000"))
     MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", "10485760"))
     ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
+    # Initialize every lazy resource at startup instead of on first use (main.py --preload)
+    PRELOAD = os.getenv("PRELOAD", "false").lower() == "true"
+    
+    # Request deadlines (seconds)
+    REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "30"))
+    LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "30"))
+    # Minimum budget a node needs before it is worth starting
+    NODE_BUDGETS = {
+        "retrieve": float(os.getenv("BUDGET_RETRIEVE", "6")),
+        "grade_documents": float(os.getenv("BUDGET_GRADE", "4")),
+        "transform_query": float(os.getenv("BUDGET_TRANSFORM", "4")),
+        "generate": float(os.getenv("BUDGET_GENERATE", "8")),
+    }
+    
+    # Embedding router
+    ROUTER_CACHE = os.getenv("ROUTER_CACHE", "db/router_centroids.json")
+    # Below this cosine margin between the two best agents, ask the LLM
+    ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.03"))
+    
+    # Graph checkpointing
+    CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "db/checkpoints.db")
+    CHECKPOINT_RETENTION_HOURS = float(os.getenv("CHECKPOINT_RETENTION_HOURS", "24"))
+    CHECKPOINT_MAINTENANCE_INTERVAL = int(os.getenv("CHECKPOINT_MAINTENANCE_INTERVAL", "3600"))
+    CHECKPOINT_VACUUM_EVERY = int(os.getenv("CHECKPOINT_VACUUM_EVERY", "24"))
+    
+    # Threads running blocking agent work for the async API
+    AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "8"))
+    
+    # Admission control: concurrent turns per agent, then a bounded wait queue
+    ADMISSION_LIMITS = {
+        "financial": int(os.getenv("ADMISSION_LIMIT_FINANCIAL", "2")),
+        "llm": int(os.getenv("ADMISSION_LIMIT_LLM", "2")),
+    }
+    ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+    ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+    
+    # Background chat jobs (POST /chat/start, poll /chat/tasks/{task_id})
+    JOBS_DB = os.getenv("JOBS_DB", "db/jobs.db")
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+    JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+    
+    # Chat sessions: "memory" (LRU bounded by count and bytes) or "sqlite"
+    # ("sqlite" is required when running several worker processes)
+    SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+    SESSION_DB = os.getenv("SESSION_DB", "db/sessions.db")
+    SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+    SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+    SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", "50"))
+    
+    # State shared by all worker processes on the host (corpus version, history summaries, leases)
+    SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", "db/shared_state.db")
+    
+    # Conversation history: turns kept verbatim, older turns are summarised
+    HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+    # Max prompt tokens of history per agent
+    HISTORY_TOKEN_BUDGETS = {
+        "financial": int(os.getenv("HISTORY_TOKENS_FINANCIAL", "1024")),
+        "llm": int(os.getenv("HISTORY_TOKENS_LLM", "2048")),
+        "sql": int(os.getenv("HISTORY_TOKENS_SQL", "512")),
+        "web": int(os.getenv("HISTORY_TOKENS_WEB", "1024")),
+    }
+    
+    # Request tracing (GET /api/v1/debug/traces/{request_id})
+    # Fraction of chat turns traced; 0 disables tracing
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+    TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+    TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "300"))
+    
+    # Debug artifacts (retrieved docs, answers) written per request under
+    # DEBUG_ARTIFACTS_DIR/<request_id>/ by a background writer; off by default
+    DEBUG_ARTIFACTS = os.getenv("DEBUG_ARTIFACTS", "false").lower() == "true"
+    DEBUG_ARTIFACTS_DIR = os.getenv("DEBUG_ARTIFACTS_DIR", "debug_logs")
+    DEBUG_ARTIFACTS_SAMPLE_RATE = float(os.getenv("DEBUG_ARTIFACTS_SAMPLE_RATE", "1.0"))
+    DEBUG_ARTIFACTS_MAX_BYTES = int(os.getenv("DEBUG_ARTIFACTS_MAX_BYTES", str(256 * 1024)))
+    DEBUG_ARTIFACTS_MAX_REQUESTS = int(os.getenv("DEBUG_ARTIFACTS_MAX_REQUESTS", "200"))
+    DEBUG_ARTIFACTS_RETENTION_HOURS = float(os.getenv("DEBUG_ARTIFACTS_RETENTION_HOURS", "24"))
+    DEBUG_ARTIFACTS_QUEUE_SIZE = int(os.getenv("DEBUG_ARTIFACTS_QUEUE_SIZE", "256"))
+    
+    # Interaction log (logs/chat_YYYYMMDD.jsonl), written in batches by a background thread
+    LOG_DIR = os.getenv("LOG_DIR", "logs")
+    LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+    LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+    # Records kept in memory while the writer is behind; beyond that they are dropped
+    LOG_BUFFER_MAX = int(os.getenv("LOG_BUFFER_MAX", "20000"))
+    # Rotate the day's file past this size; rotated and finished days are gzipped
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+    LOG_COMPRESS = os.getenv("LOG_COMPRESS", "true").lower() == "true"
     
     # Upload
     UPLOAD_DIR = "uploads"
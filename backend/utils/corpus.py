@@ -0,0 +1,12 @@
+from utils.shared_state import shared_state
+
+_COUNTER = "corpus_version"
+
+
+def corpus_version() -> int:
+    """Version of the indexed document corpus; changes whenever documents are added (in any worker)"""
+    return shared_state.counter(_COUNTER)
+
+
+def bump_corpus_version() -> int:
+    return shared_state.increment(_COUNTER)
@@ -87,5 +87,6 @@ def init_database():
     print("Database initialized with sample data")
     return db_path
 
-# Initialize database when module is imported
-init_database()
\ No newline at end of file
+# Create the sample database with `python -m utils.database` (not on import)
+if __name__ == "__main__":
+    init_database()
\ No newline at end of file
@@ -0,0 +1,115 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from utils.config import settings
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs past its deadline"""
+
+    def __init__(self, stage: str, partial: str = ""):
+        super().__init__(f"Deadline exceeded during '{stage}'")
+        self.stage = stage
+        self.partial = partial
+        # Intermediate results of the turn, filled in by deadline_scope
+        self.progress = {}
+
+
+class Cancelled(DeadlineExceeded):
+    """Raised when the caller cancelled the work (a job), as opposed to it running out of time"""
+
+    def __init__(self):
+        super().__init__("cancelled")
+
+
+class Deadline:
+    """Request-scoped deadline shared by every node and LLM call of a turn"""
+
+    def __init__(self, seconds: float, parent: "Deadline" = None):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds
+        # Enclosing deadline (e.g. a job's), whose cancellation also ends this one
+        self.parent = parent
+        # Best intermediate results so far (retrieved/graded docs, partial answer)
+        self.progress = {}
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or (self.parent is not None and self.parent.cancelled)
+
+    def remaining(self) -> float:
+        if self.cancelled:
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self) -> bool:
+        return self.cancelled or time.monotonic() >= self.expires_at
+
+    def cancel(self):
+        """Expire the deadline and its nested scopes now; running nodes and LLM streams stop at their next check"""
+        self._cancelled = True
+
+    def can_afford(self, *nodes: str) -> bool:
+        """True if the remaining time covers the budgets of all given nodes"""
+        needed = sum(settings.NODE_BUDGETS.get(node, 0.0) for node in nodes)
+        return self.remaining() >= needed
+
+    def check(self, stage: str):
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+    def record(self, key: str, value):
+        self.progress[key] = value
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def get_deadline() -> Optional[Deadline]:
+    """Get the deadline of the current request (None outside a request)"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(seconds: float = None):
+    """Run a block under a request deadline; nested scopes keep the tighter one"""
+    seconds = settings.REQUEST_TIMEOUT_SECONDS if seconds is None else seconds
+    outer = _current_deadline.get()
+    deadline = Deadline(seconds, parent=outer)
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    except DeadlineExceeded as e:
+        e.progress = dict(deadline.progress)
+        raise
+    finally:
+        _current_deadline.reset(token)
+
+
+def can_afford(*nodes: str) -> bool:
+    """Budget check for the current request; always True without a deadline"""
+    deadline = get_deadline()
+    return deadline is None or deadline.can_afford(*nodes)
+
+
+def record_progress(key: str, value):
+    """Checkpoint an intermediate result so a timeout can still return it"""
+    deadline = get_deadline()
+    if deadline is not None:
+        deadline.record(key, value)
+
+
+def check_deadline(stage: str):
+    deadline = get_deadline()
+    if deadline is not None:
+        deadline.check(stage)
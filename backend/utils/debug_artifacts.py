@@ -0,0 +1,165 @@
+"""
+Background recorder for per-request debug artifacts.
+
+Request code calls `debug_recorder.record(name, content)`, which only puts
+the content on a bounded queue; a writer thread stores it as
+DEBUG_ARTIFACTS_DIR/<request_id>/<name>.md (repeated artifacts of a request,
+e.g. one per retrieval loop, are appended). Requests are sampled as a
+whole, artifacts are truncated to DEBUG_ARTIFACTS_MAX_BYTES, and old
+request directories are pruned by count and age. When the queue is full
+artifacts are dropped rather than slowing the request down.
+"""
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, Optional
+
+from utils.config import settings
+from utils.metrics import metrics
+from utils.tracing import current_request_id
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+_PRUNE_EVERY = 20
+
+
+class DebugRecorder:
+    def __init__(self, enabled: bool = None, directory: str = None, sample_rate: float = None,
+                 max_bytes: int = None, max_requests: int = None, retention_hours: float = None,
+                 queue_size: int = None):
+        self.enabled = settings.DEBUG_ARTIFACTS if enabled is None else enabled
+        self.directory = directory or settings.DEBUG_ARTIFACTS_DIR
+        self.sample_rate = settings.DEBUG_ARTIFACTS_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.max_bytes = max_bytes or settings.DEBUG_ARTIFACTS_MAX_BYTES
+        self.max_requests = max_requests or settings.DEBUG_ARTIFACTS_MAX_REQUESTS
+        self.retention_hours = settings.DEBUG_ARTIFACTS_RETENTION_HOURS if retention_hours is None else retention_hours
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size or settings.DEBUG_ARTIFACTS_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counters = {"written": 0, "dropped": 0, "failed": 0}
+
+    def sampled(self, request_id: str) -> bool:
+        """Same decision for every artifact of a request"""
+        return (zlib.crc32(request_id.encode("utf-8")) % 10000) < self.sample_rate * 10000
+
+    def record(self, name: str, content: str, request_id: str = None):
+        """Queue an artifact of the current request (no-op when disabled or not sampled)"""
+        if not self.enabled:
+            return
+        request_id = request_id or current_request_id() or f"adhoc-{uuid.uuid4().hex[:12]}"
+        if not self.sampled(request_id):
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((request_id, name, content[:self.max_bytes], time.time()))
+        except queue.Full:
+            with self._lock:
+                self.counters["dropped"] += 1
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._work, name="debug-artifacts", daemon=True)
+                    self._thread.start()
+
+    def _work(self):
+        writes = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            try:
+                self._write(*item)
+                self.counters["written"] += 1
+                writes += 1
+                if writes % _PRUNE_EVERY == 0:
+                    self.prune()
+            except Exception as e:
+                self.counters["failed"] += 1
+                print(f"[DEBUG] Writing artifact {item[1]} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _folder(self, request_id: str) -> Optional[str]:
+        """Directory of a request's artifacts; None for ids that would resolve outside DEBUG_ARTIFACTS_DIR"""
+        name = _UNSAFE.sub("_", request_id)
+        if name in ("", ".", ".."):
+            return None
+        root = os.path.realpath(self.directory)
+        folder = os.path.realpath(os.path.join(root, name))
+        return folder if os.path.dirname(folder) == root else None
+
+    def _write(self, request_id: str, name: str, content: str, created_at: float):
+        folder = self._folder(request_id)
+        if folder is None:
+            raise ValueError(f"invalid request id {request_id!r}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{_UNSAFE.sub('_', name)}.md")
+        separator = "\n\n---\n\n" if os.path.exists(path) else ""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(separator + content)
+        os.utime(folder, (created_at, created_at))
+
+    def prune(self) -> int:
+        """Delete request folders beyond the count limit or older than the retention period"""
+        if not os.path.isdir(self.directory):
+            return 0
+        folders = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                folders.append((entry.stat().st_mtime, entry.path))
+        folders.sort(reverse=True)
+        cutoff = time.time() - self.retention_hours * 3600
+        removed = 0
+        for index, (mtime, path) in enumerate(folders):
+            if index >= self.max_requests or mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until queued artifacts are written"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def close(self, timeout: float = 5.0):
+        """Write what is queued, then stop the writer thread"""
+        if self._thread is not None:
+            self.flush(timeout)
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def get(self, request_id: str) -> Optional[Dict[str, str]]:
+        folder = self._folder(request_id)
+        if folder is None or not os.path.isdir(folder):
+            return None
+        artifacts = {}
+        for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            with open(entry.path, "r", encoding="utf-8") as f:
+                artifacts[entry.name[:-3] if entry.name.endswith(".md") else entry.name] = f.read()
+        return artifacts
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "queued": self._queue.qsize(), **self.counters}
+
+
+debug_recorder = DebugRecorder()
+
+
+@metrics.collector
+def _debug_artifact_metrics():
+    stats = debug_recorder.stats()
+    yield "debug_artifacts_queue_depth", "gauge", "Debug artifacts waiting to be written", {}, stats["queued"]
+    for outcome in ("written", "dropped", "failed"):
+        yield ("debug_artifacts_total", "counter", "Debug artifacts by outcome",
+               {"outcome": outcome}, stats[outcome])
@@ -0,0 +1,121 @@
+"""
+Exact-prompt cache for deterministic LLM calls.
+
+call_llm looks a call up here when its call site (stage) has a TTL in
+LLM_CACHE_TTLS and its model profile runs at temperature 0. The key hashes
+the model, the generation parameters, the full message list and the output
+schema, so any change to the prompt, the retrieved documents or the profile
+is a miss. Entries live in an in-process LRU (LLM_CACHE_MAX_ENTRIES) and in
+the shared SQLite store, which every worker reads and which outlives
+restarts; a disk hit is copied into memory.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from utils.config import settings
+from utils.metrics import llm_cache_requests, metrics
+from utils.shared_state import shared_state
+
+_KEY_PREFIX = "llm_cache:"
+# Profile settings that do not change the output
+_IGNORED_PARAMS = ("keep_alive",)
+
+
+def is_deterministic(profile: Dict[str, Any]) -> bool:
+    return profile.get("temperature") == 0
+
+
+def cache_key(profile: Dict[str, Any], messages, schema: Optional[Type[BaseModel]] = None) -> str:
+    if isinstance(messages, str):
+        serialized = [("human", messages)]
+    else:
+        serialized = [(getattr(m, "type", "human"), getattr(m, "content", m)) for m in messages]
+    params = {key: value for key, value in profile.items() if key not in _IGNORED_PARAMS}
+    payload = json.dumps({
+        "params": params,
+        "messages": serialized,
+        "schema": schema.model_json_schema() if schema else None,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.LLM_CACHE_MAX_ENTRIES
+        # key -> (expires_at, content)
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"memory": 0, "disk": 0, "miss": 0})
+
+    def ttl(self, stage: str) -> Optional[float]:
+        """Cache lifetime for a call site, None when it is not cached"""
+        return settings.LLM_CACHE_TTLS.get(stage) if settings.LLM_CACHE_ENABLED else None
+
+    def get(self, key: str, stage: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._memory.move_to_end(key)
+                    self._hit(stage, "memory")
+                    return entry[1]
+                del self._memory[key]
+        stored = shared_state.get(_KEY_PREFIX + key)
+        if stored is not None:
+            with self._lock:
+                self._put(key, stored["content"], stored["expires_at"])
+                self._hit(stage, "disk")
+            return stored["content"]
+        with self._lock:
+            self._hit(stage, "miss")
+        return None
+
+    def set(self, key: str, content: str, ttl: float):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._put(key, content, expires_at)
+        shared_state.set(_KEY_PREFIX + key, {"content": content, "expires_at": expires_at}, ttl=ttl)
+
+    def _put(self, key: str, content: str, expires_at: float):
+        self._memory[key] = (expires_at, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _hit(self, stage: str, result: str):
+        self._counts[stage][result] += 1
+        llm_cache_requests.inc(stage=stage, result=result)
+
+    def clear(self):
+        """Drop the in-process entries (shared entries expire with their TTL)"""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for stage, counts in self._counts.items():
+                lookups = sum(counts.values())
+                stages[stage] = {
+                    **counts,
+                    "hit_rate": round((counts["memory"] + counts["disk"]) / lookups, 3) if lookups else 0.0,
+                }
+            return {"entries": len(self._memory), "max_entries": self.max_entries, "stages": stages}
+
+
+llm_cache = LLMCache()
+
+
+@metrics.collector
+def _llm_cache_metrics():
+    stats = llm_cache.stats()
+    yield "llm_cache_entries", "gauge", "LLM responses held in the in-process cache", {}, stats["entries"]
+    for stage, info in stats["stages"].items():
+        yield ("llm_cache_hit_ratio", "gauge", "Share of LLM cache lookups answered from the cache, per call site",
+               {"stage": stage}, info["hit_rate"])
@@ -0,0 +1,126 @@
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Optional, Type
+
+import httpx
+from langchain_core.messages import AIMessage, message_chunk_to_message
+from pydantic import BaseModel
+
+from utils.config import settings
+from utils.deadline import DeadlineExceeded, get_deadline
+from utils.llm_cache import cache_key, is_deterministic, llm_cache
+from utils.model_profiles import get_chat_model, get_profile, record_call
+from utils.ollama_pool import idempotent
+from utils.tracing import record_span, span
+
+# Receives answer tokens of the current request (set by streaming endpoints)
+_token_sink: ContextVar[Optional[Callable[[dict], None]]] = ContextVar("token_sink", default=None)
+
+
+@contextmanager
+def stream_tokens(sink: Callable[[dict], None]):
+    """Send tokens of publishing call_llm calls in this context to sink"""
+    token = _token_sink.set(sink)
+    try:
+        yield
+    finally:
+        _token_sink.reset(token)
+
+
+def emit_stream_event(event: dict):
+    """Send an event to the current request's stream, if it is being streamed"""
+    sink = _token_sink.get()
+    if sink is not None:
+        sink(event)
+
+
+def call_llm(llm, messages, schema: Optional[Type[BaseModel]] = None, stage: str = "llm",
+             publish: bool = False):
+    """
+    Call a chat model under the current request deadline.
+
+    `llm` is either a model profile name (see Settings.MODEL_PROFILES) or a
+    chat model instance. The response is streamed so the deadline can be
+    checked between chunks. On expiry the stream is closed, which drops the
+    HTTP connection and makes Ollama abort the generation instead of
+    finishing it in the background.
+    With `publish`, content chunks also go to the request's token sink
+    (a "start" event first, since a turn may generate more than once).
+    Calls of a temperature-0 profile at a call site listed in
+    LLM_CACHE_TTLS are answered from the exact-prompt cache when possible.
+    Returns a message, or a parsed `schema` instance when a schema is given.
+    """
+    profile = llm if isinstance(llm, str) else None
+    if profile:
+        llm = get_chat_model(profile)
+
+    deadline = get_deadline()
+    if deadline is not None:
+        deadline.check(stage)
+
+    ttl = llm_cache.ttl(stage) if profile and not publish else None
+    key = None
+    if ttl and is_deterministic(get_profile(profile)):
+        key = cache_key(get_profile(profile), messages, schema)
+        started = time.perf_counter()
+        content = llm_cache.get(key, stage)
+        if content is not None:
+            record_span(stage, "llm", time.perf_counter() - started, profile=profile, cache="hit")
+            return schema.model_validate_json(content) if schema else AIMessage(content=content)
+
+    runnable = llm.bind(format=schema.model_json_schema()) if schema else llm
+    sink = _token_sink.get() if publish else None
+    if sink is not None:
+        sink({"type": "start", "stage": stage})
+
+    # Short deterministic calls may be resent to another Ollama host
+    retry = idempotent() if profile in settings.OLLAMA_RETRY_PROFILES else nullcontext()
+    with span(stage, "llm", profile=profile) as current, retry:
+        if current is not None:
+            current.attrs["prompt_bytes"] = _prompt_bytes(messages)
+        message = _stream_call(runnable, messages, stage, profile, deadline, sink)
+    result = schema.model_validate_json(message.content) if schema else message
+    # Only responses that parsed are worth replaying
+    if key is not None:
+        llm_cache.set(key, message.content, ttl)
+    return result
+
+
+def _prompt_bytes(messages) -> int:
+    if isinstance(messages, str):
+        return len(messages.encode("utf-8"))
+    return sum(len(str(getattr(m, "content", m)).encode("utf-8")) for m in messages)
+
+
+def _stream_call(runnable, messages, stage: str, profile: Optional[str], deadline, sink):
+    started = time.perf_counter()
+    failed = True
+    stream = runnable.stream(messages)
+    aggregate = None
+    try:
+        try:
+            for chunk in stream:
+                aggregate = chunk if aggregate is None else aggregate + chunk
+                if sink is not None and chunk.content:
+                    sink({"type": "token", "content": chunk.content})
+                if deadline is not None and deadline.expired:
+                    break
+        except (DeadlineExceeded, httpx.TimeoutException):
+            # HTTP timeouts are bounded by the deadline (model_registry), so one under an
+            # expired deadline is the deadline, whether it hit the first byte or a later chunk
+            if deadline is None or not deadline.expired:
+                raise
+        if deadline is not None and deadline.expired:
+            partial = aggregate.content if aggregate is not None else ""
+            deadline.record(f"{stage}_partial", partial)
+            raise DeadlineExceeded(stage, partial=partial)
+        failed = False
+    finally:
+        stream.close()
+        if profile:
+            record_call(profile, time.perf_counter() - started, error=failed)
+
+    if aggregate is None:
+        raise ValueError(f"Empty response from model during '{stage}'")
+    return message_chunk_to_message(aggregate)
@@ -0,0 +1,230 @@
+"""
+Model-affinity scheduler for Ollama calls.
+
+Every Ollama API call (chat, generate, embed) takes a slot for its model
+before it is sent (see model_registry.InstrumentedTransport), so:
+
+- each model runs at most LLM_PARALLEL calls at once per Ollama host
+  serving it (per model overrides in LLM_PARALLEL_PER_MODEL; match the
+  server's OLLAMA_NUM_PARALLEL);
+- when a slot frees up, waiting calls for a model that is already running
+  go first, so same-model work is batched instead of alternating models;
+- with LLM_MAX_LOADED_MODELS set (models that fit in memory together), a
+  call for another model only starts once a loaded one has drained;
+- interactive calls go before background work (summaries, warmup) and
+  ingest (document embeddings); `with llm_priority("ingest"):` marks them.
+
+Affinity is bounded: a call that waited longer than LLM_AFFINITY_WINDOW
+seconds (counted from the last model switch) is served next, draining
+other models if it has to, so each model gets a time slice.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from utils.config import settings
+from utils.deadline import DeadlineExceeded, get_deadline
+from utils.metrics import llm_queue_seconds, metrics
+from utils.ollama_pool import ollama_pool
+from utils.tracing import record_span
+
+PRIORITIES = {"interactive": 0, "background": 1, "ingest": 2}
+
+_COUNTER_HELP = {
+    "granted": "Ollama calls started by the scheduler",
+    "timeouts": "Ollama calls that gave up waiting for a model slot",
+    "switches": "Calls started for a different model than the previous call",
+    "evictions": "Estimated model unloads (more models used than LLM_MAX_LOADED_MODELS)",
+}
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default="interactive")
+
+
+@contextmanager
+def llm_priority(name: str):
+    """Run Ollama calls of this block at a priority ("interactive", "background", "ingest")"""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Ticket:
+    __slots__ = ("model", "priority", "seq", "enqueued", "granted", "event")
+
+    def __init__(self, model: str, priority: str, seq: int):
+        self.model = model
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (PRIORITIES[self.priority], self.seq) < (PRIORITIES[other.priority], other.seq)
+
+
+class LLMScheduler:
+    def __init__(self, parallel: int = None, per_model: Dict[str, int] = None, max_loaded: int = None,
+                 affinity_window: float = None, max_wait: float = None):
+        self.parallel = parallel or settings.LLM_PARALLEL
+        self.per_model = settings.LLM_PARALLEL_PER_MODEL if per_model is None else per_model
+        self.max_loaded = settings.LLM_MAX_LOADED_MODELS if max_loaded is None else max_loaded
+        self.affinity_window = settings.LLM_AFFINITY_WINDOW if affinity_window is None else affinity_window
+        self.max_wait = settings.LLM_QUEUE_MAX_WAIT if max_wait is None else max_wait
+        self._lock = threading.Lock()
+        self._queues: Dict[str, List[_Ticket]] = defaultdict(list)
+        self._active: Dict[str, int] = defaultdict(int)
+        self._seq = itertools.count()
+        self._last_model: Optional[str] = None
+        self._switched_at = 0.0
+        # Models assumed loaded, least recently used first (only tracked with max_loaded)
+        self._resident: "OrderedDict[str, None]" = OrderedDict()
+        self._counts = defaultdict(lambda: {"granted": 0, "timeouts": 0, "switches": 0, "evictions": 0})
+
+    def capacity(self, model: str) -> int:
+        """Parallel calls per host times the hosts serving the model"""
+        return self.per_model.get(model, self.parallel) * ollama_pool.size(model)
+
+    def _running_models(self) -> int:
+        return sum(1 for count in self._active.values() if count > 0)
+
+    def _blocked_by_memory(self, model: str) -> bool:
+        return (self.max_loaded > 0 and self._active[model] == 0
+                and self._running_models() >= self.max_loaded)
+
+    def _can_run(self, model: str) -> bool:
+        return self._active[model] < self.capacity(model) and not self._blocked_by_memory(model)
+
+    def _pick(self) -> Optional[_Ticket]:
+        heads = [queue[0] for queue in self._queues.values() if queue]
+        if not heads:
+            return None
+        oldest = min(heads)
+        # Waiting counts from the last model switch, so each model gets a time slice
+        overdue = time.monotonic() - max(oldest.enqueued, self._switched_at) > self.affinity_window
+        if overdue and self._can_run(oldest.model):
+            return oldest
+        runnable = [ticket for ticket in heads if self._can_run(ticket.model)]
+        if self._blocked_by_memory(oldest.model):
+            if overdue:
+                # Let the running models drain so this one can be loaded
+                return None
+            # Lower priority work must not keep the other model from loading
+            runnable = [ticket for ticket in runnable if ticket.priority == oldest.priority]
+        if not runnable:
+            return None
+
+        def affinity(ticket: _Ticket) -> tuple:
+            warm = self._active[ticket.model] > 0 or ticket.model == self._last_model
+            return PRIORITIES[ticket.priority], not warm, ticket.seq
+
+        return min(runnable, key=affinity)
+
+    def _grant(self, ticket: _Ticket):
+        model = ticket.model
+        heapq.heappop(self._queues[model])
+        self._active[model] += 1
+        counts = self._counts[model]
+        counts["granted"] += 1
+        if self._last_model is not None and model != self._last_model:
+            counts["switches"] += 1
+            self._switched_at = time.monotonic()
+        self._last_model = model
+        if self.max_loaded > 0:
+            if model not in self._resident and len(self._resident) >= self.max_loaded:
+                evicted, _ = self._resident.popitem(last=False)
+                self._counts[evicted]["evictions"] += 1
+            self._resident[model] = None
+            self._resident.move_to_end(model)
+        ticket.granted = True
+        ticket.event.set()
+
+    def _dispatch(self):
+        while True:
+            ticket = self._pick()
+            if ticket is None:
+                return
+            self._grant(ticket)
+
+    def acquire(self, model: str) -> float:
+        """Wait for a slot for model; returns the seconds waited"""
+        priority = _priority.get()
+        ticket = _Ticket(model, priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._queues[model], ticket)
+            self._dispatch()
+        if not ticket.granted:
+            deadline = get_deadline()
+            timeout = min(self.max_wait, deadline.remaining()) if deadline is not None else self.max_wait
+            ends_at = ticket.enqueued + timeout
+            poll = max(0.05, self.affinity_window)
+            while not ticket.event.wait(min(poll, max(0.0, ends_at - time.monotonic()))):
+                with self._lock:
+                    if ticket.granted:
+                        break
+                    if time.monotonic() >= ends_at or (deadline is not None and deadline.expired):
+                        self._queues[model].remove(ticket)
+                        heapq.heapify(self._queues[model])
+                        self._counts[model]["timeouts"] += 1
+                        raise DeadlineExceeded(f"llm_queue:{model}")
+                    # Re-evaluate overdue waiters even when no call finishes
+                    self._dispatch()
+        waited = time.monotonic() - ticket.enqueued
+        llm_queue_seconds.observe(waited, model=model, priority=priority)
+        if waited > 0.001:
+            record_span("llm_queue", "queue", waited, model=model, priority=priority)
+        return waited
+
+    def release(self, model: str):
+        with self._lock:
+            self._active[model] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, model: str):
+        self.acquire(model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = set(self._counts) | {m for m, q in self._queues.items() if q} | set(self._active)
+            report = {}
+            for model in sorted(models):
+                queued = defaultdict(int)
+                for ticket in self._queues.get(model, []):
+                    queued[ticket.priority] += 1
+                report[model] = {
+                    "active": self._active.get(model, 0),
+                    "capacity": self.capacity(model),
+                    "queued": dict(queued),
+                    **self._counts[model],
+                }
+            return {"max_loaded": self.max_loaded, "resident": list(self._resident),
+                    "last_model": self._last_model, "models": report}
+
+
+llm_scheduler = LLMScheduler()
+
+
+@metrics.collector
+def _scheduler_metrics():
+    stats = llm_scheduler.stats()
+    for model, info in stats["models"].items():
+        yield "llm_scheduler_active", "gauge", "Ollama calls running per model", {"model": model}, info["active"]
+        for priority in PRIORITIES:
+            yield ("llm_scheduler_queue_depth", "gauge", "Ollama calls waiting for a model slot",
+                   {"model": model, "priority": priority}, info["queued"].get(priority, 0))
+        for name, help_text in _COUNTER_HELP.items():
+            yield f"llm_scheduler_{name}_total", "counter", help_text, {"model": model}, info[name]
@@ -0,0 +1,186 @@
+"""
+In-process metrics registry with Prometheus text exposition (GET /metrics).
+
+Counters and histograms are updated on the hot path with one lock and a
+bisect; values that already live elsewhere (queue depths, lru_cache hit
+counts) are read by collectors only when /metrics is scraped.
+"""
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _labels_text(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels_text(self.label_names, key)} {value}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Decorator timing every call of the function"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        lines = self.header()
+        names = self.label_names + ("le",)
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels_text(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_labels_text(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def collector(self, func: Callable):
+        """
+        Register a scrape-time collector yielding (name, kind, help, labels, value)
+        samples, kind being "gauge" or "counter". Used as a decorator.
+        """
+        self._collectors.append(func)
+        return func
+
+    def expose(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+
+        samples: Dict[str, list] = {}
+        for collect in collectors:
+            try:
+                for name, kind, help_text, labels, value in collect():
+                    samples.setdefault(name, [kind, help_text, []])[2].append((labels, value))
+            except Exception as e:
+                print(f"[METRICS] Collector {getattr(collect, '__name__', collect)} failed: {e}")
+        for name, (kind, help_text, values) in samples.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                names = tuple(labels)
+                lines.append(f"{name}{_labels_text(names, tuple(labels[n] for n in names))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# Shared metrics, updated from the modules that own the work
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "path", "status"))
+chat_turn_seconds = metrics.histogram(
+    "chat_turn_duration_seconds", "Chat turn latency by agent", ("agent", "coalesced"))
+graph_node_seconds = metrics.histogram(
+    "graph_node_duration_seconds", "Self-RAG graph node latency", ("node",))
+ollama_requests = metrics.counter(
+    "ollama_requests_total", "Ollama API calls by model, endpoint (chat/generate/embed) and outcome",
+    ("model", "endpoint", "status"))
+ollama_request_seconds = metrics.histogram(
+    "ollama_request_duration_seconds", "Ollama API call latency (until the response is fully read)",
+    ("model", "endpoint"))
+ollama_tokens = metrics.counter(
+    "ollama_tokens_total", "Prompt and completion tokens reported by Ollama", ("model", "kind"))
+vector_search_seconds = metrics.histogram(
+    "vector_search_duration_seconds", "Chroma MMR search latency")
+ollama_model_loads = metrics.counter(
+    "ollama_model_loads_total", "Calls during which Ollama had to load the model (swap-ins)", ("model",))
+llm_queue_seconds = metrics.histogram(
+    "llm_queue_wait_seconds", "Time Ollama calls waited for a model slot", ("model", "priority"))
+cache_requests = metrics.counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit/miss)", ("cache", "result"))
+llm_cache_requests = metrics.counter(
+    "llm_cache_requests_total", "LLM response cache lookups by call site and result (memory/disk/miss)",
+    ("stage", "result"))
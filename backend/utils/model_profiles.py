@@ -0,0 +1,54 @@
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict
+
+from langchain_ollama import ChatOllama
+
+from utils.config import settings
+from utils.model_registry import chat_model
+
+_lock = threading.Lock()
+
+# Recent latencies (seconds) per profile, used for the latency report
+_latencies = defaultdict(lambda: deque(maxlen=500))
+_counts = defaultdict(lambda: {"calls": 0, "errors": 0})
+
+
+def get_profile(name: str) -> Dict[str, Any]:
+    if name not in settings.MODEL_PROFILES:
+        raise ValueError(f"Unknown model profile: {name}")
+    return settings.MODEL_PROFILES[name]
+
+
+def get_chat_model(name: str) -> ChatOllama:
+    """Get the (shared) chat model configured for a profile"""
+    return chat_model(**get_profile(name))
+
+
+def record_call(name: str, seconds: float, error: bool = False):
+    with _lock:
+        _latencies[name].append(seconds)
+        _counts[name]["calls"] += 1
+        if error:
+            _counts[name]["errors"] += 1
+
+
+def get_profile_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-profile latency report (milliseconds)"""
+    report = {}
+    with _lock:
+        for name, counts in _counts.items():
+            samples = sorted(_latencies[name])
+            if samples:
+                p50 = samples[len(samples) // 2]
+                p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            else:
+                p50 = p95 = 0.0
+            report[name] = {
+                "model": settings.MODEL_PROFILES.get(name, {}).get("model"),
+                "calls": counts["calls"],
+                "errors": counts["errors"],
+                "p50_ms": round(p50 * 1000, 1),
+                "p95_ms": round(p95 * 1000, 1),
+            }
+    return report
@@ -0,0 +1,235 @@
+"""
+Central registry of Ollama clients.
+
+Every ChatOllama / OllamaLLM / OllamaEmbeddings instance is created here,
+lazily and once per (class, model, params), against Settings.OLLAMA_BASE_URL.
+All of them send requests through one transport, which checks the model's
+circuit breaker (utils.circuit_breaker), takes a per-model slot from the
+LLM scheduler for each call, sends it to a host of the model's
+Ollama pool (keep-alive connections per host, see utils.ollama_pool) and
+records per-model call counts, latencies, token usage and model loads
+(GET /models/profiles and GET /metrics). Calls made under a request or job
+deadline get HTTP timeouts from its remaining time rather than the fixed
+LLM_HTTP_TIMEOUT, which applies to calls without one.
+"""
+import json
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, Optional
+
+import httpx
+from langchain_ollama import ChatOllama, OllamaEmbeddings, OllamaLLM
+
+from utils.circuit_breaker import circuit_breakers
+from utils.config import settings
+from utils.deadline import DeadlineExceeded, get_deadline
+from utils.llm_scheduler import llm_scheduler
+from utils.metrics import ollama_model_loads, ollama_request_seconds, ollama_requests, ollama_tokens
+from utils.ollama_pool import ollama_pool
+from utils.tracing import record_span
+
+_clients: Dict[tuple, Any] = {}
+_transports: Dict[str, "InstrumentedTransport"] = {}
+_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_latencies = defaultdict(lambda: deque(maxlen=500))
+_counts = defaultdict(lambda: {"calls": 0, "errors": 0, "endpoints": defaultdict(int)})
+
+
+def _record(model: str, endpoint: str, seconds: float, error: bool):
+    with _stats_lock:
+        _latencies[model].append(seconds)
+        counts = _counts[model]
+        counts["calls"] += 1
+        counts["endpoints"][endpoint] += 1
+        if error:
+            counts["errors"] += 1
+    ollama_requests.inc(model=model, endpoint=endpoint, status="error" if error else "ok")
+    ollama_request_seconds.observe(seconds, model=model, endpoint=endpoint)
+
+
+_TOKEN_FIELDS = re.compile(rb'"(prompt_eval_count|eval_count|load_duration)"\s*:\s*(\d+)')
+_TAIL_BYTES = 512
+
+
+def _record_tokens(model: str, tail: bytes) -> Dict[str, int]:
+    """Token counts and model load time from the final object of an Ollama response (its last bytes)"""
+    tokens = {}
+    for field, value in _TOKEN_FIELDS.findall(tail):
+        if field == b"load_duration":
+            # Nanoseconds; a long load means the model was swapped in for this call
+            load_seconds = int(value) / 1e9
+            if load_seconds >= settings.LLM_SWAP_LOAD_SECONDS:
+                ollama_model_loads.inc(model=model)
+                tokens["load_ms"] = round(load_seconds * 1000, 1)
+            continue
+        kind = "prompt" if field == b"prompt_eval_count" else "completion"
+        ollama_tokens.inc(int(value), model=model, kind=kind)
+        tokens[f"{kind}_tokens"] = int(value)
+    return tokens
+
+
+def _bounded_timeout(timeout: Optional[Dict[str, Optional[float]]], remaining: float) -> Dict[str, float]:
+    """httpx timeouts of a call made under a deadline: reads may wait for as long as the deadline
+    has left (a job may prefill for longer than LLM_HTTP_TIMEOUT), connecting no longer than either"""
+    connect = (timeout or {}).get("connect") or settings.LLM_HTTP_TIMEOUT
+    return {"connect": min(connect, remaining), "read": remaining, "write": remaining, "pool": remaining}
+
+
+class _TimedStream(httpx.SyncByteStream):
+    """Response body wrapper that records the call when the body is closed"""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._tail = b""
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._tail = (self._tail + chunk)[-_TAIL_BYTES:]
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._on_close(self._tail)
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """Schedules, routes and times every Ollama API call by model"""
+
+    def __init__(self, base_url: str):
+        # Clients of the default base URL are served by the host pool
+        self.pooled = base_url.rstrip("/") == settings.OLLAMA_BASE_URL.rstrip("/")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        try:
+            model = json.loads(request.content or b"{}").get("model") or "-"
+        except (ValueError, AttributeError):
+            model = "-"
+        # Model calls pass the model's circuit breaker and wait for a slot;
+        # listing calls (/api/ps, /api/tags) do neither
+        scheduled = model != "-"
+        if scheduled:
+            breaker = circuit_breakers.get(model)
+            probe = breaker.allow()
+            queued = time.perf_counter()
+            try:
+                llm_scheduler.acquire(model)
+            except DeadlineExceeded:
+                breaker.record(False, time.perf_counter() - queued, probe)
+                raise
+            deadline = get_deadline()
+            if deadline is not None:
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    llm_scheduler.release(model)
+                    breaker.release(probe)
+                    raise DeadlineExceeded(f"ollama:{model}")
+                request.extensions["timeout"] = _bounded_timeout(request.extensions.get("timeout"), remaining)
+        started = time.perf_counter()
+        try:
+            if scheduled and self.pooled:
+                response = ollama_pool.send(request, model, endpoint)
+            else:
+                response = ollama_pool.forward(request)
+        except Exception as e:
+            cut_short = scheduled and isinstance(e, httpx.TimeoutException) and deadline is not None and deadline.expired
+            if scheduled:
+                llm_scheduler.release(model)
+                if cut_short:
+                    breaker.release(probe)
+                else:
+                    breaker.record(False, time.perf_counter() - queued, probe)
+            seconds = time.perf_counter() - started
+            _record(model, endpoint, seconds, error=True)
+            record_span(f"ollama.{endpoint}", "ollama", seconds, model=model, error=type(e).__name__)
+            if cut_short:
+                raise DeadlineExceeded(f"ollama:{model}") from e
+            raise
+
+        error = response.status_code >= 400
+        if scheduled:
+            # Latency as the caller sees it: queue wait plus time to first byte
+            breaker.record(response.status_code < 500, time.perf_counter() - queued, probe)
+        done = []
+
+        def on_close(tail: bytes):
+            if not done:
+                done.append(True)
+                if scheduled:
+                    llm_scheduler.release(model)
+                seconds = time.perf_counter() - started
+                _record(model, endpoint, seconds, error)
+                tokens = {} if error else _record_tokens(model, tail)
+                record_span(f"ollama.{endpoint}", "ollama", seconds, model=model,
+                            status=response.status_code, request_bytes=len(request.content or b""), **tokens)
+
+        response.stream = _TimedStream(response.stream, on_close)
+        return response
+
+
+def get_transport(base_url: str = None) -> InstrumentedTransport:
+    base_url = base_url or settings.OLLAMA_BASE_URL
+    if base_url not in _transports:
+        with _lock:
+            if base_url not in _transports:
+                _transports[base_url] = InstrumentedTransport(base_url)
+    return _transports[base_url]
+
+
+def _get_client(cls, model: str, base_url: Optional[str], params: Dict[str, Any]):
+    base_url = base_url or settings.OLLAMA_BASE_URL
+    params = {key: value for key, value in params.items() if value is not None}
+    key = (cls.__name__, model, base_url, json.dumps(params, sort_keys=True, default=str))
+    if key not in _clients:
+        transport = get_transport(base_url)
+        with _lock:
+            if key not in _clients:
+                _clients[key] = cls(
+                    model=model,
+                    base_url=base_url,
+                    client_kwargs={"timeout": settings.LLM_HTTP_TIMEOUT},
+                    sync_client_kwargs={"transport": transport},
+                    **params
+                )
+    return _clients[key]
+
+
+def chat_model(model: str = None, base_url: str = None, **params) -> ChatOllama:
+    """Shared ChatOllama for a model and parameter set (default: Settings.OLLAMA_MODEL)"""
+    return _get_client(ChatOllama, model or settings.OLLAMA_MODEL, base_url, params)
+
+
+def text_model(model: str = None, base_url: str = None, **params) -> OllamaLLM:
+    """Shared completion-style OllamaLLM"""
+    return _get_client(OllamaLLM, model or settings.OLLAMA_MODEL, base_url, params)
+
+
+def embedding_model(model: str = None, base_url: str = None) -> OllamaEmbeddings:
+    """Shared OllamaEmbeddings (default: Settings.EMBEDDING_MODEL)"""
+    return _get_client(OllamaEmbeddings, model or settings.EMBEDDING_MODEL, base_url,
+                       {"keep_alive": settings.EMBEDDING_KEEP_ALIVE})
+
+
+def get_model_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-model HTTP call counts and latency (milliseconds), across all clients"""
+    report = {}
+    with _stats_lock:
+        for model, counts in _counts.items():
+            samples = sorted(_latencies[model])
+            report[model] = {
+                "calls": counts["calls"],
+                "errors": counts["errors"],
+                "endpoints": dict(counts["endpoints"]),
+                "p50_ms": round(samples[len(samples) // 2] * 1000, 1) if samples else 0.0,
+                "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1) if samples else 0.0,
+            }
+    with _lock:
+        report_clients = len(_clients)
+    return {"clients": report_clients, "models": report}
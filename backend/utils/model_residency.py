@@ -0,0 +1,190 @@
+"""
+Ollama model warmup and residency.
+
+Every model the app uses (the model profiles plus the embedding model) is
+loaded at startup with a tiny request on each Ollama host serving it, so
+the first user request does not pay the model load. Afterwards the models are pinged every
+OLLAMA_PING_INTERVAL seconds, which resets their keep_alive timer and
+reloads any model Ollama evicted. With several workers only the holder of
+the residency lease warms, pings and lists the loaded models (GET /api/ps);
+it publishes that status in shared state, where the other workers read it
+for /health.
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from utils.config import settings
+from utils.llm_scheduler import llm_priority
+from utils.metrics import metrics
+from utils.model_registry import get_transport
+from utils.ollama_pool import ollama_pool, pinned_host
+from utils.shared_state import shared_state
+
+_WARMUP_PROMPT = "hi"
+_STATUS_KEY = "model_residency_status"
+
+
+def _canonical(model: str) -> str:
+    """Ollama reports untagged models as <name>:latest"""
+    return model if ":" in model else f"{model}:latest"
+
+
+def configured_models() -> Dict[str, Dict[str, Any]]:
+    """Model -> kind ("chat" or "embed") and keep_alive, from the profiles and the embedding model"""
+    models = {}
+    for profile in settings.MODEL_PROFILES.values():
+        entry = models.setdefault(profile["model"], {"kind": "chat", "keep_alive": None})
+        if entry["keep_alive"] is None:
+            entry["keep_alive"] = profile.get("keep_alive")
+    models.setdefault(settings.EMBEDDING_MODEL, {"kind": "embed", "keep_alive": settings.EMBEDDING_KEEP_ALIVE})
+    return models
+
+
+class ModelResidency:
+    def __init__(self, base_url: str = None, models: Dict[str, Dict[str, Any]] = None):
+        self.base_url = base_url or settings.OLLAMA_BASE_URL
+        self._models = models
+        self._client = None
+        self._lock = threading.Lock()
+        # Host -> models it holds in memory
+        self._loaded: Dict[str, Dict[str, Any]] = {}
+        self._checked_at: Optional[float] = None
+        self._warm: Dict[tuple, Dict[str, Any]] = {}
+        self.counters = {"warmups": 0, "pings": 0, "failures": 0}
+
+    @property
+    def models(self) -> Dict[str, Dict[str, Any]]:
+        if self._models is None:
+            self._models = configured_models()
+        return self._models
+
+    def _http(self) -> httpx.Client:
+        if self._client is None:
+            # Through the shared pool, so warmup calls show up in the Ollama metrics
+            self._client = httpx.Client(base_url=self.base_url, transport=get_transport(self.base_url),
+                                        timeout=settings.OLLAMA_WARMUP_TIMEOUT)
+        return self._client
+
+    def load(self, model: str, host: str) -> float:
+        """Load (or keep loaded) one model on one Ollama host with a tiny request; returns seconds taken"""
+        config = self.models[model]
+        body: Dict[str, Any] = {"model": model}
+        if config.get("keep_alive") is not None:
+            body["keep_alive"] = config["keep_alive"]
+        started = time.perf_counter()
+        with pinned_host(host):
+            if config["kind"] == "embed":
+                response = self._http().post("/api/embed", json={**body, "input": _WARMUP_PROMPT})
+            else:
+                response = self._http().post("/api/generate", json={
+                    **body, "prompt": _WARMUP_PROMPT, "stream": False, "options": {"num_predict": 1}
+                })
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    def warm(self, kind: str = "warmups") -> Dict[str, Any]:
+        """Load every configured model on every host serving it; failures are reported, not raised"""
+        results = {}
+        for model in self.models:
+            for host in ollama_pool.urls_for(model):
+                try:
+                    with llm_priority("background"):
+                        seconds = self.load(model, host)
+                    result = {"ok": True, "ms": round(seconds * 1000, 1), "at": time.time()}
+                except Exception as e:
+                    result = {"ok": False, "error": str(e), "at": time.time()}
+                    print(f"[MODELS] Loading {model} on {host} failed: {e}")
+                results[(model, host)] = result
+        with self._lock:
+            self._warm.update(results)
+            self.counters[kind] += 1
+            self.counters["failures"] += sum(not result["ok"] for result in results.values())
+        return results
+
+    def refresh(self) -> Dict[str, List[str]]:
+        """Re-read the models each Ollama host currently holds in memory"""
+        hosts = {host for model in self.models for host in ollama_pool.urls_for(model)}
+        for host in sorted(hosts):
+            try:
+                with pinned_host(host):
+                    response = self._http().get("/api/ps", timeout=5)
+                response.raise_for_status()
+                loaded = {_canonical(entry.get("name") or entry.get("model")): {
+                    "expires_at": entry.get("expires_at"),
+                    "size_vram": entry.get("size_vram"),
+                } for entry in response.json().get("models", [])}
+            except Exception as e:
+                print(f"[MODELS] Listing loaded models on {host} failed: {e}")
+                continue
+            with self._lock:
+                self._loaded[host] = loaded
+        with self._lock:
+            self._checked_at = time.time()
+            return {host: list(loaded) for host, loaded in self._loaded.items()}
+
+    def run_cycle(self, first: bool = False) -> bool:
+        """
+        One warmup/ping round and status refresh by the lease holder; other
+        workers read its status. Returns whether this worker held the lease.
+        """
+        if not shared_state.acquire_lease("model_residency", settings.OLLAMA_PING_INTERVAL * 2):
+            self._read_shared_status()
+            return False
+        self.warm("warmups" if first else "pings")
+        self.refresh()
+        with self._lock:
+            status = {"loaded": self._loaded, "checked_at": self._checked_at,
+                      "warm": [[model, host, result] for (model, host), result in self._warm.items()]}
+            shared_state.set(_STATUS_KEY, status, ttl=settings.OLLAMA_PING_INTERVAL * 3)
+        return True
+
+    def _read_shared_status(self):
+        status = shared_state.get(_STATUS_KEY)
+        if not status:
+            return
+        with self._lock:
+            self._loaded = status["loaded"]
+            self._checked_at = status["checked_at"]
+            self._warm = {(model, host): result for model, host, result in status["warm"]}
+
+    def status(self) -> Dict[str, Any]:
+        """Configured models and whether each of their hosts had them loaded at the last check"""
+        with self._lock:
+            report = {}
+            for model, config in self.models.items():
+                hosts = {}
+                for host in ollama_pool.urls_for(model):
+                    info = self._loaded.get(host, {}).get(_canonical(model))
+                    hosts[host] = {
+                        "loaded": info is not None,
+                        "expires_at": info["expires_at"] if info else None,
+                        "last_load": self._warm.get((model, host)),
+                    }
+                report[model] = {
+                    "kind": config["kind"],
+                    "keep_alive": config.get("keep_alive"),
+                    "loaded": all(host["loaded"] for host in hosts.values()),
+                    "hosts": hosts,
+                }
+            return {"checked_at": self._checked_at, "models": report, **self.counters}
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+model_residency = ModelResidency()
+
+
+@metrics.collector
+def _residency_metrics():
+    status = model_residency.status()
+    if status["checked_at"] is None:
+        return
+    for model, info in status["models"].items():
+        yield ("ollama_model_loaded", "gauge", "Configured model held in memory by Ollama (last check)",
+               {"model": model}, int(info["loaded"]))
@@ -0,0 +1,291 @@
+"""
+Pool of Ollama hosts per model.
+
+OLLAMA_HOSTS maps a model (or "*" for the rest) to a list of Ollama base
+URLs; without it every model is served by OLLAMA_BASE_URL alone. Each call
+goes to the healthy host with the fewest outstanding requests (ties: the
+lower time to first byte). Hosts are ejected for OLLAMA_EJECT_SECONDS after
+OLLAMA_EJECT_FAILURES consecutive failures or a failed health check, or when
+their time to first byte for a model runs OLLAMA_SLOW_FACTOR times slower
+than the best other host of that model; unreachable hosts return early once a health check passes. Idempotent calls (embeddings, and LLM calls made inside
+`idempotent()`) are resent to another host on connection errors and 5xx
+responses; other calls are not, since the first host may still run them.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from utils.config import settings
+from utils.deadline import get_deadline
+from utils.metrics import metrics
+
+# Endpoints that are always safe to send twice
+IDEMPOTENT_ENDPOINTS = ("embed", "embeddings")
+
+_idempotent: ContextVar[bool] = ContextVar("ollama_idempotent", default=False)
+_pinned: ContextVar[Optional[str]] = ContextVar("ollama_pinned_host", default=None)
+
+
+def _deadline_expired() -> bool:
+    deadline = get_deadline()
+    return deadline is not None and deadline.expired
+
+
+@contextmanager
+def idempotent():
+    """Allow Ollama calls of this block to be retried on another host"""
+    token = _idempotent.set(True)
+    try:
+        yield
+    finally:
+        _idempotent.reset(token)
+
+
+@contextmanager
+def pinned_host(url: str):
+    """Send Ollama calls of this block to one host (warmup, per-host status)"""
+    token = _pinned.set(url.rstrip("/"))
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def _retarget(request: httpx.Request, base_url: str):
+    target = httpx.URL(base_url)
+    request.url = request.url.copy_with(scheme=target.scheme, host=target.host, port=target.port)
+    request.headers["Host"] = target.netloc.decode("ascii")
+
+
+class Host:
+    def __init__(self, url: str):
+        self.url = url
+        self.transport = httpx.HTTPTransport(limits=httpx.Limits(
+            max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS,
+            keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY
+        ))
+        self.outstanding = 0
+        # Moving average of the time to first byte (response headers) per model
+        self.ttfb: Dict[str, float] = {}
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.eject_reason: Optional[str] = None
+        self.counters = {"requests": 0, "errors": 0, "retries": 0, "ejections": 0}
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body wrapper that ends the host's outstanding request when closed"""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close is not None:
+                on_close()
+
+
+class OllamaPool:
+    def __init__(self, hosts: Dict[str, List[str]] = None, default_url: str = None):
+        hosts = settings.OLLAMA_HOSTS if hosts is None else hosts
+        default_url = default_url or settings.OLLAMA_BASE_URL
+        self._routes = {model: [url.rstrip("/") for url in urls] for model, urls in hosts.items()}
+        self._routes.setdefault("*", [default_url.rstrip("/")])
+        self._hosts: Dict[str, Host] = {}
+        for urls in self._routes.values():
+            for url in urls:
+                self._hosts.setdefault(url, Host(url))
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    def urls_for(self, model: str) -> List[str]:
+        return self._routes.get(model, self._routes["*"])
+
+    def size(self, model: str) -> int:
+        return len(self.urls_for(model))
+
+    def host(self, url: str) -> Host:
+        url = url.rstrip("/")
+        with self._lock:
+            if url not in self._hosts:
+                self._hosts[url] = Host(url)
+            return self._hosts[url]
+
+    def choose(self, model: str, exclude: List[str] = ()) -> Host:
+        """Least outstanding healthy host for model; if none is healthy, the least loaded one"""
+        pinned = _pinned.get()
+        host = self.host(pinned) if pinned is not None else None
+        with self._lock:
+            if host is None:
+                candidates = [self._hosts[url] for url in self.urls_for(model) if url not in exclude]
+                healthy = [host for host in candidates if host.healthy] or candidates
+                host = min(healthy, key=lambda h: (h.outstanding, h.ttfb.get(model, 0.0)))
+            host.outstanding += 1
+            host.counters["requests"] += 1
+            return host
+
+    def _finish(self, host: Host):
+        with self._lock:
+            host.outstanding -= 1
+
+    def _failed(self, host: Host, reason: str):
+        with self._lock:
+            host.counters["errors"] += 1
+            host.failures += 1
+            if host.failures >= settings.OLLAMA_EJECT_FAILURES and host.healthy:
+                self._eject(host, reason)
+
+    def _succeeded(self, host: Host, model: str, ttfb: float):
+        with self._lock:
+            host.failures = 0
+            previous = host.ttfb.get(model)
+            average = host.ttfb[model] = ttfb if previous is None else 0.8 * previous + 0.2 * ttfb
+            # Only hosts serving the same model are comparable (model size, embeddings vs generation)
+            others = [self._hosts[url].ttfb[model] for url in self.urls_for(model)
+                      if url != host.url and self._hosts[url].healthy and model in self._hosts[url].ttfb]
+            if (host.healthy and others and average > settings.OLLAMA_SLOW_MIN_SECONDS
+                    and average > settings.OLLAMA_SLOW_FACTOR * min(others)):
+                self._eject(host, "slow")
+
+    def _eject(self, host: Host, reason: str):
+        host.ejected_until = time.monotonic() + settings.OLLAMA_EJECT_SECONDS
+        host.eject_reason = reason
+        host.counters["ejections"] += 1
+        # Judge the host afresh when it comes back
+        host.ttfb = {}
+        host.failures = 0
+        print(f"[OLLAMA] Ejected {host.url} for {settings.OLLAMA_EJECT_SECONDS:.0f}s ({reason})")
+
+    def send(self, request: httpx.Request, model: str, endpoint: str) -> httpx.Response:
+        """Send a model call to a host of the pool, retrying idempotent calls on another host"""
+        self._ensure_health_checks()
+        retryable = endpoint in IDEMPOTENT_ENDPOINTS or _idempotent.get()
+        tried = []
+        while True:
+            host = self.choose(model, exclude=tried)
+            tried.append(host.url)
+            _retarget(request, host.url)
+            can_retry = retryable and _pinned.get() is None and len(tried) < self.size(model)
+            started = time.perf_counter()
+            try:
+                response = host.transport.handle_request(request)
+            except httpx.TransportError as e:
+                if isinstance(e, httpx.TimeoutException) and _deadline_expired():
+                    # The caller's deadline cut the call short, not the host
+                    self._finish(host)
+                    raise
+                self._failed(host, "unreachable")
+                self._finish(host)
+                if can_retry:
+                    host.counters["retries"] += 1
+                    continue
+                raise
+            if response.status_code >= 500:
+                self._failed(host, "errors")
+                if can_retry:
+                    response.close()
+                    self._finish(host)
+                    host.counters["retries"] += 1
+                    continue
+            else:
+                self._succeeded(host, model, time.perf_counter() - started)
+            response.stream = _ReleasingStream(response.stream, lambda: self._finish(host))
+            return response
+
+    def forward(self, request: httpx.Request) -> httpx.Response:
+        """Send a call without a model (/api/ps, /api/tags) to its own or the pinned host"""
+        pinned = _pinned.get()
+        if pinned is not None:
+            _retarget(request, pinned)
+        url = f"{request.url.scheme}://{request.url.netloc.decode('ascii')}"
+        return self.host(url).transport.handle_request(request)
+
+    def _ensure_health_checks(self):
+        if self._health_thread is None and len(self._hosts) > 1 and settings.OLLAMA_HEALTH_INTERVAL > 0:
+            with self._lock:
+                if self._health_thread is None:
+                    self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health",
+                                                           daemon=True)
+                    self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(settings.OLLAMA_HEALTH_INTERVAL):
+            self.check_health()
+
+    def check_health(self):
+        """
+        Probe every host: unreachable ones are ejected, and return as soon as they
+        answer again. Hosts ejected for errors or slowness sit out the full period.
+        """
+        with self._lock:
+            hosts = list(self._hosts.values())
+        for host in hosts:
+            try:
+                response = host.transport.handle_request(httpx.Request(
+                    "GET", f"{host.url}/api/version", extensions={"timeout": {
+                        "connect": 2.0, "read": 2.0, "write": 2.0, "pool": 2.0}}
+                ))
+                response.read()
+                response.close()
+                ok = response.status_code < 500
+            except httpx.HTTPError:
+                ok = False
+            with self._lock:
+                if not ok and host.healthy:
+                    host.counters["errors"] += 1
+                    self._eject(host, "unreachable")
+                elif ok and not host.healthy and host.eject_reason == "unreachable":
+                    host.ejected_until = 0.0
+                    host.eject_reason = None
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            hosts = list(self._hosts.values())
+        for host in hosts:
+            host.transport.close()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "routes": dict(self._routes),
+                "hosts": {url: {
+                    "healthy": host.healthy,
+                    "ejected_for_s": round(max(0.0, host.ejected_until - now), 1),
+                    "eject_reason": host.eject_reason if not host.healthy else None,
+                    "outstanding": host.outstanding,
+                    "ttfb_ms": {model: round(ttfb * 1000, 1) for model, ttfb in host.ttfb.items()},
+                    **host.counters,
+                } for url, host in self._hosts.items()},
+            }
+
+
+ollama_pool = OllamaPool()
+
+
+@metrics.collector
+def _pool_metrics():
+    for url, info in ollama_pool.stats()["hosts"].items():
+        labels = {"host": url}
+        yield "ollama_host_healthy", "gauge", "Ollama host in rotation (not ejected)", labels, int(info["healthy"])
+        yield "ollama_host_outstanding", "gauge", "Requests in flight per Ollama host", labels, info["outstanding"]
+        for name in ("requests", "errors", "retries", "ejections"):
+            yield (f"ollama_host_{name}_total", "counter", f"Ollama host {name}", labels, info[name])
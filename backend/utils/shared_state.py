@@ -0,0 +1,100 @@
+"""
+Small SQLite key/value store shared by every worker process on a host.
+
+Holds state that must agree across `uvicorn --workers N` processes:
+counters (corpus version), values with an optional TTL (history summaries,
+cache entries) and leases that let one worker run periodic maintenance.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from utils.config import settings
+
+
+class SharedState:
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or settings.SHARED_STATE_DB
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._db().execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            row = self._db().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def increment(self, name: str, amount: int = 1) -> int:
+        """Atomically add to a counter across processes; returns the new value"""
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (name, amount)
+                )
+                value = conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def acquire_lease(self, name: str, ttl: float, owner: str = None) -> bool:
+        """Take (or renew) a named lease unless another live owner holds it"""
+        owner = owner or str(os.getpid())
+        now = time.time()
+        with self._lock:
+            cursor = self._db().execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (name, owner, now + ttl, now)
+            )
+        return cursor.rowcount > 0
+
+    def cleanup(self) -> int:
+        """Drop expired values"""
+        with self._lock:
+            cursor = self._db().execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?",
+                                        (time.time(),))
+        return cursor.rowcount
+
+
+shared_state = SharedState()
@@ -0,0 +1,200 @@
+"""
+Lazy resources and startup profiling.
+
+Resources that touch external systems (Chroma, SQLite databases, Ollama)
+are declared with @lazy_resource and created on first use, or all at once
+by preload() when a worker wants to pay the cost before serving traffic.
+Import and init times are collected in `startup_profile`.
+
+    python -m utils.startup             # import the app, print the profile
+    python -m utils.startup --preload   # ... and initialize every resource
+"""
+import argparse
+import functools
+import importlib.abc
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+_resources: Dict[str, Callable] = {}
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, profile: "StartupProfile"):
+        self._loader = loader
+        self._profile = profile
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profile._enter_import()
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profile._exit_import(module.__name__, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Meta path hook wrapping module loaders to time their execution"""
+
+    def __init__(self, profile: "StartupProfile"):
+        self._profile = profile
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "busy", False):
+            return None
+        self._local.busy = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimedLoader(spec.loader, self._profile)
+                    return spec
+            return None
+        finally:
+            self._local.busy = False
+
+
+class StartupProfile:
+    """Import time per module (self time, children excluded) and init time per resource"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.resources: Dict[str, Dict] = {}
+        self.phases: Dict[str, float] = {}
+        self._stack: List[float] = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def track_imports(self):
+        if self._timer is None:
+            self._timer = _ImportTimer(self)
+            sys.meta_path.insert(0, self._timer)
+
+    def stop_tracking(self):
+        if self._timer is not None and self._timer in sys.meta_path:
+            sys.meta_path.remove(self._timer)
+        self._timer = None
+
+    def _enter_import(self):
+        self._stack.append(0.0)
+
+    def _exit_import(self, name: str, seconds: float):
+        children = self._stack.pop()
+        if self._stack:
+            self._stack[-1] += seconds
+        self.imports[name] = seconds - children
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a startup step (e.g. app import, graph compile)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def record_resource(self, name: str, seconds: float, error: str = None):
+        with self._lock:
+            self.resources[name] = {
+                "init_ms": round(seconds * 1000, 1),
+                "error": error,
+                "since_start_s": round(time.perf_counter() - self.started_at, 2)
+            }
+
+    def report(self, top: int = 20) -> Dict:
+        slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:top]
+        packages: Dict[str, float] = {}
+        for name, seconds in self.imports.items():
+            root = name.split(".")[0]
+            packages[root] = packages.get(root, 0.0) + seconds
+        return {
+            "phases_ms": {name: round(s * 1000, 1) for name, s in self.phases.items()},
+            "resources": {
+                name: self.resources.get(name, {"initialized": False}) for name in _resources
+            },
+            "import_total_ms": round(sum(self.imports.values()) * 1000, 1),
+            "imports_by_package_ms": {
+                name: round(s * 1000, 1)
+                for name, s in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+            },
+            "slowest_modules_ms": {name: round(s * 1000, 1) for name, s in slowest},
+        }
+
+
+startup_profile = StartupProfile()
+
+
+def lazy_resource(name: str):
+    """
+    Turn a factory into a thread-safe getter that builds the resource on first
+    call and caches it. Failures are not cached, so a resource whose backend
+    was briefly unavailable is retried on the next call.
+    """
+    def decorator(factory: Callable):
+        lock = threading.Lock()
+        holder = []
+
+        @functools.wraps(factory)
+        def getter():
+            if not holder:
+                with lock:
+                    if not holder:
+                        started = time.perf_counter()
+                        try:
+                            holder.append(factory())
+                        except Exception as e:
+                            startup_profile.record_resource(name, time.perf_counter() - started, str(e))
+                            raise
+                        startup_profile.record_resource(name, time.perf_counter() - started)
+            return holder[0]
+
+        getter.initialized = lambda: bool(holder)
+        _resources[name] = getter
+        return getter
+    return decorator
+
+
+def preload(names: List[str] = None) -> Dict[str, str]:
+    """Initialize resources now; returns {name: error} for those that failed"""
+    errors = {}
+    for name, getter in list(_resources.items()):
+        if names and name not in names:
+            continue
+        try:
+            getter()
+        except Exception as e:
+            errors[name] = str(e)
+            print(f"[STARTUP] Preloading {name} failed: {e}")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup profile of the API")
+    parser.add_argument("--preload", action="store_true", help="also initialize every lazy resource")
+    parser.add_argument("--top", type=int, default=20, help="number of slowest modules to list")
+    args = parser.parse_args()
+
+    # Use the importable module, not this __main__ copy, so the app records into the same profile
+    from utils.startup import preload, startup_profile
+    startup_profile.track_imports()
+    with startup_profile.phase("import_app"):
+        import main  # noqa: F401
+    startup_profile.stop_tracking()
+    if args.preload:
+        with startup_profile.phase("preload"):
+            preload()
+    print(json.dumps(startup_profile.report(args.top), indent=2))
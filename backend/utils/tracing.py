@@ -0,0 +1,272 @@
+"""
+Lightweight per-request tracing.
+
+A sampled chat turn gets a Trace: a flat list of spans (graph nodes, LLM
+and Ollama calls, retrieval stages) linked by parent id. The current span
+lives in a ContextVar, which the agent executor and LangGraph carry into
+worker threads, so spans nest without passing anything around. Unsampled
+requests only add their span durations and token counts to a flat
+per-request breakdown (used by the interaction log).
+Traces are kept in a bounded ring buffer (GET /api/v1/debug/traces/{request_id}).
+"""
+import functools
+import itertools
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.config import settings
+from utils.metrics import graph_node_seconds
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+# Set for every request, traced or not (keys debug artifacts and logs)
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_breakdown", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start", "end", "attrs")
+
+    def __init__(self, trace: "Trace", name: str, kind: str, parent_id: Optional[int], start: float):
+        self.trace = trace
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = start
+        self.end = None
+        self.attrs: Dict[str, Any] = {}
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ms": round((self.start - self.trace.t0) * 1000, 1),
+            "duration_ms": round(self.duration * 1000, 1),
+            "open": self.end is None,
+            **self.attrs
+        }
+
+
+class Trace:
+    """Span tree of one request"""
+
+    def __init__(self, request_id: str, max_spans: int):
+        self.request_id = request_id
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self.root = self.new_span("request", "request", None, self.t0)
+
+    def new_span(self, name: str, kind: str, parent_id: Optional[int], start: float = None) -> Optional[Span]:
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped += 1
+                return None
+            span = Span(self, name, kind, parent_id, start or time.perf_counter())
+            self.spans.append(span)
+            return span
+
+    def summary(self) -> Dict[str, Any]:
+        """Time per node and retrieval stage, LLM calls, tokens and prompt bytes"""
+        with self._lock:
+            spans = list(self.spans)
+        nodes: Dict[str, Dict[str, float]] = {}
+        retrieval: Dict[str, float] = {}
+        llm = {"calls": 0, "ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "prompt_bytes": 0}
+        for span in spans:
+            ms = span.duration * 1000
+            if span.kind == "node":
+                node = nodes.setdefault(span.name, {"count": 0, "ms": 0.0})
+                node["count"] += 1
+                node["ms"] = round(node["ms"] + ms, 1)
+                if "context_bytes" in span.attrs:
+                    node["context_bytes"] = span.attrs["context_bytes"]
+            elif span.kind == "retrieval":
+                retrieval[span.name] = round(retrieval.get(span.name, 0.0) + ms, 1)
+            elif span.kind == "llm":
+                llm["calls"] += 1
+                llm["ms"] += ms
+                llm["prompt_bytes"] += span.attrs.get("prompt_bytes", 0)
+            elif span.kind == "ollama":
+                llm["prompt_tokens"] += span.attrs.get("prompt_tokens", 0)
+                llm["completion_tokens"] += span.attrs.get("completion_tokens", 0)
+        llm["ms"] = round(llm["ms"], 1)
+        return {
+            "request_id": self.request_id,
+            "total_ms": round(self.root.duration * 1000, 1),
+            "spans": len(spans),
+            "dropped_spans": self.dropped,
+            "nodes": nodes,
+            "retrieval_ms": retrieval,
+            "llm": llm,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {"started_at": self.started_at, "summary": self.summary(), "spans": spans}
+
+
+class Tracer:
+    """Samples requests and keeps their traces in a bounded ring buffer"""
+
+    def __init__(self, sample_rate: float = None, capacity: int = None, max_spans: int = None):
+        self.sample_rate = settings.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.capacity = capacity or settings.TRACE_BUFFER_SIZE
+        self.max_spans = max_spans or settings.TRACE_MAX_SPANS
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"sampled": 0, "skipped": 0}
+
+    @contextmanager
+    def trace(self, request_id: str, force: bool = False):
+        """Trace the block if sampled; yields the Trace or None"""
+        if _current.get() is not None:
+            # Already inside a traced request
+            yield _current.get().trace
+            return
+        id_token = _request_id.set(request_id)
+        breakdown_token = _breakdown.set({})
+        try:
+            if not force and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+                self.counters["skipped"] += 1
+                yield None
+                return
+
+            trace = Trace(request_id, self.max_spans)
+            with self._lock:
+                self.counters["sampled"] += 1
+                self._traces[request_id] = trace
+                self._traces.move_to_end(request_id)
+                while len(self._traces) > self.capacity:
+                    self._traces.popitem(last=False)
+            token = _current.set(trace.root)
+            try:
+                yield trace
+            finally:
+                trace.root.end = time.perf_counter()
+                _current.reset(token)
+        finally:
+            _request_id.reset(id_token)
+            _breakdown.reset(breakdown_token)
+
+    def get(self, request_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(request_id)
+
+    def recent(self, limit: int = 20) -> List[Trace]:
+        with self._lock:
+            return list(self._traces.values())[-limit:][::-1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sample_rate": self.sample_rate, "buffered": len(self._traces), **self.counters}
+
+
+tracer = Tracer()
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def current_trace() -> Optional[Trace]:
+    span = _current.get()
+    return span.trace if span is not None else None
+
+
+def current_breakdown() -> Dict[str, float]:
+    """
+    Milliseconds per stage, node and retrieval step of the current request
+    (summed over loops), plus LLM call count and token totals.
+    """
+    breakdown = _breakdown.get() or {}
+    return {key: round(value, 1) if key.endswith("_ms") else value for key, value in breakdown.items()}
+
+
+def _accumulate(name: str, kind: str, seconds: float, attrs: Dict[str, Any]):
+    breakdown = _breakdown.get()
+    if breakdown is None or kind == "request":
+        return
+    if kind == "ollama":
+        for key in ("prompt_tokens", "completion_tokens"):
+            if key in attrs:
+                breakdown[key] = breakdown.get(key, 0) + attrs[key]
+        return
+    if kind == "llm":
+        breakdown["llm_calls"] = breakdown.get("llm_calls", 0) + 1
+    key = f"{kind if kind in ('llm', 'agent') else name}_ms"
+    breakdown[key] = breakdown.get(key, 0.0) + seconds * 1000
+
+
+@contextmanager
+def span(name: str, kind: str = "stage", **attrs):
+    """Child span of the current one; yields None when the request is not traced"""
+    started = time.perf_counter()
+    parent = _current.get()
+    child = parent.trace.new_span(name, kind, parent.span_id, started) if parent is not None else None
+    if child is None:
+        try:
+            yield None
+        finally:
+            _accumulate(name, kind, time.perf_counter() - started, attrs)
+        return
+    child.attrs.update(attrs)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current.reset(token)
+        _accumulate(name, kind, child.end - started, child.attrs)
+
+
+def record_span(name: str, kind: str, seconds: float, **attrs):
+    """Add an already finished child span (for work timed elsewhere, e.g. the HTTP transport)"""
+    _accumulate(name, kind, seconds, attrs)
+    parent = _current.get()
+    if parent is None:
+        return
+    end = time.perf_counter()
+    child = parent.trace.new_span(name, kind, parent.span_id, end - seconds)
+    if child is not None:
+        child.end = end
+        child.attrs.update(attrs)
+
+
+def annotate(**attrs):
+    """Set attributes on the current span"""
+    current = _current.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def traced_node(name: str, func: Callable) -> Callable:
+    """Wrap a graph node: latency histogram plus a trace span"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with span(name, "node"):
+                return func(*args, **kwargs)
+        finally:
+            graph_node_seconds.observe(time.perf_counter() - started, node=name)
+    return wrapper